@@ -0,0 +1 @@
+"""Benchmarks for the recipe allocator. Run them with `python -m benchmarks --help`"""
@@ -0,0 +1,4 @@
+from benchmarks.allocator import main
+
+if __name__ == "__main__":
+    main()
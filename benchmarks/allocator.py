@@ -0,0 +1,332 @@
+"""Benchmark RecipeAllocator.run, assign_orders and assign_order_group over a grid of
+recipe counts, order volumes and category counts, using data from DataGenerator with fixed
+seeds. Wall time, allocation loop iterations and peak memory are recorded for each case
+and written to json, and can be compared against a stored baseline.
+
+Example:
+    python -m benchmarks --recipes 20 200 --orders 1000 100000 --output results.json
+    python -m benchmarks --output results.json --baseline baseline.json --threshold 1.2
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from gousto_test.allocation_kernel import KERNELS, sort_stock
+from gousto_test.generate_data import DataGenerator
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.utils.logging import get_logger
+
+logger = get_logger()
+
+TARGETS = ["run", "assign_orders", "assign_order_group"]
+ENGINES = ["pandas", "numpy", "bulk", "exact"]
+RECIPE_OPTIONS = [
+    "two_recipes",
+    "three_recipes",
+    "four_recipes",
+    "five_recipes",
+]
+PORTION_OPTIONS = ["two_portions", "four_portions"]
+
+
+def make_case(*, n_recipes, n_orders, n_categories, seed=0):
+    """Generate the recipes and orders for a benchmark case. Every order group gets n_orders
+    orders, and stock is scaled so that the allocation succeeds and the whole loop runs.
+    """
+    recipe_options = RECIPE_OPTIONS[:n_categories]
+    recipe_sum = sum(range(2, n_categories + 2))
+    portion_sum = 2 + 4
+    # Stock needed per vegetarian recipe to cover all of the vegetarian orders
+    stock_needed = (
+        recipe_sum
+        * portion_sum
+        * n_orders
+        / (n_recipes * DataGenerator().vegetarian_recipe_portion)
+    )
+    generator = DataGenerator(
+        max_recipes=n_recipes,
+        min_recipes=n_recipes,
+        max_stock=int(2.5 * stock_needed),
+        min_stock=int(1.5 * stock_needed),
+        max_orders=n_orders,
+        min_orders=n_orders,
+        recipe_options=recipe_options,
+        portion_options=PORTION_OPTIONS,
+        seed=seed,
+    )
+    recipes = generator.generate_recipes()
+    orders = generator.generate_orders()
+    # Use a fixed share of vegetarian recipes, so small menus have enough of them
+    n_vegetarian = max(
+        round(n_recipes * generator.vegetarian_recipe_portion),
+        n_categories + 1,
+    )
+    for i, recipe in enumerate(recipes.values()):
+        recipe["box_type"] = "vegetarian" if i < n_vegetarian else "gourmet"
+    return orders, recipes
+
+
+def measure(setup, func, repeats):
+    """Time func(*setup()) and record its peak memory with tracemalloc. Setup is called
+    before every run and is not included in the timings. Returns the best wall time, the
+    peak memory and the result of the last call.
+    """
+    wall_times = list()
+    for _ in range(repeats):
+        args = setup()
+        start_time = time.perf_counter()
+        result = func(*args)
+        wall_times.append(time.perf_counter() - start_time)
+    # Measure memory separately, as tracemalloc slows everything down
+    args = setup()
+    tracemalloc.start()
+    func(*args)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(wall_times), peak_memory, result
+
+
+def benchmark_case(
+    *, target, engine, n_recipes, n_orders, n_categories, repeats, tmp_dir
+):
+    """Run a single benchmark case and return a dict of results"""
+    orders, recipes = make_case(
+        n_recipes=n_recipes, n_orders=n_orders, n_categories=n_categories
+    )
+    allocator = RecipeAllocator(verbose=False)
+    allocator.set_data(orders=orders, recipes=recipes)
+    if target == "run":
+        orders_dir = os.path.join(tmp_dir, "orders.json")
+        recipes_dir = os.path.join(tmp_dir, "recipes.json")
+        DataGenerator.save_json(orders, orders_dir)
+        DataGenerator.save_json(recipes, recipes_dir)
+
+        def setup():
+            return (RecipeAllocator(verbose=False),)
+
+        def func(allocator):
+            success = allocator.run(
+                orders_dir=orders_dir, recipes_dir=recipes_dir, engine=engine
+            )
+            return success, allocator.iterations
+
+        wall_time, peak_memory, (success, iterations) = measure(
+            setup, func, repeats
+        )
+    elif target == "assign_orders":
+
+        def setup():
+            allocator.iterations = dict()
+            return tuple()
+
+        def func():
+            result = allocator.assign_orders(
+                box_type="gourmet", engine=engine, verbose=False
+            )
+            return result["success"], allocator.iterations
+
+        wall_time, peak_memory, (success, iterations) = measure(
+            setup, func, repeats
+        )
+    else:
+        # Allocate the largest order group against all of the gourmet stock
+        recipe_num, portion_num, num_orders = next(
+            allocator.get_order_groups("gourmet")
+        )
+        df_stock = (
+            pd.DataFrame.from_dict(
+                {
+                    key: value
+                    for (key, value) in recipes.items()
+                    if value["box_type"] == "gourmet"
+                }
+            )
+            .transpose()
+            .astype({"stock_count": np.int64})
+            .sort_values("stock_count", kind="mergesort")
+        )
+        kwargs = dict(
+            num_portions=portion_num,
+            num_recipes=recipe_num,
+            num_orders=num_orders,
+        )
+        if engine == "pandas":
+
+            def setup():
+                return (df_stock.copy(),)
+
+            def func(df):
+                stats = dict()
+                result = RecipeAllocator.assign_order_group(
+                    df_stock=df, verbose=False, stats=stats, **kwargs
+                )
+                return {
+                    "success": result is not False,
+                    "iterations": stats["iterations"],
+                }
+
+        else:
+            allocate = KERNELS[engine]
+
+            def setup():
+                return sort_stock(df_stock["stock_count"].to_numpy())
+
+            def func(stock, index):
+                return allocate(stock, index, **kwargs)
+
+        wall_time, peak_memory, result = measure(setup, func, repeats)
+        success = result["success"]
+        iterations = {"gourmet": result["iterations"]}
+
+    return {
+        "name": f"{target}/{engine}/recipes={n_recipes}/orders={n_orders}/categories={n_categories}",
+        "target": target,
+        "engine": engine,
+        "n_recipes": n_recipes,
+        "n_orders": n_orders,
+        "n_categories": n_categories,
+        "success": bool(success),
+        "wall_time": wall_time,
+        "iterations": sum(iterations.values()),
+        "peak_memory": peak_memory,
+    }
+
+
+def run_benchmarks(
+    *,
+    targets=TARGETS,
+    engines=ENGINES,
+    recipes=(20, 100),
+    orders=(1000, 10000),
+    categories=(3,),
+    repeats=3,
+):
+    """Run every combination of target, engine, recipe count, order volume and category
+    count, and return the results along with some information about the environment
+    """
+    results = list()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for (
+            target,
+            engine,
+            n_recipes,
+            n_orders,
+            n_categories,
+        ) in itertools.product(targets, engines, recipes, orders, categories):
+            result = benchmark_case(
+                target=target,
+                engine=engine,
+                n_recipes=n_recipes,
+                n_orders=n_orders,
+                n_categories=n_categories,
+                repeats=repeats,
+                tmp_dir=tmp_dir,
+            )
+            logger.warning(
+                f"{result['name']}: {result['wall_time']:.4f}s, "
+                f"{result['iterations']} iterations, {result['peak_memory']} bytes"
+            )
+            results.append(result)
+    return {
+        "metadata": {
+            "created": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def compare_to_baseline(results, baseline, threshold=1.25):
+    """Compare results to a baseline, returning a list of the regressions. A case has
+    regressed if its wall time or peak memory is more than threshold times the baseline,
+    or if its success flag or number of iterations has changed.
+    """
+    baseline_results = {
+        result["name"]: result for result in baseline["results"]
+    }
+    regressions = list()
+    for result in results["results"]:
+        old = baseline_results.get(result["name"])
+        if old is None:
+            continue
+        for metric in ["wall_time", "peak_memory"]:
+            if old[metric] and result[metric] / old[metric] > threshold:
+                regressions.append(
+                    f"{result['name']}: {metric} went from {old[metric]} to {result[metric]}"
+                )
+        for metric in ["success", "iterations"]:
+            if result[metric] != old[metric]:
+                regressions.append(
+                    f"{result['name']}: {metric} changed from {old[metric]} to {result[metric]}"
+                )
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the recipe allocator"
+    )
+    parser.add_argument(
+        "--targets", nargs="+", default=TARGETS, choices=TARGETS
+    )
+    parser.add_argument(
+        "--engines", nargs="+", default=ENGINES, choices=ENGINES
+    )
+    parser.add_argument("--recipes", nargs="+", type=int, default=[20, 100])
+    parser.add_argument("--orders", nargs="+", type=int, default=[1000, 10000])
+    parser.add_argument(
+        "--categories",
+        nargs="+",
+        type=int,
+        default=[3],
+        help=f"Number of recipe categories, up to {len(RECIPE_OPTIONS)}",
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="File to write the results to")
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="Fail if a case is this many times slower, or uses this many times more memory",
+    )
+    args = parser.parse_args(args)
+    # Only log the benchmark progress, not every allocation
+    logger.setLevel(logging.WARNING)
+    results = run_benchmarks(
+        targets=args.targets,
+        engines=args.engines,
+        recipes=args.recipes,
+        orders=args.orders,
+        categories=args.categories,
+        repeats=args.repeats,
+    )
+    if args.output:
+        with open(args.output, "w") as f_out:
+            json.dump(results, f_out, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as f_in:
+            baseline = json.load(f_in)
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        for regression in regressions:
+            logger.error(regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""Check that every allocation engine gives the same results as the pandas engine, on many
+random and edge case inputs generated with DataGenerator, and time each engine on them.
+
+Each case is generated from its own seed, as one of these kinds:
+
+    - random: orders and stock from DataGenerator, with small stock so that some fail
+    - ties: only a few distinct stock_count values, so recipes tie when they are sorted
+    - zero_stock: some recipes have no stock at all
+    - threshold: a case that succeeds, with the stock cut to exactly what the pandas engine
+      used, and one recipe one portion short of that in half of the cases
+
+The numpy and bulk engines and run_batch must give the same success flag and the same leftover
+stock as the pandas engine. The exact engine must succeed whenever the pandas engine does, but
+its leftover stock can differ as it can allocate orders differently. A case that does not
+match is shrunk, by removing recipes and lowering order and stock counts for as long as it
+still does not match, to give a minimal reproduction.
+
+Example:
+    python -m benchmarks.differential --cases 1000 --seed 0 --output mismatches.json
+"""
+import argparse
+import copy
+import json
+import logging
+import random
+import time
+
+from gousto_test.generate_data import DataGenerator
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.parallel import scenario_seed
+from gousto_test.utils.logging import get_logger
+
+logger = get_logger()
+
+REFERENCE = "pandas"
+# The engines to check against the reference, and whether their leftover stock must match
+ENGINES = {"numpy": True, "bulk": True, "exact": False, "batch": True}
+KINDS = ["random", "ties", "zero_stock", "threshold"]
+
+
+def run_engine(engine, orders, recipes, box_type_graph=None):
+    """Allocate a case with an engine, or with run_batch for "batch". Returns None if the
+    allocation failed, otherwise the leftover stock as {recipe_id: stock_count}
+    """
+    # Without the feasibility precheck, so that every engine's own failure path is compared
+    allocator = RecipeAllocator(
+        verbose=False, precheck=False, box_type_graph=box_type_graph
+    )
+    if engine == "batch":
+        result = allocator.run_batch([{"orders": orders, "recipes": recipes}])
+        if not result["success"].iloc[0]:
+            return None
+        return {
+            recipe_id: int(stock_count)
+            for (recipe_id, stock_count) in result.iloc[0]
+            .drop("success")
+            .items()
+        }
+    if not allocator.run(
+        orders=copy.deepcopy(orders),
+        recipes=copy.deepcopy(recipes),
+        engine=engine,
+    ):
+        return None
+    return {
+        recipe_id: int(stock_count)
+        for (recipe_id, stock_count) in allocator.excess_stock[
+            "stock_count"
+        ].items()
+    }
+
+
+def compare(engine, expected, leftover):
+    """Return why an engine's result does not match the reference, or None if it does"""
+    if expected is None:
+        # Only the exact engine can succeed when the reference fails
+        if leftover is not None and ENGINES[engine]:
+            return "succeeded when the reference failed"
+        return None
+    if leftover is None:
+        return "failed when the reference succeeded"
+    if ENGINES[engine] and leftover != expected:
+        changed = sorted(
+            recipe_id
+            for recipe_id in expected
+            if leftover.get(recipe_id) != expected[recipe_id]
+        )
+        return f"left different stock for {changed}"
+    return None
+
+
+def make_case(seed, kind):
+    """Generate the orders and recipes of a case of the given kind"""
+    rng = random.Random(seed)
+    generator = DataGenerator(
+        max_recipes=rng.randint(8, 20),
+        min_recipes=6,
+        max_stock=rng.randint(10, 120),
+        min_stock=0,
+        max_orders=rng.randint(1, 4),
+        min_orders=0,
+        rng=rng,
+    )
+    recipes = generator.generate_recipes()
+    orders = generator.generate_orders()
+    # Vegetarian orders can have up to four recipes, so make sure there are enough of them
+    for recipe_id in list(recipes)[: rng.randint(2, 6)]:
+        recipes[recipe_id]["box_type"] = "vegetarian"
+    if kind == "ties":
+        levels = [rng.randint(0, 40) for _ in range(rng.randint(1, 3))]
+        for recipe in recipes.values():
+            recipe["stock_count"] = rng.choice(levels)
+    elif kind == "zero_stock":
+        for recipe in recipes.values():
+            if rng.random() < 0.4:
+                recipe["stock_count"] = 0
+    elif kind == "threshold":
+        # Give the recipes plenty of stock, then only what the reference used of it
+        for recipe in recipes.values():
+            recipe["stock_count"] += 100
+        leftover = run_engine(REFERENCE, orders, recipes)
+        if leftover is not None:
+            for recipe_id, stock_count in leftover.items():
+                recipes[recipe_id]["stock_count"] -= stock_count
+            used = [
+                recipe_id
+                for (recipe_id, recipe) in recipes.items()
+                if recipe["stock_count"] > 0
+            ]
+            if used and rng.random() < 0.5:
+                recipes[rng.choice(used)]["stock_count"] -= 1
+    return orders, recipes
+
+
+def check_case(orders, recipes, engines, timings=None, box_type_graph=None):
+    """Run the reference and the engines on a case. Returns {engine: reason} for the engines
+    that do not match the reference, adding the time each engine took to timings
+    """
+    results = dict()
+    for engine in [REFERENCE] + list(engines):
+        start_time = time.perf_counter()
+        results[engine] = run_engine(engine, orders, recipes, box_type_graph)
+        if timings is not None:
+            timings[engine] = (
+                timings.get(engine, 0) + time.perf_counter() - start_time
+            )
+    mismatches = dict()
+    for engine in engines:
+        reason = compare(engine, results[REFERENCE], results[engine])
+        if reason is not None:
+            mismatches[engine] = reason
+    return mismatches
+
+
+def get_reductions(orders, recipes):
+    """Yield smaller versions of a case: without each recipe, then with each order and stock
+    count set to zero, halved and lowered by one
+    """
+    for recipe_id in recipes:
+        yield orders, {
+            other: recipe
+            for (other, recipe) in recipes.items()
+            if other != recipe_id
+        }
+    for box_type, recipe_categories in orders.items():
+        for recipe_category, portions in recipe_categories.items():
+            for portion_category, count in portions.items():
+                for smaller in sorted({0, count // 2, count - 1}):
+                    if 0 <= smaller < count:
+                        reduced = copy.deepcopy(orders)
+                        reduced[box_type][recipe_category][
+                            portion_category
+                        ] = smaller
+                        yield reduced, recipes
+    for recipe_id, recipe in recipes.items():
+        for smaller in sorted(
+            {0, recipe["stock_count"] // 2, recipe["stock_count"] - 1}
+        ):
+            if 0 <= smaller < recipe["stock_count"]:
+                reduced = copy.deepcopy(recipes)
+                reduced[recipe_id]["stock_count"] = smaller
+                yield orders, reduced
+
+
+def shrink_case(orders, recipes, engine, box_type_graph=None, max_checks=2000):
+    """Shrink a case that an engine does not match the reference on, taking the first smaller
+    version that still does not match until there are none, or max_checks have been run
+    """
+    checks = 0
+    shrunk = True
+    while shrunk and checks < max_checks:
+        shrunk = False
+        for smaller_orders, smaller_recipes in get_reductions(orders, recipes):
+            checks += 1
+            if check_case(
+                smaller_orders,
+                smaller_recipes,
+                [engine],
+                box_type_graph=box_type_graph,
+            ):
+                orders, recipes, shrunk = smaller_orders, smaller_recipes, True
+                break
+            if checks >= max_checks:
+                break
+    return orders, recipes
+
+
+def run_differential(
+    *,
+    n_cases=1000,
+    seed=0,
+    engines=None,
+    kinds=None,
+    shrink=True,
+    box_type_graph=None,
+):
+    """Check the engines against the reference on n_cases cases, cycling through the kinds
+    of case. Returns a dict with the number of cases, the total time each engine took, and a
+    list of mismatches with the (shrunk) case that reproduces each one
+    """
+    engines = list(ENGINES) if engines is None else engines
+    kinds = KINDS if kinds is None else kinds
+    for engine in engines:
+        assert engine in ENGINES, f"engine can only be one of {list(ENGINES)}"
+    timings, mismatches = dict(), list()
+    for case in range(n_cases):
+        case_seed = scenario_seed(seed, case)
+        kind = kinds[case % len(kinds)]
+        orders, recipes = make_case(case_seed, kind)
+        for engine, reason in check_case(
+            orders, recipes, engines, timings, box_type_graph
+        ).items():
+            # Each engine is shrunk from the case as it was generated
+            shrunk_orders, shrunk_recipes = orders, recipes
+            if shrink:
+                shrunk_orders, shrunk_recipes = shrink_case(
+                    orders, recipes, engine, box_type_graph
+                )
+                reason = check_case(
+                    shrunk_orders,
+                    shrunk_recipes,
+                    [engine],
+                    box_type_graph=box_type_graph,
+                ).get(engine, reason)
+            logger.warning(f"{engine} does not match on case {case}: {reason}")
+            mismatches.append(
+                {
+                    "case": case,
+                    "seed": case_seed,
+                    "kind": kind,
+                    "engine": engine,
+                    "reason": reason,
+                    "orders": shrunk_orders,
+                    "recipes": shrunk_recipes,
+                }
+            )
+    return {"n_cases": n_cases, "timings": timings, "mismatches": mismatches}
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Check the allocation engines against the pandas engine"
+    )
+    parser.add_argument("--cases", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES))
+    parser.add_argument("--kinds", nargs="+", choices=KINDS)
+    parser.add_argument(
+        "--no-shrink",
+        action="store_true",
+        help="Report mismatching cases as they were generated",
+    )
+    parser.add_argument("--output", help="json file to write mismatches to")
+    args = parser.parse_args(args)
+    logger.setLevel(logging.WARNING)
+    results = run_differential(
+        n_cases=args.cases,
+        seed=args.seed,
+        engines=args.engines,
+        kinds=args.kinds,
+        shrink=not args.no_shrink,
+    )
+    for engine, wall_time in results["timings"].items():
+        logger.warning(
+            f"{engine}: {wall_time:.3f}s, "
+            f"{1000 * wall_time / results['n_cases']:.2f}ms per case"
+        )
+    logger.warning(
+        f"{len(results['mismatches'])} mismatches in {results['n_cases']} cases"
+    )
+    if args.output:
+        with open(args.output, "w") as f_out:
+            json.dump(results["mismatches"], f_out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
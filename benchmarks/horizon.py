@@ -0,0 +1,145 @@
+"""Measure how long it takes to allocate a horizon of delivery days at many sites with
+horizon.run_horizon, against calling RecipeAllocator.run once for every (site, day) from json
+files, and check that both give the same leftover stock.
+
+Example:
+    python -m benchmarks.horizon --sites 50 --days 14 --recipes 200 --orders 100 --workers 4
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.allocator import make_case
+from gousto_test.horizon import run_horizon
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.utils.logging import get_logger
+
+logger = get_logger()
+
+
+def make_horizon_case(*, n_sites, n_days, n_recipes, n_orders, seed=0):
+    """Return the steps and the stock of each site for a benchmark case. Each site starts with
+    enough stock for every day, and gets n_orders orders in each order group every day.
+    """
+    steps, stock = list(), dict()
+    for site in range(n_sites):
+        _, stock[f"site_{site}"] = make_case(
+            n_recipes=n_recipes,
+            n_orders=n_orders * n_days,
+            n_categories=3,
+            seed=seed + site,
+        )
+        for day in range(n_days):
+            orders, _ = make_case(
+                n_recipes=n_recipes, n_orders=n_orders, n_categories=3
+            )
+            steps.append(
+                {"site": f"site_{site}", "day": day, "orders": orders}
+            )
+    return steps, stock
+
+
+def run_separately(steps, stock, engine):
+    """Allocate every step with its own RecipeAllocator.run from json files, writing the
+    leftover stock out for the next day. Returns {site: leftover stock after the last day}.
+    """
+    stock = {
+        site: json.loads(json.dumps(recipes))
+        for (site, recipes) in stock.items()
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        orders_dir = os.path.join(tmp_dir, "orders.json")
+        recipes_dir = os.path.join(tmp_dir, "recipes.json")
+        for step in sorted(
+            steps, key=lambda step: (step["site"], step["day"])
+        ):
+            recipes = stock[step["site"]]
+            with open(orders_dir, "w") as f_out:
+                json.dump(step["orders"], f_out)
+            with open(recipes_dir, "w") as f_out:
+                json.dump(recipes, f_out)
+            allocator = RecipeAllocator(verbose=False)
+            if allocator.run(
+                orders_dir=orders_dir, recipes_dir=recipes_dir, engine=engine
+            ):
+                for recipe_id, stock_count in allocator.excess_stock[
+                    "stock_count"
+                ].items():
+                    recipes[recipe_id]["stock_count"] = int(stock_count)
+    return stock
+
+
+def run_horizon_benchmark(
+    *,
+    n_sites=50,
+    n_days=14,
+    n_recipes=200,
+    n_orders=100,
+    workers=1,
+    engine="bulk",
+    compare=True,
+):
+    """Return the wall time of run_horizon and, if compare is True, of running every step
+    separately, checking that both leave the same stock at every site
+    """
+    steps, stock = make_horizon_case(
+        n_sites=n_sites, n_days=n_days, n_recipes=n_recipes, n_orders=n_orders
+    )
+    start_time = time.perf_counter()
+    results = run_horizon(steps, stock, engine=engine, workers=workers)
+    timings = {"horizon": time.perf_counter() - start_time}
+    assert all(
+        result["success"].all() for result in results.values()
+    ), "The benchmark case could not be allocated"
+    if compare:
+        start_time = time.perf_counter()
+        expected = run_separately(steps, stock, engine)
+        timings["separate_runs"] = time.perf_counter() - start_time
+        for site, result in results.items():
+            assert np.array_equal(
+                result["leftover"][-1],
+                [
+                    expected[site][recipe_id]["stock_count"]
+                    for recipe_id in result["recipe_ids"]
+                ],
+            ), f"The horizon gave a different result at {site}"
+    return timings
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Measure allocating a horizon of days at many sites"
+    )
+    parser.add_argument("--sites", type=int, default=50)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--recipes", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--engine", default="bulk")
+    parser.add_argument(
+        "--no-compare",
+        action="store_true",
+        help="Do not time running every step separately",
+    )
+    args = parser.parse_args(args)
+    logger.setLevel(logging.WARNING)
+    timings = run_horizon_benchmark(
+        n_sites=args.sites,
+        n_days=args.days,
+        n_recipes=args.recipes,
+        n_orders=args.orders,
+        workers=args.workers,
+        engine=args.engine,
+        compare=not args.no_compare,
+    )
+    for name, wall_time in timings.items():
+        logger.warning(f"{name}: {wall_time:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
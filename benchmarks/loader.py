@@ -0,0 +1,111 @@
+"""Compare the peak memory of loading a large recipes file with json.load against streaming
+it with gousto_test.streaming. Each loader runs in a fresh child process and reports its
+peak resident set size (RSS), so the numbers are not affected by earlier runs.
+
+Example:
+    python -m benchmarks.loader --recipes 1000000
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+
+from gousto_test.generate_data import DataGenerator
+from gousto_test.utils.logging import get_logger
+
+logger = get_logger()
+
+LOADERS = ["none", "json", "stream"]
+
+# Run in the child process. "none" only imports the modules, to show the baseline RSS.
+# "json" follows the path used by the pandas engine: json.load, then a dict and a DataFrame
+# for each box_type.
+CHILD_SCRIPT = """
+import json
+import resource
+import sys
+
+import pandas as pd
+
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.streaming import load_recipe_arrays
+
+loader, recipes_dir = sys.argv[1], sys.argv[2]
+n_recipes = 0
+if loader == "json":
+    recipes = RecipeAllocator.load_json(recipes_dir)
+    frames = list()
+    for box_type in ["vegetarian", "gourmet"]:
+        box_recipes = {
+            key: value
+            for (key, value) in recipes.items()
+            if value.get("box_type") == box_type
+        }
+        frames.append(pd.DataFrame.from_dict(box_recipes).transpose())
+    n_recipes = sum(len(df) for df in frames)
+elif loader == "stream":
+    recipe_arrays = load_recipe_arrays(recipes_dir)
+    n_recipes = sum(len(arrays["stock"]) for arrays in recipe_arrays.values())
+try:
+    # ru_maxrss is carried over from the parent process on Linux, so use VmHWM instead
+    with open("/proc/self/status") as f_in:
+        peak_rss = next(
+            int(line.split()[1]) * 1024 for line in f_in if line.startswith("VmHWM")
+        )
+except (OSError, StopIteration):
+    # ru_maxrss is in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"loader": loader, "n_recipes": n_recipes, "peak_rss": peak_rss}))
+"""
+
+
+def measure_loader(loader, recipes_dir):
+    """Load recipes_dir with a loader in a child process and return its peak RSS in bytes"""
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT, loader, recipes_dir],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_loader_benchmark(*, n_recipes=1000000, loaders=LOADERS, seed=0):
+    """Generate a recipes file with n_recipes and measure the peak RSS of each loader"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        recipes_dir = os.path.join(tmp_dir, "recipes.json")
+        DataGenerator(seed=seed).generate_recipes_bulk(
+            n_recipes=n_recipes, save_dir=recipes_dir
+        )
+        file_size = os.path.getsize(recipes_dir)
+        results = [measure_loader(loader, recipes_dir) for loader in loaders]
+    for result in results:
+        result["file_size"] = file_size
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Compare the peak memory of the recipe loaders"
+    )
+    parser.add_argument("--recipes", type=int, default=1000000)
+    parser.add_argument(
+        "--loaders", nargs="+", default=LOADERS, choices=LOADERS
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(args)
+    logger.setLevel(logging.WARNING)
+    for result in run_loader_benchmark(
+        n_recipes=args.recipes, loaders=args.loaders, seed=args.seed
+    ):
+        logger.warning(
+            f"{result['loader']}: {result['n_recipes']} recipes, file size "
+            f"{result['file_size']} bytes, peak RSS {result['peak_rss']} bytes"
+        )
+
+
+if __name__ == "__main__":
+    main()
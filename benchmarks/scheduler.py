@@ -0,0 +1,122 @@
+"""Measure how long RecipeAllocator.run takes with many box_types, allocated one at a time or
+in a thread pool. Box_types come in pairs where the second can use the leftover stock of the
+first, like vegetarian and gourmet, so every pair can be allocated at the same time.
+
+Example:
+    python -m benchmarks.scheduler --box-types 24 --recipes 2000 --orders 5000 --workers 1 4
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from benchmarks.allocator import PORTION_OPTIONS, RECIPE_OPTIONS
+from gousto_test.allocation_kernel import KERNELS
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.utils.logging import get_logger
+
+logger = get_logger()
+
+
+def make_graph_case(*, n_box_types, n_recipes, n_orders, seed=0):
+    """Return the box_type graph, orders and recipes for a benchmark case. Each box_type gets
+    n_recipes recipes and n_orders orders in each order group, with enough stock to succeed.
+    """
+    rng = np.random.default_rng(seed)
+    box_types = [f"box_{i}" for i in range(n_box_types)]
+    graph = {
+        box_type: [box_types[i - 1]] if i % 2 else []
+        for (i, box_type) in enumerate(box_types)
+    }
+    recipe_options = RECIPE_OPTIONS[:3]
+    orders = {
+        box_type: {
+            recipe_option: {
+                portion_option: n_orders for portion_option in PORTION_OPTIONS
+            }
+            for recipe_option in recipe_options
+        }
+        for box_type in box_types
+    }
+    # Stock needed per recipe to cover all of the orders of its box_type
+    stock_needed = (2 + 3 + 4) * (2 + 4) * n_orders / n_recipes
+    recipes = {
+        f"recipe_{box_type}_{i}": {
+            "stock_count": int(stock),
+            "box_type": box_type,
+        }
+        for box_type in box_types
+        for (i, stock) in enumerate(
+            rng.integers(
+                int(1.5 * stock_needed), int(2.5 * stock_needed), n_recipes
+            )
+        )
+    }
+    return graph, orders, recipes
+
+
+def run_scheduler_benchmark(
+    *,
+    n_box_types=24,
+    n_recipes=200,
+    n_orders=1000,
+    workers=(1, 4),
+    engine="bulk",
+    repeats=3,
+):
+    """Return the best wall time of run for each number of workers, and check that they all
+    give the same leftover stock
+    """
+    graph, orders, recipes = make_graph_case(
+        n_box_types=n_box_types, n_recipes=n_recipes, n_orders=n_orders
+    )
+    results = dict()
+    leftover = None
+    for n_workers in workers:
+        allocator = RecipeAllocator(
+            verbose=False, box_type_graph=graph, workers=n_workers
+        )
+        wall_times = list()
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            success = allocator.run(
+                orders=orders, recipes=recipes, engine=engine
+            )
+            wall_times.append(time.perf_counter() - start_time)
+            assert success, "The benchmark case could not be allocated"
+        if leftover is None:
+            leftover = allocator.excess_stock
+        assert allocator.excess_stock.equals(
+            leftover
+        ), f"{n_workers} workers gave a different result"
+        results[n_workers] = min(wall_times)
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Measure allocating many box_types with the scheduler"
+    )
+    parser.add_argument("--box-types", type=int, default=24)
+    parser.add_argument("--recipes", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--engine", default="bulk", choices=list(KERNELS))
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(args)
+    logger.setLevel(logging.WARNING)
+    results = run_scheduler_benchmark(
+        n_box_types=args.box_types,
+        n_recipes=args.recipes,
+        n_orders=args.orders,
+        workers=args.workers,
+        engine=args.engine,
+        repeats=args.repeats,
+    )
+    for n_workers, wall_time in results.items():
+        logger.warning(f"{n_workers} workers: {wall_time:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
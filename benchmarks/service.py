@@ -0,0 +1,113 @@
+"""Measure the latency of the allocation service over loopback. A service is started in this
+process with a benchmark case from benchmarks.allocator, and each endpoint is queried many
+times over a single keep-alive connection.
+
+Example:
+    python -m benchmarks.service --recipes 1000 --orders 1000 --requests 1000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+import numpy as np
+
+from benchmarks.allocator import make_case
+from gousto_test.service import AllocationService
+from gousto_test.utils.logging import get_logger
+
+logger = get_logger()
+
+
+async def timed_requests(port, method, path, bodies):
+    """Send one request per body over a keep-alive connection, returning the latencies"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    latencies = list()
+    for body in bodies:
+        content = json.dumps(body).encode() if body is not None else b""
+        start_time = time.perf_counter()
+        writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+            f"Content-Length: {len(content)}\r\n\r\n".encode() + content
+        )
+        await writer.drain()
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line == b"\r\n":
+                break
+            if line.lower().startswith(b"content-length"):
+                length = int(line.split(b":")[1])
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start_time)
+    writer.close()
+    return np.array(latencies)
+
+
+async def run_service_benchmark(
+    *, n_recipes=1000, n_orders=1000, n_requests=1000, engine="bulk"
+):
+    """Return the p50 and p99 latency in milliseconds of each endpoint"""
+    orders, recipes = make_case(
+        n_recipes=n_recipes, n_orders=n_orders, n_categories=3
+    )
+    service = AllocationService(engine=engine)
+    await service.load({"orders": orders, "recipes": recipes})
+    server = await service.start("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    # Alternate small changes to the last gourmet group, so the orders end up unchanged
+    update_bodies = [
+        {
+            "order_deltas": {
+                "gourmet": {"two_recipes": {"two_portions": 1 - 2 * (i % 2)}}
+            }
+        }
+        for i in range(n_requests)
+    ]
+    cases = [
+        ("GET", "/feasibility", [None] * n_requests),
+        ("GET", "/leftover", [None] * n_requests),
+        ("POST", "/update", update_bodies),
+    ]
+    results = dict()
+    try:
+        for method, path, bodies in cases:
+            latencies = await timed_requests(port, method, path, bodies)
+            results[f"{method} {path}"] = {
+                "p50_ms": float(np.percentile(latencies, 50) * 1000),
+                "p99_ms": float(np.percentile(latencies, 99) * 1000),
+            }
+    finally:
+        server.close()
+        await server.wait_closed()
+        service.close()
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Measure the latency of the allocation service"
+    )
+    parser.add_argument("--recipes", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--engine", default="bulk", choices=["numpy", "bulk"])
+    args = parser.parse_args(args)
+    logger.setLevel(logging.WARNING)
+    results = asyncio.run(
+        run_service_benchmark(
+            n_recipes=args.recipes,
+            n_orders=args.orders,
+            n_requests=args.requests,
+            engine=args.engine,
+        )
+    )
+    for name, result in results.items():
+        logger.warning(
+            f"{name}: p50 {result['p50_ms']:.3f}ms, p99 {result['p99_ms']:.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+"""NumPy implementation of the order group allocation loop used by RecipeAllocator.
+
+Stock is held in a contiguous int64 array sorted in ascending order, along with a
+parallel array of row indexes that point back at the recipe each stock value belongs
+to. Instead of re-sorting everything after each fulfilment step, only the recipes
+that had stock removed are re-inserted into the sorted array.
+"""
+import numpy as np
+
+from gousto_test.utils.metrics import NULL_PHASE
+
+
+def sort_stock(stock, index=None):
+    """Sort a stock array in ascending order, keeping the index array aligned with it.
+    A stable sort is used so that recipes with the same stock keep their original order.
+    """
+    stock = np.asarray(stock, dtype=np.int64)
+    if index is None:
+        index = np.arange(len(stock), dtype=np.int64)
+    order = np.argsort(stock, kind="stable")
+    return stock[order], np.asarray(index)[order]
+
+
+def reposition(stock, index, changed, amount):
+    """Remove `amount` from the stock of the recipes at the `changed` positions and
+    re-insert them into the sorted array. `amount` is either a single number or an
+    array aligned with `changed`. The result is identical to a stable sort
+    of the decremented array, but only the changed recipes are moved.
+    """
+    keep = np.ones(len(stock), dtype=bool)
+    keep[changed] = False
+    kept_stock = stock[keep]
+    kept_positions = np.flatnonzero(keep)
+    # Order the changed recipes by their new stock, then by their current position
+    new_stock = stock[changed] - amount
+    order = np.lexsort((changed, new_stock))
+    new_stock = new_stock[order]
+    moved = changed[order]
+    # Recipes with the same stock must stay in the order they were already in,
+    # so a moved recipe goes after any equal recipe that sat in front of it
+    lower = np.searchsorted(kept_stock, new_stock, side="left")
+    upper = np.searchsorted(kept_stock, new_stock, side="right")
+    ranks = np.clip(np.searchsorted(kept_positions, moved), lower, upper)
+    return (
+        np.insert(kept_stock, ranks, new_stock),
+        np.insert(index[keep], ranks, index[moved]),
+    )
+
+
+def restock(stock, index, rows, change):
+    """Add `change` to the stock of the recipes with the given `rows` (values in `index`).
+    `stock` must be sorted in ascending order with ties in order of `index`, as sort_stock
+    returns it, and the result is identical to calling sort_stock on the changed stock.
+    Only the changed recipes are searched for and moved, all of them with a single np.insert,
+    but the arrays are never changed in place, so every call makes new ones and takes time
+    linear in their length. Pass every change in one call rather than one call for each.
+    """
+    rows = np.asarray(rows)
+    changed = np.flatnonzero(np.isin(index, rows))
+    keep = np.ones(len(stock), dtype=bool)
+    keep[changed] = False
+    kept_stock, kept_index = stock[keep], index[keep]
+    new_change = dict(zip(rows.tolist(), np.asarray(change).tolist()))
+    moved = index[changed]
+    new_stock = stock[changed] + np.array(
+        [new_change[row] for row in moved.tolist()], dtype=np.int64
+    )
+    order = np.lexsort((moved, new_stock))
+    new_stock, moved = new_stock[order], moved[order]
+    # Recipes with the same stock are kept in order of their index
+    lower = np.searchsorted(kept_stock, new_stock, side="left")
+    upper = np.searchsorted(kept_stock, new_stock, side="right")
+    ranks = [
+        low + int(np.searchsorted(kept_index[low:high], row))
+        for (low, high, row) in zip(lower, upper, moved)
+    ]
+    return (
+        np.insert(kept_stock, ranks, new_stock),
+        np.insert(kept_index, ranks, moved),
+    )
+
+
+def allocate_group(
+    stock,
+    index,
+    *,
+    num_portions,
+    num_recipes,
+    num_orders,
+    metrics=None,
+    record=None,
+):
+    """Fulfil the orders for a single customer group. This follows the same steps as
+    RecipeAllocator.assign_order_group: the lowest stock recipe that can fulfil at least
+    one order is paired with the (num_recipes - 1) highest stock recipes, until all of
+    the orders have been fulfilled or there are not enough recipes left with stock.
+
+    `stock` must be sorted in ascending order, with `index` aligned to it. If metrics are
+    supplied, the time spent re-sorting is recorded as the "sort" phase. If record is
+    supplied, it is called with (orders, rows) for each fulfilment step, where rows are the
+    values in `index` of the recipes given to those orders.
+    """
+    n_recipes = len(stock)
+    tail = np.arange(max(n_recipes - num_recipes + 1, 0), n_recipes)
+    sort_phase = metrics.phase("sort") if metrics is not None else NULL_PHASE
+    iterations = recipes_touched = 0
+    while num_orders != 0:
+        # Recipes are sorted, so everything from here onwards has enough stock for an order
+        first = int(np.searchsorted(stock, num_portions, side="left"))
+        if n_recipes - first < num_recipes:
+            return {
+                "success": False,
+                "iterations": iterations,
+                "recipes_touched": recipes_touched,
+            }
+        # Fulfil as many orders as we can with the lowest stock recipe, and the same
+        # number of orders with the largest recipes
+        fulfillable_orders = min(int(stock[first]) // num_portions, num_orders)
+        if record is not None:
+            record(fulfillable_orders, index[np.append(first, tail)])
+        with sort_phase:
+            stock, index = reposition(
+                stock,
+                index,
+                np.append(first, tail),
+                fulfillable_orders * num_portions,
+            )
+        num_orders = num_orders - fulfillable_orders
+        iterations += 1
+        recipes_touched += len(tail) + 1
+    return {
+        "success": True,
+        "stock": stock,
+        "index": index,
+        "iterations": iterations,
+        "recipes_touched": recipes_touched,
+    }
+
+
+def allocate_group_bulk(
+    stock,
+    index,
+    *,
+    num_portions,
+    num_recipes,
+    num_orders,
+    metrics=None,
+    record=None,
+):
+    """Bulk version of allocate_group that gives the same result in fewer steps.
+
+    While the (num_recipes - 1) highest stock recipes stay the highest, every pass of
+    allocate_group drains the next lowest recipe completely and takes the same number of
+    orders from those top recipes. Using the cumulative number of orders the low recipes
+    can fulfil, we work out how many passes happen before the top recipes drop below the
+    next highest recipe (or the orders run out), and apply all of them in one step.
+    This means the number of iterations is bounded by the number of recipes. If record is
+    supplied, it is called once for each of the passes that allocate_group would make.
+    """
+    n_recipes = len(stock)
+    tail_start = max(n_recipes - num_recipes + 1, 0)
+    tail = np.arange(tail_start, n_recipes)
+    sort_phase = metrics.phase("sort") if metrics is not None else NULL_PHASE
+    iterations = recipes_touched = 0
+    while num_orders != 0:
+        first = int(np.searchsorted(stock, num_portions, side="left"))
+        if n_recipes - first < num_recipes:
+            return {
+                "success": False,
+                "iterations": iterations,
+                "recipes_touched": recipes_touched,
+            }
+        # Orders fulfilled after fully draining each of the low recipes in turn
+        fulfillable_orders = stock[first:tail_start] // num_portions
+        cumulative_orders = np.cumsum(fulfillable_orders)
+        # The top recipes must stay above the highest low recipe for the pairing to hold.
+        # The pass that takes them below it still happens, but is the last in this step.
+        passes = len(cumulative_orders)
+        if len(tail):
+            top_stock = (
+                stock[tail_start] - cumulative_orders[:-1] * num_portions
+            )
+            dropped = np.flatnonzero(top_stock < stock[tail_start - 1])
+            if len(dropped):
+                passes = int(dropped[0]) + 1
+        # Only fully drain recipes while there are orders left to fulfil
+        passes = min(
+            passes,
+            int(np.searchsorted(cumulative_orders, num_orders, side="right")),
+        )
+        if passes == 0:
+            # The lowest recipe can fulfil all of the remaining orders
+            changed = np.append(first, tail)
+            amount = num_orders * num_portions
+            if record is not None:
+                record(num_orders, index[changed])
+            num_orders = 0
+        else:
+            taken_orders = int(cumulative_orders[passes - 1])
+            changed = np.append(np.arange(first, first + passes), tail)
+            amount = np.append(
+                fulfillable_orders[:passes] * num_portions,
+                np.full(len(tail), taken_orders * num_portions),
+            )
+            if record is not None:
+                for j in range(passes):
+                    record(
+                        int(fulfillable_orders[j]),
+                        index[np.append(first + j, tail)],
+                    )
+            num_orders = num_orders - taken_orders
+        with sort_phase:
+            stock, index = reposition(stock, index, changed, amount)
+        iterations += 1
+        recipes_touched += len(changed)
+    return {
+        "success": True,
+        "stock": stock,
+        "index": index,
+        "iterations": iterations,
+        "recipes_touched": recipes_touched,
+    }
+
+
+def allocate_group_exact(
+    stock,
+    index,
+    *,
+    num_portions,
+    num_recipes,
+    num_orders,
+    metrics=None,
+    record=None,
+):
+    """Fulfil the orders for a single customer group whenever it is possible to, unlike
+    allocate_group, which can fail when a valid allocation exists.
+
+    A recipe can go into at most min(stock // num_portions, num_orders) of the orders, and
+    the orders can be given num_recipes different recipes each if and only if these add up
+    to at least num_recipes * num_orders. The orders are then taken from the recipes with the
+    most stock, water-filling them down to the same level, which leaves the leftover stock as
+    even as possible for the groups after this one. When the groups are allocated from the
+    most portions to the fewest, and the portion sizes divide each other (e.g. 2 and 4), this
+    finds an allocation for every set of groups that has one. This only holds within one pool
+    of stock: spreading out stock that a later box_type shares can leave it unable to fill its
+    orders, which is why RecipeAllocator.allocate falls back on the greedy allocation.
+
+    Takes and returns the same arrays as allocate_group. If record is supplied, the orders are
+    given their recipes in turn, wrapping around the orders, and it is called with (orders,
+    rows) for each run of orders that got the same recipes.
+    """
+    n_recipes = len(stock)
+    sort_phase = metrics.phase("sort") if metrics is not None else NULL_PHASE
+    if num_orders == 0:
+        return {
+            "success": True,
+            "stock": stock,
+            "index": index,
+            "iterations": 0,
+            "recipes_touched": 0,
+        }
+    needed = num_recipes * num_orders
+    # The most orders each recipe can go into
+    capacity = np.minimum(stock // num_portions, num_orders)
+    if capacity.sum() < needed:
+        return {"success": False, "iterations": 1, "recipes_touched": 0}
+
+    def orders_above(level):
+        """The orders each recipe goes into when its stock is taken down to level"""
+        return np.minimum(
+            capacity, np.maximum(0, -((level - stock) // num_portions))
+        )
+
+    # Find the highest level where the recipes can fulfil all of the orders
+    low, high = -1, int(stock[-1]) if n_recipes else 0
+    while low < high:
+        middle = (low + high + 1) // 2
+        if orders_above(middle).sum() >= needed:
+            low = middle
+        else:
+            high = middle - 1
+    taken = orders_above(low + 1)
+    # One more order from some of the recipes that reach the level, highest stock first
+    extra = np.flatnonzero(orders_above(low) > taken)
+    order = np.lexsort((extra, -(stock[extra] - taken[extra] * num_portions)))
+    taken[extra[order[: needed - taken.sum()]]] += 1
+    if record is not None:
+        record_wrapped(record, index, taken, num_orders, num_recipes)
+    with sort_phase:
+        stock, index = sort_stock(stock - taken * num_portions, index)
+    return {
+        "success": True,
+        "stock": stock,
+        "index": index,
+        "iterations": 1,
+        "recipes_touched": int(np.count_nonzero(taken)),
+    }
+
+
+def record_wrapped(record, index, taken, num_orders, num_recipes):
+    """Give each recipe to taken[i] orders, filling the orders' recipe slots in turn and
+    wrapping around, so no order gets the same recipe twice as taken[i] <= num_orders
+    """
+    used = np.flatnonzero(taken)
+    # The first slot of each recipe, where slot s is recipe s // num_orders of order s % num_orders
+    starts = np.concatenate([[0], np.cumsum(taken[used])[:-1]])
+    # The recipes an order gets only change at orders where a recipe starts
+    breaks = np.unique(np.append(starts % num_orders, [0, num_orders]))
+    for first, last in zip(breaks[:-1], breaks[1:]):
+        slots = first + np.arange(num_recipes) * num_orders
+        recipes = used[np.searchsorted(starts, slots, side="right") - 1]
+        record(int(last - first), index[recipes])
+
+
+# The allocation loop used by each of RecipeAllocator's numpy engines
+KERNELS = {
+    "numpy": allocate_group,
+    "bulk": allocate_group_bulk,
+    "exact": allocate_group_exact,
+}
+
+
+def allocate_group_batch(
+    stock, index, *, num_portions, num_recipes, num_orders
+):
+    """Fulfil the orders for a single customer group in many scenarios at once.
+
+    `stock` and `index` are 2D arrays with one row per scenario, each row sorted in
+    ascending order, and `num_orders` holds the orders to fulfil in each scenario.
+    Every pass performs one step of allocate_group on all of the scenarios that still
+    have orders left, so each row ends up exactly as allocate_group would leave it.
+    Returns the updated arrays and a boolean array of which scenarios succeeded.
+    """
+    stock = np.array(stock, dtype=np.int64)
+    index = np.array(index)
+    n_scenarios, n_recipes = stock.shape
+    num_orders = np.array(num_orders, dtype=np.int64).reshape(n_scenarios)
+    success = np.ones(n_scenarios, dtype=bool)
+    tail = np.arange(max(n_recipes - num_recipes + 1, 0), n_recipes)
+    iterations = 0
+    while True:
+        active = np.flatnonzero(num_orders != 0)
+        if len(active) == 0:
+            break
+        # Rows are sorted, so the number of recipes without enough stock for an
+        # order is the position of the lowest recipe that has enough
+        first = (stock[active] < num_portions).sum(axis=1)
+        failed = n_recipes - first < num_recipes
+        success[active[failed]] = False
+        num_orders[active[failed]] = 0
+        active, first = active[~failed], first[~failed]
+        if len(active) == 0:
+            break
+        fulfillable_orders = np.minimum(
+            stock[active, first] // num_portions, num_orders[active]
+        )
+        taken = fulfillable_orders * num_portions
+        stock[active, first] -= taken
+        stock[active[:, None], tail] -= taken[:, None]
+        num_orders[active] -= fulfillable_orders
+        # Re-sort the rows that changed, in place when they all did
+        if len(active) == n_scenarios:
+            order = np.argsort(stock, axis=1, kind="stable")
+            stock.sort(axis=1, kind="stable")
+            index = np.take_along_axis(index, order, axis=1)
+        else:
+            order = np.argsort(stock[active], axis=1, kind="stable")
+            stock[active] = np.take_along_axis(stock[active], order, axis=1)
+            index[active] = np.take_along_axis(index[active], order, axis=1)
+        iterations += 1
+    return {
+        "success": success,
+        "stock": stock,
+        "index": index,
+        "iterations": iterations,
+    }
@@ -0,0 +1,172 @@
+"""Cache allocation results, so that scenarios that have been seen before are not allocated
+again.
+
+The allocation only depends on the engine, the orders, the box_type graph and the sorted stock
+values of each box_type, so the cache key is a hash of exactly those. Scenarios with the same
+stock under different recipe ids, or with the recipes or categories in a different order,
+share the same key.
+Results are stored against the position of each recipe in its box_type's stable sort, so
+they can be mapped back to the recipe ids of whoever asks next.
+
+Results are kept in an in-memory LRU, with an optional time to live, and can also be kept in
+a sqlite file that is shared between processes and survives restarts.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from gousto_test.ledger import StockLedger
+
+
+def sorted_stock(allocator):
+    """Return {box_type: (recipe_ids, stock)} with the recipes of each box_type in the order
+    the allocator sorts them, i.e. by stock, with ties kept in their original order
+    """
+    result = dict()
+    for box_type in allocator.allocation_order:
+        recipe_ids, stock = allocator.get_stock_arrays(box_type)
+        order = np.argsort(stock, kind="stable")
+        result[box_type] = (recipe_ids[order], stock[order])
+    return result
+
+
+def canonical_key(orders, stock, graph=None, engine=None):
+    """Return a hash of the orders, the sorted stock of each box_type, the box_type graph and
+    the engine, which ignores recipe ids and the order of the recipes and order categories
+    """
+    canonical = {
+        "engine": engine,
+        "orders": orders,
+        "stock": {
+            box_type: box_stock.tolist()
+            for (box_type, (_, box_stock)) in stock.items()
+        },
+        "graph": graph,
+    }
+    return hashlib.sha256(
+        json.dumps(canonical, sort_keys=True, default=int).encode()
+    ).hexdigest()
+
+
+def to_slots(leftover, stock):
+    """Turn a leftover stock StockLedger into (box_type, rank, stock_count) slots, where rank
+    is the position of the recipe in its box_type's sorted stock
+    """
+    recipe_ids, stock_counts = leftover.entry_recipe_ids(), leftover.stock
+    ranks = {
+        recipe_id: (box_type, rank)
+        for box_type in stock
+        for rank, recipe_id in enumerate(stock[box_type][0].tolist())
+    }
+    return [
+        [*ranks[recipe_id], int(stock_count)]
+        for (recipe_id, stock_count) in zip(
+            recipe_ids.tolist(), stock_counts.tolist()
+        )
+    ]
+
+
+def from_slots(slots, stock):
+    """Turn slots back into a leftover stock StockLedger, using the recipe ids in stock"""
+    return StockLedger.from_arrays(
+        np.array(
+            [stock[box_type][0][rank] for (box_type, rank, _) in slots],
+            dtype=object,
+        ),
+        np.array(
+            [stock_count for (_, _, stock_count) in slots], dtype=np.int64
+        ),
+        np.array([box_type for (box_type, _, _) in slots], dtype=object),
+    )
+
+
+class ResultCache:
+    """An LRU cache of allocation results, with an optional sqlite tier.
+
+    max_size is the number of results kept in memory, and ttl is the number of seconds a
+    result is kept for (None keeps them until they are evicted). If path is given, results
+    are also written to a sqlite database at that path, and read from it when they are not
+    in memory.
+    """
+
+    def __init__(self, max_size=1024, ttl=None, path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.connection = None
+        if path is not None:
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(key TEXT PRIMARY KEY, value TEXT, created REAL)"
+            )
+            self.connection.commit()
+
+    def expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        entry = self.entries.get(key)
+        if entry is not None and self.expired(entry[1]):
+            del self.entries[key]
+            entry = None
+        if entry is None and self.connection is not None:
+            row = self.connection.execute(
+                "SELECT value, created FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and not self.expired(row[1]):
+                entry = (json.loads(row[0]), row[1])
+                self.store(key, entry)
+                self.disk_hits += 1
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def store(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def put(self, key, value):
+        """Cache a json-serialisable value"""
+        created = time.time()
+        self.store(key, (value, created))
+        if self.connection is not None:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                (key, json.dumps(value), created),
+            )
+            self.connection.commit()
+
+    def clear(self):
+        """Remove every result, including those on disk"""
+        self.entries.clear()
+        if self.connection is not None:
+            self.connection.execute("DELETE FROM results")
+            self.connection.commit()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "size": len(self.entries),
+        }
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,111 @@
+"""Parse order category names such as "two_recipes" and "four_portions" into numbers.
+
+Categories are parsed once into an immutable CategorySchema, which is cached for the whole
+process and keyed on the category names, so repeated loads of data with the same categories
+do no parsing at all. word2number is only imported the first time a name has to be parsed.
+"""
+import functools
+from typing import NamedTuple, Tuple
+
+
+class CategorySchema(NamedTuple):
+    """The recipe and portion categories of an orders object and their numbers.
+
+    recipe_categories and portion_categories are (name, number) pairs in the order the names
+    appear in the orders. order_groups holds (recipe_num, portion_num, recipe_category,
+    portion_category) for each customer group, in the order they should be allocated.
+    """
+
+    recipe_categories: Tuple[Tuple[str, int], ...]
+    portion_categories: Tuple[Tuple[str, int], ...]
+    order_groups: Tuple[Tuple[int, int, str, str], ...]
+
+    @classmethod
+    def from_numbers(cls, recipe_categories, portion_categories):
+        """Create a schema from (name, number) pairs, or dicts of {name: number}"""
+        recipe_categories = tuple(dict(recipe_categories).items())
+        portion_categories = tuple(dict(portion_categories).items())
+        return cls(
+            recipe_categories=recipe_categories,
+            portion_categories=portion_categories,
+            order_groups=tuple(
+                (recipe_num, portion_num, recipe_category, portion_category)
+                for (recipe_num, recipe_category) in sorted_lookup(
+                    recipe_categories
+                )
+                for (portion_num, portion_category) in sorted_lookup(
+                    portion_categories
+                )
+            ),
+        )
+
+    @property
+    def portion_order_groups(self):
+        """The order groups with the most portions first, then the most recipes"""
+        return tuple(sorted(self.order_groups, key=lambda group: -group[1]))
+
+    @property
+    def recipe_categories_dict(self):
+        return dict(self.recipe_categories)
+
+    @property
+    def portion_categories_dict(self):
+        return dict(self.portion_categories)
+
+
+def sorted_lookup(categories):
+    """Return (number, name) pairs from largest to smallest number. If two names have the same
+    number, the first one is used for both, as the allocator has always done.
+    """
+    names = dict()
+    for name, number in categories:
+        names.setdefault(number, name)
+    return tuple(
+        (number, names[number])
+        for number in sorted(
+            (number for (_, number) in categories), reverse=True
+        )
+    )
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_category_number(category, kind="recipes"):
+    """Return the number at the start of a category name, e.g. 2 for "two_recipes" """
+    from word2number import w2n
+
+    try:
+        return w2n.word_to_num(category.split("_")[0])
+    except ValueError as e:
+        raise Exception(
+            f"Couldnt extract the number of {kind} from the category. "
+            f"The logic of this algorithm assumes that category names are "
+            f"seperated by _ and the first word is the number. E.g. 'two_{kind}. "
+            f"original error message: {e}"
+        )
+
+
+@functools.lru_cache(maxsize=128)
+def get_category_schema(recipe_categories, portion_categories):
+    """Return the CategorySchema for tuples of recipe and portion category names"""
+    return CategorySchema.from_numbers(
+        [
+            (category, parse_category_number(category, "recipes"))
+            for category in recipe_categories
+        ],
+        [
+            (category, parse_category_number(category, "portions"))
+            for category in portion_categories
+        ],
+    )
+
+
+def get_orders_schema(orders):
+    """Return the CategorySchema for an orders object.
+
+    DISCLAIMER: This assumes that all orders have the same number of recipe options
+    and that all recipes come in the same portion sizes.
+    """
+    box_type_orders = next(iter(orders.values()))
+    recipe_categories = tuple(box_type_orders.keys())
+    portion_categories = tuple(box_type_orders[recipe_categories[1]].keys())
+    return get_category_schema(recipe_categories, portion_categories)
@@ -0,0 +1,255 @@
+"""Read allocation inputs from, and write results to, columnar csv and npz files.
+
+Recipes have one row per recipe with the columns recipe_id, stock_count and box_type, and
+orders have one row per order group with the columns box_type, recipe_category,
+portion_category and orders. These are the columns DataGenerator.save writes, so generated
+data can be loaded straight back in. The leftover stock is written in the same format as the
+recipes, so it can be used as the stock of the next run, and the per-group summary has a row
+for every order group with its orders, the portions they need and whether it was fulfilled.
+
+Recipe csv files are read chunk_size rows at a time into stock arrays for each box_type (see
+streaming.load_recipe_arrays), so only the arrays and one chunk of rows are ever in memory.
+The stock of an npz file is used without copying when the recipes of a box_type are stored
+together, e.g. in a leftover stock file. Results are written chunk_size rows at a time.
+
+Example:
+    allocator.run(orders_dir="orders.csv", recipes_dir="recipes.npz", engine="bulk",
+                  leftover_dir="leftover.csv", summary_dir="summary.csv")
+"""
+import csv
+import itertools
+
+import numpy as np
+
+RECIPE_COLUMNS = ["recipe_id", "stock_count", "box_type"]
+ORDER_COLUMNS = ["box_type", "recipe_category", "portion_category", "orders"]
+SUMMARY_COLUMNS = [
+    "box_type",
+    "recipe_category",
+    "portion_category",
+    "recipe_num",
+    "portion_num",
+    "orders",
+    "portions",
+    "iterations",
+    "fulfilled",
+]
+FORMATS = (".csv", ".npz")
+CHUNK_SIZE = 1 << 16
+
+
+def is_columnar(file_path):
+    """Whether a file is in one of the columnar formats, judging by its extension"""
+    return str(file_path).endswith(FORMATS)
+
+
+def get_format(file_path):
+    """Return the format of a columnar file, either csv or npz"""
+    assert is_columnar(
+        file_path
+    ), f"Columnar files must end in one of {FORMATS}: {file_path}"
+    return "csv" if str(file_path).endswith(".csv") else "npz"
+
+
+def iter_csv_chunks(file_path, columns, chunk_size=CHUNK_SIZE):
+    """Yield the rows of a csv file as a list of columns, chunk_size rows at a time. The file
+    must have a header containing the given columns, which are returned in that order.
+    """
+    with open(file_path, "r", newline="") as f_in:
+        reader = csv.reader(f_in)
+        header = next(reader, [])
+        missing = [column for column in columns if column not in header]
+        assert not missing, f"{file_path} is missing the columns {missing}"
+        positions = [header.index(column) for column in columns]
+        while True:
+            rows = list(itertools.islice(reader, chunk_size))
+            if not rows:
+                break
+            yield [[row[i] for row in rows] for i in positions]
+
+
+def parse_counts(values, file_path, column):
+    """Turn a column of counts into an int64 array, checking they are whole numbers >= 0"""
+    try:
+        counts = np.asarray(values).astype(np.int64)
+    except ValueError:
+        counts = None
+    if counts is None or (counts < 0).any():
+        raise ValueError(f"{file_path} has an invalid {column}")
+    return counts
+
+
+def split_box_types(box_types):
+    """Yield (box_type, rows) for each box_type, in the order they first appear. rows is a
+    slice when the box_type's rows are stored together, so indexing with it makes a view.
+    """
+    if len(box_types) == 0:
+        return
+    names, first, codes = np.unique(
+        box_types, return_index=True, return_inverse=True
+    )
+    for code in np.argsort(first, kind="stable"):
+        rows = np.flatnonzero(codes == code)
+        if rows[-1] - rows[0] + 1 == len(rows):
+            rows = slice(rows[0], rows[-1] + 1)
+        yield str(names[code]), rows
+
+
+def read_recipe_arrays(file_path, chunk_size=CHUNK_SIZE):
+    """Read a recipes csv or npz file into a dict of {box_type: {"recipe_ids", "stock"}}, like
+    streaming.load_recipe_arrays, keeping the recipes of each box_type in file order
+    """
+    chunks = dict()
+    if get_format(file_path) == "csv":
+        for recipe_ids, stock, box_types in iter_csv_chunks(
+            file_path, RECIPE_COLUMNS, chunk_size
+        ):
+            recipe_ids = np.array(recipe_ids, dtype=object)
+            stock = parse_counts(stock, file_path, "stock_count")
+            for box_type, rows in split_box_types(np.array(box_types)):
+                box_chunks = chunks.setdefault(box_type, ([], []))
+                box_chunks[0].append(recipe_ids[rows])
+                box_chunks[1].append(stock[rows])
+        return {
+            box_type: {
+                "recipe_ids": np.concatenate(recipe_ids),
+                "stock": np.concatenate(stock),
+            }
+            for (box_type, (recipe_ids, stock)) in chunks.items()
+        }
+    with np.load(file_path) as data:
+        missing = [column for column in RECIPE_COLUMNS if column not in data]
+        assert not missing, f"{file_path} is missing the columns {missing}"
+        recipe_ids = data["recipe_id"]
+        stock = parse_counts(data["stock_count"], file_path, "stock_count")
+        box_types = data["box_type"]
+    return {
+        box_type: {
+            "recipe_ids": recipe_ids[rows].astype(object),
+            "stock": stock[rows],
+        }
+        for (box_type, rows) in split_box_types(box_types)
+    }
+
+
+def columns_to_orders(
+    box_types, recipe_categories, portion_categories, counts
+):
+    """Turn order columns into an orders object, the reverse of DataGenerator.orders_to_columns"""
+    orders = dict()
+    for box_type, recipe_category, portion_category, count in zip(
+        box_types, recipe_categories, portion_categories, counts
+    ):
+        orders.setdefault(str(box_type), dict()).setdefault(
+            str(recipe_category), dict()
+        )[str(portion_category)] = int(count)
+    return orders
+
+
+def read_orders(file_path):
+    """Read an orders csv or npz file into an orders object, in the same format as the json"""
+    if get_format(file_path) == "csv":
+        # There is one row per order group, so the whole file is one chunk
+        columns = next(
+            iter_csv_chunks(file_path, ORDER_COLUMNS, chunk_size=None),
+            [[] for _ in ORDER_COLUMNS],
+        )
+    else:
+        with np.load(file_path) as data:
+            missing = [
+                column for column in ORDER_COLUMNS if column not in data
+            ]
+            assert not missing, f"{file_path} is missing the columns {missing}"
+            columns = [data[column] for column in ORDER_COLUMNS]
+    return columns_to_orders(
+        *columns[:3], parse_counts(columns[3], file_path, "orders")
+    )
+
+
+def write_columns(columns, file_path, chunk_size=CHUNK_SIZE):
+    """Write a dict of equal length columns to a csv or npz file. csv files are written
+    chunk_size rows at a time, and npz files store each column as an array.
+    """
+    if get_format(file_path) == "npz":
+        np.savez(
+            file_path,
+            **{
+                name: values.astype(str) if values.dtype == object else values
+                for (name, values) in columns.items()
+            },
+        )
+        return
+    n_rows = len(next(iter(columns.values()), []))
+    with open(file_path, "w", newline="") as f_out:
+        writer = csv.writer(f_out)
+        writer.writerow(list(columns))
+        for start in range(0, n_rows, chunk_size):
+            writer.writerows(
+                zip(
+                    *[
+                        values[start : start + chunk_size].tolist()
+                        for values in columns.values()
+                    ]
+                )
+            )
+
+
+def write_leftover(allocator, file_path, chunk_size=CHUNK_SIZE):
+    """Write the leftover stock of the last successful run to a csv or npz file, in the same
+    format as the recipes so it can be read back in with read_recipe_arrays
+    """
+    ledger = allocator.leftover_stock
+    assert (
+        ledger is not None
+    ), "There is no leftover stock to write, the last run did not succeed"
+    recipe_ids, stock, box_types = ledger.arrays()
+    write_columns(
+        {"recipe_id": recipe_ids, "stock_count": stock, "box_type": box_types},
+        file_path,
+        chunk_size,
+    )
+
+
+def get_group_summary(allocator):
+    """Return columns with a row for every order group of the last run, in the order they
+    were allocated: its orders, the portions they need, the allocation steps it took and
+    whether it was fulfilled. Groups that were not reached took no steps.
+    """
+    rows = list()
+    for box_type in allocator.allocation_order:
+        groups = zip(
+            allocator.get_group_order(allocator.engine),
+            allocator.get_order_groups(box_type, allocator.engine),
+        )
+        for (
+            (recipe_num, portion_num, recipe_category, portion_category),
+            (_, _, orders_to_fulfill),
+        ) in groups:
+            key = (box_type, recipe_num, portion_num)
+            rows.append(
+                (
+                    box_type,
+                    recipe_category,
+                    portion_category,
+                    recipe_num,
+                    portion_num,
+                    orders_to_fulfill,
+                    recipe_num * portion_num * orders_to_fulfill,
+                    allocator.iterations.get(key, 0),
+                    allocator.fulfilled.get(key, False),
+                )
+            )
+    return {
+        name: np.array(
+            [row[i] for row in rows],
+            dtype=object if i < 3 else (bool if i == 8 else np.int64),
+        )
+        for (i, name) in enumerate(SUMMARY_COLUMNS)
+    }
+
+
+def write_group_summary(allocator, file_path, chunk_size=CHUNK_SIZE):
+    """Write the per-group summary of the last run (see get_group_summary) to a csv or npz
+    file
+    """
+    write_columns(get_group_summary(allocator), file_path, chunk_size)
@@ -0,0 +1,87 @@
+"""Cheap checks that reject impossible inputs before running the allocation loop.
+
+Each check is a necessary condition for any allocation to exist, so if one fails the greedy
+allocation would fail too. The checks are applied to the order groups in the order they are
+allocated, so the group reported is the first one that cannot possibly be fulfilled along
+with the groups before it. For each box_type, with stock c_j for each recipe j it can use,
+and groups of n orders of k distinct recipes with p portions each:
+
+    - total stock: the portions demanded, sum(k * n * p), cannot exceed sum(c_j). A box_type
+      can use the leftover stock of the box_types it depends on (see scheduler.py), e.g.
+      gourmet orders can use vegetarian recipes, so this includes every recipe it can use and
+      the demand of the earlier box_types that can only use those same recipes.
+    - distinct recipes: each recipe can appear at most once in an order, so it can fulfil at
+      most min(c_j // p, n) orders of a group, and these must add up to at least k * n.
+    - portions per recipe: across the groups so far, a recipe can supply at most
+      min(c_j, sum(n * p)) portions, and these must add up to the portions demanded.
+"""
+import numpy as np
+
+from gousto_test.scheduler import get_pools
+
+
+def check_feasibility(allocator):
+    """Check that the data loaded into a RecipeAllocator could possibly be allocated.
+
+    Returns {"feasible": True} or {"feasible": False, "box_type", "recipe_num",
+    "portion_num", "reason"} for the first order group that cannot be fulfilled.
+    """
+    graph = allocator.box_type_graph
+    stock_arrays = {
+        box_type: allocator.get_stock_arrays(box_type)[1] for box_type in graph
+    }
+    # The portions demanded by each box_type, and the most portions each recipe could supply
+    # to its order groups at one per order
+    totals = dict()
+    for box_type in allocator.allocation_order:
+        pools = get_pools(graph, box_type)
+        stock = np.concatenate([stock_arrays[pool] for pool in pools])
+        total_stock = int(stock.sum())
+        # Earlier box_types that can only use these recipes have already used some of them
+        demanded = order_portions = 0
+        for earlier, (earlier_demanded, earlier_portions) in totals.items():
+            if set(get_pools(graph, earlier)) <= set(pools):
+                demanded += earlier_demanded
+                order_portions += earlier_portions
+        box_demanded = box_portions = 0
+        for (
+            recipe_num,
+            portion_num,
+            orders_to_fulfill,
+        ) in allocator.get_order_groups(box_type):
+            if orders_to_fulfill == 0:
+                continue
+            portions = recipe_num * portion_num * orders_to_fulfill
+            box_demanded += portions
+            box_portions += orders_to_fulfill * portion_num
+            demanded += portions
+            order_portions += orders_to_fulfill * portion_num
+            reason = None
+            if demanded > total_stock:
+                reason = (
+                    f"{demanded} portions are needed by this point, but there are only "
+                    f"{total_stock} in stock"
+                )
+            elif (
+                np.minimum(stock // portion_num, orders_to_fulfill).sum()
+                < recipe_num * orders_to_fulfill
+            ):
+                reason = (
+                    f"there are not enough recipes with {portion_num} portions in stock "
+                    f"to give {orders_to_fulfill} orders {recipe_num} different recipes each"
+                )
+            elif np.minimum(stock, order_portions).sum() < demanded:
+                reason = (
+                    f"{demanded} portions are needed by this point, but no recipe can be "
+                    f"used more than once per order"
+                )
+            if reason is not None:
+                return {
+                    "feasible": False,
+                    "box_type": box_type,
+                    "recipe_num": recipe_num,
+                    "portion_num": portion_num,
+                    "reason": reason,
+                }
+        totals[box_type] = (box_demanded, box_portions)
+    return {"feasible": True}
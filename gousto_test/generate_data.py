@@ -1,6 +1,10 @@
 import random
 import json
 
+import numpy as np
+
+from gousto_test.categories import parse_category_number
+from gousto_test.columnar import write_columns
 from gousto_test.utils.logging import get_logger
 
 logger = get_logger()
@@ -20,7 +24,19 @@ class DataGenerator:
         order_groups=None,
         portion_options=None,
         recipe_options=None,
+        seed=None,
+        rng=None,
     ):
+        # Random number generator. Pass a seed or a random.Random instance to get the same
+        # data every time, otherwise the global random module is used
+        self.seed = seed
+        self._np_rng = None
+        if rng is not None:
+            self.rng = rng
+        elif seed is not None:
+            self.rng = random.Random(seed)
+        else:
+            self.rng = random
         # Set limits on the number of recipes
         self.max_recipes = max_recipes
         self.min_recipes = min_recipes
@@ -48,18 +64,70 @@ class DataGenerator:
             else ["two_recipes", "three_recipes", "four_recipes"]
         )
 
+    @property
+    def np_rng(self):
+        """numpy Generator used by the bulk methods. It is seeded from the seed if one was
+        given, otherwise from rng, so the bulk data is also reproducible.
+        """
+        if self._np_rng is None:
+            seed = (
+                self.seed
+                if self.seed is not None
+                else self.rng.getrandbits(64)
+            )
+            self._np_rng = np.random.default_rng(seed)
+        return self._np_rng
+
     @staticmethod
     def generate_random_number(
-        min, max, distribution="uniform", round_output=True
+        min, max, distribution="uniform", round_output=True, rng=None
     ):
-        """Generate a random number from a distribution"""
+        """Generate a random number from a distribution, using rng if one is supplied.
+        Numbers from distributions other than uniform are clipped to lie between min and max.
+        """
+        rng = rng if rng is not None else random
+        mean, sd = (min + max) / 2, (max - min) / 6
         if distribution == "uniform":
-            output = random.uniform(min, max)
-            return output if not round_output else round(output)
+            output = rng.uniform(min, max)
+        elif distribution == "normal":
+            output = rng.gauss(mean, sd)
+        elif distribution == "lognormal":
+            output = rng.lognormvariate(np.log(mean), 0.5) if mean > 0 else 0
+        elif distribution == "exponential":
+            output = min + rng.expovariate(2 / (max - min) if max > min else 1)
         else:
             raise NotImplementedError(
-                "Only uniform number generation has been implemented so far"
+                f"{distribution} number generation has not been implemented, the options are "
+                "uniform, normal, lognormal and exponential"
             )
+        if distribution != "uniform":
+            output = float(np.clip(output, min, max))
+        return output if not round_output else round(output)
+
+    @staticmethod
+    def generate_random_numbers(
+        min, max, size, distribution="uniform", round_output=True, rng=None
+    ):
+        """Generate an array of random numbers from a distribution with a numpy Generator.
+        Supports the same distributions as generate_random_number.
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        mean, sd = (min + max) / 2, (max - min) / 6
+        if distribution == "uniform":
+            output = rng.uniform(min, max, size)
+        elif distribution == "normal":
+            output = rng.normal(mean, sd, size)
+        elif distribution == "lognormal":
+            output = rng.lognormal(np.log(mean), 0.5, size) if mean > 0 else 0
+        elif distribution == "exponential":
+            output = min + rng.exponential((max - min) / 2, size)
+        else:
+            raise NotImplementedError(
+                f"{distribution} number generation has not been implemented, the options are "
+                "uniform, normal, lognormal and exponential"
+            )
+        output = np.clip(np.broadcast_to(output, size), min, max)
+        return output if not round_output else np.rint(output).astype(np.int64)
 
     @staticmethod
     def save_json(object, save_dir):
@@ -69,19 +137,106 @@ class DataGenerator:
         except Exception as e:
             logger.error(f"Saving json failed, error: {e}")
 
+    @staticmethod
+    def save_npz(columns, save_dir):
+        """Save a dict of arrays to a numpy .npz file"""
+        try:
+            np.savez(save_dir, **columns)
+        except Exception as e:
+            logger.error(f"Saving npz failed, error: {e}")
+
+    @staticmethod
+    def save_recipe_columns_json(columns, save_dir):
+        """Save recipe columns in the same json format as generate_recipes, without building
+        a dict for every recipe first
+        """
+        try:
+            with open(save_dir, "w") as f_out:
+                f_out.write("{")
+                f_out.write(
+                    ", ".join(
+                        f'"{recipe_id}": {{"stock_count": {stock_count}, "box_type": "{box_type}"}}'
+                        for recipe_id, stock_count, box_type in zip(
+                            columns["recipe_id"].tolist(),
+                            columns["stock_count"].tolist(),
+                            columns["box_type"].tolist(),
+                        )
+                    )
+                )
+                f_out.write("}")
+        except Exception as e:
+            logger.error(f"Saving json failed, error: {e}")
+
+    @staticmethod
+    def orders_to_columns(orders):
+        """Turn an orders object into columns, with one row per (box_type, recipe, portion)
+        group. If the order counts are arrays, the orders column has one column per scenario.
+        """
+        rows = [
+            (box_type, recipe_category, portion_category, count)
+            for (box_type, recipe_categories) in orders.items()
+            for (recipe_category, portions) in recipe_categories.items()
+            for (portion_category, count) in portions.items()
+        ]
+        return {
+            "box_type": np.array([row[0] for row in rows]),
+            "recipe_category": np.array([row[1] for row in rows]),
+            "portion_category": np.array([row[2] for row in rows]),
+            "orders": np.array([row[3] for row in rows], dtype=np.int64),
+        }
+
+    def save(self, object, save_dir, file_format="json"):
+        """Save recipe columns or an orders object as json, npz or csv"""
+        assert file_format in [
+            "json",
+            "npz",
+            "csv",
+        ], "file_format can only be json, npz or csv"
+        is_recipe_columns = "recipe_id" in object
+        if file_format == "csv":
+            write_columns(
+                object
+                if is_recipe_columns
+                else self.orders_to_columns(object),
+                save_dir,
+            )
+        elif file_format == "npz":
+            self.save_npz(
+                object
+                if is_recipe_columns
+                else self.orders_to_columns(object),
+                save_dir,
+            )
+        elif is_recipe_columns:
+            self.save_recipe_columns_json(object, save_dir)
+        else:
+            self.save_json(
+                {
+                    box_type: {
+                        recipe: {
+                            portion: np.asarray(count).tolist()
+                            for (portion, count) in portions.items()
+                        }
+                        for (recipe, portions) in recipes.items()
+                    }
+                    for (box_type, recipes) in object.items()
+                },
+                save_dir,
+            )
+
     def generate_recipes(self, save_dir=None):
         """Generate recipes and stock amounts based on the parameters set in __init__()"""
         n_recipes = self.generate_random_number(
-            self.min_recipes, self.max_recipes
+            self.min_recipes, self.max_recipes, rng=self.rng
         )
         recipe_dict = dict()
         for i in range(1, n_recipes + 1):
             recipe_dict[f"recipe_{i}"] = {
                 "stock_count": self.generate_random_number(
-                    self.min_stock, self.max_stock
+                    self.min_stock, self.max_stock, rng=self.rng
                 ),
                 "box_type": "vegetarian"
-                if random.uniform(0, 1) < self.vegetarian_recipe_portion
+                if self.rng.uniform(0, 1) < self.vegetarian_recipe_portion
                 else "gourmet",
             }
         if save_dir is None:
@@ -100,13 +255,196 @@ class DataGenerator:
                     order_dict[group][recipe][
                         portion
                     ] = self.generate_random_number(
-                        self.min_orders, self.max_orders
+                        self.min_orders, self.max_orders, rng=self.rng
                     )
         if save_dir is None:
             return order_dict
         else:
             self.save_json(order_dict, save_dir)
 
+    def generate_recipes_bulk(
+        self,
+        n_recipes=None,
+        save_dir=None,
+        distribution="uniform",
+        file_format="json",
+    ):
+        """Generate recipes with numpy, returned as columns rather than a dict per recipe.
+        This can generate millions of recipes in a few seconds.
+        """
+        if n_recipes is None:
+            n_recipes = int(
+                self.np_rng.integers(self.min_recipes, self.max_recipes + 1)
+            )
+        columns = {
+            "recipe_id": np.char.add(
+                "recipe_", np.arange(1, n_recipes + 1).astype(str)
+            ),
+            "stock_count": self.generate_random_numbers(
+                self.min_stock,
+                self.max_stock,
+                n_recipes,
+                distribution=distribution,
+                rng=self.np_rng,
+            ),
+            "box_type": np.where(
+                self.np_rng.random(n_recipes) < self.vegetarian_recipe_portion,
+                "vegetarian",
+                "gourmet",
+            ),
+        }
+        if save_dir is None:
+            return columns
+        else:
+            self.save(columns, save_dir, file_format=file_format)
+
+    def generate_orders_bulk(
+        self,
+        n_scenarios=None,
+        save_dir=None,
+        distribution="uniform",
+        file_format="json",
+    ):
+        """Generate customer orders with numpy. If n_scenarios is given, every order count is
+        an array with one value per scenario, which can be passed straight to
+        RecipeAllocator.run_batch.
+        """
+        size = (
+            len(self.order_groups),
+            len(self.recipe_options),
+            len(self.portion_options),
+        ) + ((n_scenarios,) if n_scenarios is not None else ())
+        counts = self.generate_random_numbers(
+            self.min_orders,
+            self.max_orders,
+            size,
+            distribution=distribution,
+            rng=self.np_rng,
+        )
+        order_dict = {
+            group: {
+                recipe: {
+                    portion: counts[i, j, k]
+                    if n_scenarios is not None
+                    else int(counts[i, j, k])
+                    for (k, portion) in enumerate(self.portion_options)
+                }
+                for (j, recipe) in enumerate(self.recipe_options)
+            }
+            for (i, group) in enumerate(self.order_groups)
+        }
+        if save_dir is None:
+            return order_dict
+        else:
+            self.save(order_dict, save_dir, file_format=file_format)
+
+    @staticmethod
+    def get_group_option(option, *keys):
+        """Return the option for an order group, where option is either a single value or a
+        dict keyed by box_type, and optionally by recipe and portion category below that
+        """
+        for key in keys:
+            if not isinstance(option, dict):
+                break
+            option = option[key]
+        return option
+
+    def sample_order_counts(self, forecast, n_scenarios, distribution, spread):
+        """Sample n_scenarios order counts around a forecast count with self.np_rng. spread is
+        the dispersion of the counts: the coefficient of variation of normal and lognormal
+        counts, and the extra variance of negative_binomial counts over poisson ones, which
+        have a variance of forecast + spread * forecast ** 2.
+        """
+        if forecast == 0 or distribution == "fixed":
+            return np.full(n_scenarios, forecast, dtype=np.int64)
+        if distribution == "poisson":
+            output = self.np_rng.poisson(forecast, n_scenarios)
+        elif distribution == "negative_binomial":
+            n = 1 / spread
+            output = self.np_rng.negative_binomial(
+                n, n / (n + forecast), n_scenarios
+            )
+        elif distribution == "normal":
+            output = self.np_rng.normal(
+                forecast, spread * forecast, n_scenarios
+            )
+        elif distribution == "lognormal":
+            output = forecast * self.np_rng.lognormal(
+                -(spread**2) / 2, spread, n_scenarios
+            )
+        else:
+            raise NotImplementedError(
+                f"{distribution} order sampling has not been implemented, the options are "
+                "poisson, negative_binomial, normal, lognormal and fixed"
+            )
+        return np.rint(np.maximum(output, 0)).astype(np.int64)
+
+    def generate_orders_around(
+        self, forecast, n_scenarios, distribution="poisson", spread=0.1
+    ):
+        """Sample customer orders around a forecast orders object, with n_scenarios order counts
+        for every group that can be passed straight to RecipeAllocator.run_batch. distribution
+        and spread can be given for every group at once, or as dicts keyed by box_type, recipe
+        and portion category (see get_group_option and sample_order_counts).
+        """
+        return {
+            box_type: {
+                recipe: {
+                    portion: self.sample_order_counts(
+                        int(count),
+                        n_scenarios,
+                        self.get_group_option(
+                            distribution, box_type, recipe, portion
+                        ),
+                        self.get_group_option(
+                            spread, box_type, recipe, portion
+                        ),
+                    )
+                    for (portion, count) in portions.items()
+                }
+                for (recipe, portions) in recipes.items()
+            }
+            for (box_type, recipes) in forecast.items()
+        }
+
+    def generate_infeasible_orders(
+        self, recipes, box_type="vegetarian", save_dir=None
+    ):
+        """Generate orders that cannot be fulfilled for the given box_type, like
+        tests/orders_break_veg.json. The other order groups are generated as normal, then the
+        largest recipe/portion group of box_type is given more orders than there is stock for.
+        Vegetarian boxes can only use vegetarian stock, while gourmet boxes can use any stock.
+        `recipes` can be a recipes dict or the columns from generate_recipes_bulk.
+        """
+        assert (
+            box_type in self.order_groups
+        ), f"box_type must be one of {self.order_groups}"
+        if "recipe_id" in recipes:
+            stock, box_types = recipes["stock_count"], recipes["box_type"]
+        else:
+            stock = [recipe["stock_count"] for recipe in recipes.values()]
+            box_types = [recipe["box_type"] for recipe in recipes.values()]
+        stock, box_types = np.asarray(stock), np.asarray(box_types)
+        total_stock = (
+            stock[box_types == "vegetarian"].sum()
+            if box_type == "vegetarian"
+            else stock.sum()
+        )
+        # Pick the group that uses the most stock per order
+        recipe_category = max(self.recipe_options, key=parse_category_number)
+        portion_category = max(self.portion_options, key=parse_category_number)
+        stock_per_order = parse_category_number(
+            recipe_category
+        ) * parse_category_number(portion_category)
+        order_dict = self.generate_orders()
+        order_dict[box_type][recipe_category][portion_category] = (
+            int(total_stock) // stock_per_order + 1
+        )
+        if save_dir is None:
+            return order_dict
+        else:
+            self.save_json(order_dict, save_dir)
+
 
 if __name__ == "__main__":
     generator = DataGenerator()
@@ -0,0 +1,179 @@
+"""Allocate the orders of many delivery days at many fulfilment sites, carrying the leftover
+stock of each day forward to the next.
+
+Each step of a horizon is a dict with the "site", the "day" and the "orders" of that day, in
+the same format as the orders json, and optionally a "restock" dict of {recipe_id: stock
+delivered before the day is allocated}. The days of a site are allocated in day order,
+starting from the site's stock, and each day starts with the stock left over by the day
+before. Sites do not share stock, so they are independent and can be allocated in separate
+worker processes.
+
+Stock is carried forward as arrays, with the recipes in the same order every day, so each
+day gives the same result as calling RecipeAllocator.run on the leftover stock of the day
+before. The leftover stock after every day is kept as a (days, recipes) array of the
+smallest unsigned integer type that can hold it.
+
+Example:
+    results = run_horizon(steps, {"site_1": recipes_1, "site_2": recipes_2}, workers=4)
+    results["site_1"]["leftover"][-1]  # The stock of each recipe after the last day
+"""
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from gousto_test.allocation_kernel import KERNELS
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.streaming import group_recipe_arrays
+
+RESULT_KEYS = ["days", "success", "recipe_ids", "box_types", "leftover"]
+
+
+def group_steps(steps):
+    """Return {site: [steps in day order]}, with the sites in the order they first appear"""
+    sites = dict()
+    for step in steps:
+        sites.setdefault(step["site"], []).append(step)
+    return {
+        site: sorted(site_steps, key=lambda step: step["day"])
+        for (site, site_steps) in sites.items()
+    }
+
+
+def allocate_site(site, steps, recipes, *, engine="bulk", box_type_graph=None):
+    """Allocate the days of one site in order, carrying the leftover stock forward. A day
+    that cannot be allocated uses no stock. Returns a dict with the days, whether each day was
+    allocated, the recipe_ids and box_types of the recipes, and the leftover stock of every
+    recipe after each day.
+    """
+    arrays = group_recipe_arrays(recipes.items())
+    recipe_ids = np.concatenate(
+        [np.array([], dtype=object)]
+        + [arrays[box_type]["recipe_ids"] for box_type in arrays]
+    )
+    box_types = np.concatenate(
+        [np.array([], dtype=object)]
+        + [
+            np.full(len(arrays[box_type]["stock"]), box_type, dtype=object)
+            for box_type in arrays
+        ]
+    )
+    stock = np.concatenate(
+        [np.array([], dtype=np.int64)]
+        + [arrays[box_type]["stock"] for box_type in arrays]
+    )
+    # The slice of the arrays holding the recipes of each box_type
+    bounds = np.cumsum(
+        [0] + [len(arrays[box_type]["stock"]) for box_type in arrays]
+    )
+    slices = {
+        box_type: slice(start, end)
+        for (box_type, start, end) in zip(arrays, bounds[:-1], bounds[1:])
+    }
+    # Used to find the position of a recipe id in recipe_ids
+    sorter = np.argsort(recipe_ids, kind="stable")
+
+    def locate(ids):
+        ids = np.asarray(ids, dtype=object)
+        positions = sorter[
+            np.searchsorted(recipe_ids, ids, sorter=sorter).clip(
+                0, max(len(recipe_ids) - 1, 0)
+            )
+        ]
+        assert len(ids) == 0 or (recipe_ids[positions] == ids).all(), (
+            f"Some of the recipes restocked at {site} are not in its stock: "
+            f"{sorted(set(ids.tolist()) - set(recipe_ids.tolist()))}"
+        )
+        return positions
+
+    allocator = RecipeAllocator(verbose=False, box_type_graph=box_type_graph)
+    success = np.zeros(len(steps), dtype=bool)
+    history = np.empty((len(steps), len(stock)), dtype=np.int64)
+    for i, step in enumerate(steps):
+        restock = step.get("restock")
+        if restock:
+            stock[locate(list(restock))] += np.array(
+                list(restock.values()), dtype=np.int64
+            )
+            assert (stock >= 0).all(), f"Stock at {site} cannot be negative"
+        success[i] = allocator.run(
+            orders=step["orders"],
+            recipe_arrays={
+                box_type: {
+                    "recipe_ids": recipe_ids[slices[box_type]],
+                    "stock": stock[slices[box_type]],
+                }
+                for box_type in arrays
+            },
+            engine=engine,
+        )
+        if success[i]:
+            leftover = allocator.leftover_stock
+            stock[locate(leftover.entry_recipe_ids())] = leftover.stock
+        history[i] = stock
+    return {
+        "days": [step["day"] for step in steps],
+        "success": success,
+        "recipe_ids": recipe_ids,
+        "box_types": box_types,
+        "leftover": history.astype(
+            np.min_scalar_type(int(history.max(initial=0)))
+        ),
+    }
+
+
+def run_horizon(
+    steps, stock, *, engine="bulk", box_type_graph=None, workers=1
+):
+    """Allocate a horizon of (site, day) steps, given the stock of each site as a recipes dict
+    in the same format as the recipes json. With workers > 1 the sites are allocated in a pool
+    of worker processes. Returns {site: result}, see allocate_site.
+    """
+    assert (
+        engine in KERNELS
+    ), f"A horizon needs one of these engines: {list(KERNELS)}"
+    sites = group_steps(steps)
+    for site in sites:
+        assert site in stock, f"There is no stock for {site}"
+    allocate = functools.partial(
+        allocate_site, engine=engine, box_type_graph=box_type_graph
+    )
+    args = (
+        list(sites),
+        list(sites.values()),
+        [stock[site] for site in sites],
+    )
+    if workers <= 1:
+        results = list(map(allocate, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(allocate, *args))
+    return dict(zip(sites, results))
+
+
+def save_history(results, file_path):
+    """Save the results of run_horizon to a compressed npz file"""
+    arrays = {"sites": np.array([str(site) for site in results])}
+    for i, result in enumerate(results.values()):
+        for key in RESULT_KEYS:
+            values = np.asarray(result[key])
+            arrays[f"{key}_{i}"] = (
+                values.astype(str) if values.dtype == object else values
+            )
+    np.savez_compressed(file_path, **arrays)
+
+
+def load_history(file_path):
+    """Load the results saved by save_history. Sites, recipe ids and box_types are strings."""
+    with np.load(file_path) as data:
+        return {
+            str(site): {
+                key: (
+                    data[f"{key}_{i}"].astype(object)
+                    if data[f"{key}_{i}"].dtype.kind == "U"
+                    else data[f"{key}_{i}"]
+                )
+                for key in RESULT_KEYS
+            }
+            for (i, site) in enumerate(data["sites"])
+        }
@@ -0,0 +1,155 @@
+"""Keep the stock of a pool of recipes in compact arrays.
+
+A StockLedger has a row for every recipe, holding its id and a uint8 code for its box_type,
+and a list of (stock, row) entries, which is the same pair of stock and index arrays the
+allocation kernels work on. Every operation returns a new ledger that shares the arrays it
+did not change, so ledgers are copy-on-write: handing the leftover stock of one box_type on to
+the next, or keeping a snapshot of it, copies nothing. A DataFrame is only made on demand.
+"""
+import numpy as np
+
+from gousto_test.allocation_kernel import restock, sort_stock
+
+
+class StockLedger:
+    """The stock of some recipes. recipe_ids and codes have one value per row, box_types maps
+    the codes to box_type names, and stock and index have one value per entry, where index is
+    the row of each entry. The arrays are never changed in place. Recipe ids are kept as they
+    are given rather than interned, as every ledger made from this one shares the same array.
+    """
+
+    __slots__ = ("recipe_ids", "codes", "box_types", "stock", "index")
+
+    def __init__(self, recipe_ids, codes, box_types, stock, index):
+        self.recipe_ids = recipe_ids
+        self.codes = codes
+        self.box_types = tuple(box_types)
+        self.stock = stock
+        self.index = index
+
+    def __len__(self):
+        return len(self.stock)
+
+    @classmethod
+    def from_arrays(cls, recipe_ids, stock, box_types):
+        """Create a ledger with an entry for every recipe, in the order given. box_types is
+        either the box_type of every recipe or a single box_type for all of them.
+        """
+        recipe_ids = np.asarray(recipe_ids, dtype=object)
+        if isinstance(box_types, str):
+            names = (box_types,)
+            codes = np.zeros(len(recipe_ids), dtype=np.uint8)
+        else:
+            names, codes = np.unique(
+                np.asarray(box_types, dtype=object), return_inverse=True
+            )
+            assert (
+                len(names) <= 256
+            ), "A ledger can hold the stock of at most 256 box_types"
+            codes = codes.astype(np.uint8)
+        return cls(
+            recipe_ids,
+            codes,
+            names,
+            np.asarray(stock, dtype=np.int64),
+            np.arange(len(recipe_ids), dtype=np.int64),
+        )
+
+    @classmethod
+    def from_frame(cls, df):
+        """Create a ledger from a DataFrame of the stock_count and box_type of each recipe"""
+        return cls.from_arrays(
+            df.index.to_numpy(dtype=object),
+            df["stock_count"].to_numpy(dtype=np.int64),
+            df["box_type"].to_numpy(dtype=object),
+        )
+
+    @classmethod
+    def concatenate(cls, ledgers):
+        """Join the entries of several ledgers, in order, into a ledger with a row per entry"""
+        ledgers = list(ledgers)
+        box_types = list()
+        for ledger in ledgers:
+            box_types.extend(
+                name for name in ledger.box_types if name not in box_types
+            )
+        assert (
+            len(box_types) <= 256
+        ), "A ledger can hold the stock of at most 256 box_types"
+        codes = {name: code for (code, name) in enumerate(box_types)}
+        recipe_ids, row_codes, stock = list(), list(), list()
+        for ledger in ledgers:
+            remap = np.array(
+                [codes[name] for name in ledger.box_types], dtype=np.uint8
+            )
+            recipe_ids.append(ledger.recipe_ids[ledger.index])
+            row_codes.append(remap[ledger.codes[ledger.index]])
+            stock.append(ledger.stock)
+        stock = np.concatenate(stock or [np.array([], dtype=np.int64)])
+        return cls(
+            np.concatenate(recipe_ids or [np.array([], dtype=object)]),
+            np.concatenate(row_codes or [np.array([], dtype=np.uint8)]),
+            box_types,
+            stock,
+            np.arange(len(stock), dtype=np.int64),
+        )
+
+    def with_entries(self, stock, index):
+        """Return a ledger with the same rows and new entries"""
+        return StockLedger(
+            self.recipe_ids, self.codes, self.box_types, stock, index
+        )
+
+    def sorted(self):
+        """Return the ledger with its entries sorted by stock, keeping the order of ties"""
+        return self.with_entries(*sort_stock(self.stock, self.index))
+
+    def restock(self, rows, change):
+        """Add change to the stock of the given rows of a ledger sorted by stock, moving only
+        the changed entries. The stock and index arrays are copied once, so this is linear in
+        the number of entries (see allocation_kernel.restock).
+        """
+        return self.with_entries(
+            *restock(self.stock, self.index, rows, change)
+        )
+
+    def select(self, box_types):
+        """Return the entries of some box_types, sharing the rows of this ledger"""
+        if isinstance(box_types, str):
+            box_types = [box_types]
+        codes = [
+            code
+            for (code, name) in enumerate(self.box_types)
+            if name in box_types
+        ]
+        mask = np.isin(self.codes[self.index], codes)
+        return self.with_entries(self.stock[mask], self.index[mask])
+
+    def entry_recipe_ids(self):
+        """Return the recipe id of each entry"""
+        return self.recipe_ids[self.index]
+
+    def entry_box_types(self):
+        """Return the box_type name of each entry"""
+        return np.array(self.box_types, dtype=object)[self.codes[self.index]]
+
+    def arrays(self):
+        """Return the (recipe_ids, stock, box_types) arrays of the entries"""
+        return self.entry_recipe_ids(), self.stock, self.entry_box_types()
+
+    def to_frame(self):
+        """Return a DataFrame of the stock_count and box_type of each entry"""
+        import pandas as pd
+
+        recipe_ids, stock, box_types = self.arrays()
+        return pd.DataFrame(
+            {"stock_count": stock, "box_type": box_types}, index=recipe_ids
+        )
+
+    @property
+    def nbytes(self):
+        """The number of bytes used by the arrays, not counting the recipe id strings"""
+        return sum(
+            array.nbytes
+            for array in [self.recipe_ids, self.codes, self.stock, self.index]
+        )
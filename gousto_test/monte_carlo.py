@@ -0,0 +1,213 @@
+"""Estimate how likely orders are to be fulfilled when the demand is uncertain.
+
+The order counts in an orders object are treated as a forecast, and samples of the orders
+are drawn around it with DataGenerator.generate_orders_around. The samples are allocated in
+batches with RecipeAllocator.allocate_stacked, which allocates every sample of a batch at
+once, and the batches can be spread over a pool of worker processes. Each batch has its own
+seed derived from the seed of the run, so a run gives the same results whatever the number of
+workers.
+
+Example:
+    python -m gousto_test.monte_carlo --orders orders.json --recipes recipes.json \
+        --samples 10000 --workers 4 --output leftover.csv
+"""
+import argparse
+import json
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from gousto_test.generate_data import DataGenerator
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.parallel import scenario_seed
+from gousto_test.utils.logging import get_logger
+
+logger = get_logger()
+
+# The data shared by every batch in this process, set by init_worker
+state = None
+
+
+def init_worker(forecast, recipes, options, quiet=True):
+    """Create the RecipeAllocator and the stock arrays that this process reuses for every
+    batch. options holds the distribution, spread and box_type_graph of the run.
+    """
+    global state
+    allocator = RecipeAllocator(
+        verbose=False, box_type_graph=options["box_type_graph"]
+    )
+    allocator.set_data(orders=forecast, recipes=recipes)
+    recipe_ids, stock, box_types = list(), list(), list()
+    for box_type in allocator.allocation_order:
+        box_recipe_ids, box_stock = allocator.get_stock_arrays(box_type)
+        recipe_ids.append(box_recipe_ids)
+        stock.append(box_stock)
+        box_types.append(np.full(len(box_stock), box_type, dtype=object))
+    state = {
+        "allocator": allocator,
+        "forecast": forecast,
+        "options": options,
+        "recipe_ids": np.concatenate(recipe_ids),
+        "stock": np.concatenate(stock),
+        "box_types": np.concatenate(box_types),
+    }
+    if quiet:
+        logger.setLevel(logging.WARNING)
+
+
+def simulate_batch(task):
+    """Sample the orders of a batch and allocate them. Returns whether each sample succeeded
+    and the leftover stock of the samples that did, with a row per sample
+    """
+    allocator, options = state["allocator"], state["options"]
+    generator = DataGenerator(seed=task["seed"])
+    orders = generator.generate_orders_around(
+        state["forecast"],
+        task["n_samples"],
+        distribution=options["distribution"],
+        spread=options["spread"],
+    )
+    # The samples have the same categories as the forecast, so only the orders change and
+    # the categories parsed in init_worker are kept
+    allocator.orders = orders
+    result = allocator.allocate_stacked(
+        np.broadcast_to(
+            state["stock"], (task["n_samples"], len(state["stock"]))
+        ),
+        state["box_types"],
+    )
+    leftover = result["excess_stock"][result["success"]]
+    return {
+        "success": result["success"],
+        "leftover": leftover.astype(
+            np.min_scalar_type(int(state["stock"].max(initial=0)))
+        ),
+    }
+
+
+def run_monte_carlo(
+    orders,
+    recipes,
+    *,
+    n_samples=1000,
+    batch_size=1000,
+    seed=0,
+    distribution="poisson",
+    spread=0.1,
+    quantiles=(0.05, 0.5, 0.95),
+    workers=1,
+    box_type_graph=None,
+):
+    """Sample n_samples order objects around the forecast in orders, and allocate the stock
+    in recipes to each of them. Both are in the same format as the json files. With workers
+    > 1 the batches are allocated in a pool of worker processes.
+
+    Returns a dict with the number of samples, the number that could be allocated and the
+    probability that the orders can be fulfilled, along with a "leftover" DataFrame of the
+    quantiles of the leftover stock of each recipe across the samples that could be.
+    """
+    import pandas as pd
+
+    assert n_samples > 0 and batch_size > 0, "There must be samples to run"
+    options = {
+        "distribution": distribution,
+        "spread": spread,
+        "box_type_graph": box_type_graph,
+    }
+    tasks = [
+        {
+            "seed": scenario_seed(seed, batch),
+            "n_samples": min(batch_size, n_samples - start),
+        }
+        for (batch, start) in enumerate(range(0, n_samples, batch_size))
+    ]
+    if workers <= 1:
+        init_worker(orders, recipes, options, quiet=False)
+        results = list(map(simulate_batch, tasks))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(orders, recipes, options),
+        ) as executor:
+            results = list(executor.map(simulate_batch, tasks))
+        init_worker(orders, recipes, options, quiet=False)
+    success = np.concatenate([result["success"] for result in results])
+    leftover = np.concatenate([result["leftover"] for result in results])
+    n_feasible = int(success.sum())
+    columns = [f"p{quantile * 100:g}" for quantile in quantiles]
+    df = pd.DataFrame(
+        (
+            np.quantile(leftover, quantiles, axis=0).T
+            if n_feasible > 0
+            else np.nan
+        ),
+        index=pd.Index(state["recipe_ids"], name="recipe_id"),
+        columns=columns,
+    )
+    df.insert(0, "box_type", state["box_types"])
+    df.insert(1, "stock_count", state["stock"])
+    logger.info(
+        f"{n_feasible} of {n_samples} samples of the orders could be fulfilled"
+    )
+    return {
+        "n_samples": n_samples,
+        "n_feasible": n_feasible,
+        "p_feasible": n_feasible / n_samples,
+        "leftover": df,
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Estimate the chance that uncertain orders can be fulfilled"
+    )
+    parser.add_argument("--orders", required=True, help="Forecast orders json")
+    parser.add_argument("--recipes", required=True, help="Recipes json")
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--distribution",
+        default="poisson",
+        choices=[
+            "poisson",
+            "negative_binomial",
+            "normal",
+            "lognormal",
+            "fixed",
+        ],
+    )
+    parser.add_argument("--spread", type=float, default=0.1)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--output", help="csv file to write the leftover stock quantiles to"
+    )
+    args = parser.parse_args(args)
+    with open(args.orders, "r") as f_in:
+        orders = json.load(f_in)
+    with open(args.recipes, "r") as f_in:
+        recipes = json.load(f_in)
+    start_time = time.perf_counter()
+    results = run_monte_carlo(
+        orders,
+        recipes,
+        n_samples=args.samples,
+        batch_size=args.batch_size,
+        seed=args.seed,
+        distribution=args.distribution,
+        spread=args.spread,
+        workers=args.workers,
+    )
+    logger.warning(
+        f"P(feasible) = {results['p_feasible']:.4f} from {results['n_samples']} samples "
+        f"in {time.perf_counter() - start_time:.2f}s"
+    )
+    if args.output:
+        results["leftover"].to_csv(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,144 @@
+import functools
+import itertools
 import json
-import pandas as pd
 import numpy as np
-from word2number import w2n
 import os
 
-from gousto_test.utils.logging import get_logger
-from gousto_test.utils.general import time_function
+from gousto_test.allocation_kernel import (
+    KERNELS,
+    allocate_group_batch,
+    restock,
+)
+from gousto_test.cache import (
+    canonical_key,
+    from_slots,
+    sorted_stock,
+    to_slots,
+)
+from gousto_test.categories import CategorySchema, get_orders_schema
+from gousto_test.columnar import (
+    is_columnar,
+    read_orders,
+    read_recipe_arrays,
+    write_group_summary,
+    write_leftover,
+)
+from gousto_test.feasibility import check_feasibility
+from gousto_test.ledger import StockLedger
+from gousto_test.plan import AssignmentPlan
+from gousto_test.scheduler import (
+    DEFAULT_BOX_TYPE_GRAPH,
+    get_allocation_order,
+    get_pools,
+    run_schedule,
+    validate_graph,
+)
+from gousto_test.snapshot import load_snapshot
+from gousto_test.streaming import load_recipe_arrays
+from gousto_test.utils.logging import StockTable, get_logger
+from gousto_test.utils.metrics import NULL_PHASE, Metrics, timed_phase
 
 logger = get_logger()
 
 
 class RecipeAllocator:
-    def __init__(self, verbose=True):
+    def __init__(
+        self,
+        verbose=True,
+        collect_metrics=False,
+        profile=None,
+        cache=None,
+        precheck=True,
+        record_plan=False,
+        box_type_graph=None,
+        workers=1,
+        cross_check=False,
+        stock_log="full",
+    ):
         self.orders = None
         self.recipes = None
+        # The ids of the recipes of each box_type, worked out the first time they are needed
+        self.recipe_groups = None
+        # Stock arrays for each box_type, used instead of recipes when streaming large files
+        self.recipe_arrays = None
         self.portion_categories = None
         self.recipe_categories = None
         self.portion_categories_dict = dict()
         self.recipe_categories_dict = dict()
+        # The parsed categories, see categories.CategorySchema
+        self.category_schema = None
         self.box_types = list()
-        self.acceptable_box_types = ["gourmet", "vegetarian"]
+        # Which box_types can use the leftover stock of which others, see scheduler.py.
+        # Box_types that do not share any stock are allocated at the same time when workers > 1
+        self.box_type_graph = dict(box_type_graph or DEFAULT_BOX_TYPE_GRAPH)
+        validate_graph(self.box_type_graph)
+        self.allocation_order = get_allocation_order(self.box_type_graph)
+        self.acceptable_box_types = list(self.box_type_graph)
+        self.workers = workers
+        self.acceptable_engines = ["pandas", "numpy", "bulk", "exact"]
         self.verbose = verbose
-        # Placeholder for excess stock after allocation
+        # How stock tables are logged when verbose, "full" or "summary" (see
+        # utils.logging.StockTable)
+        assert (
+            stock_log in StockTable.modes
+        ), f"stock_log can only be the following: {StockTable.modes}"
+        self.stock_log = stock_log
+        # Placeholder for excess stock after allocation. The numpy engines keep it as
+        # (recipe_ids, stock, box_types) arrays, and only make a DataFrame when it is asked for
+        self.leftover_stock = None
+        self.excess_stock = None
+        # Number of allocation steps taken for each (box_type, recipe_num, portion_num) group,
+        # and whether the group was fulfilled
+        self.iterations = dict()
+        self.fulfilled = dict()
+        # The engine used by the last run, and the state kept by the numpy engines so that the
+        # allocation can be updated incrementally, see update
+        self.engine = None
+        self.pools = dict()
+        self.checkpoints = dict()
+        self.box_results = dict()
+        # The leftover stock of the recipes of each box_type, as (recipe_ids, stock, box_types)
+        # arrays, and the box_type that last allocated from it
+        self.leftover = dict()
+        self.leftover_holders = dict()
+        # Optional cache of results for scenarios we have seen before, see cache.ResultCache
+        self.cache = cache
+        # Whether to reject impossible inputs before allocating, see feasibility.check_feasibility
+        self.precheck = precheck
+        self.feasibility = None
+        # Whether to record which recipes are given to which orders, see plan.AssignmentPlan.
+        # Each box_type records its own plan, and plan_marks holds the length of that plan
+        # before each of its order groups.
+        self.record_plan = record_plan
+        self.plan = None
+        self.box_plans = dict()
+        self.plan_marks = dict()
+        # Whether to also run the bulk engine after the exact engine succeeds and compare the
+        # results. It always runs when the exact engine fails, see check_against_greedy
+        self.cross_check = cross_check
+        self.cross_check_result = None
+        # Timings and counters for each phase of the allocation, see utils.metrics.Metrics
+        self.metrics = Metrics(enabled=collect_metrics, profile=profile)
+
+    @property
+    def excess_stock(self):
+        """The leftover stock after the last successful allocation, as a DataFrame of the
+        stock_count and box_type of each recipe. When only self.leftover_stock is set, the
+        DataFrame is made (and pandas imported) the first time this is used.
+        """
+        if self._excess_stock is None and self.leftover_stock is not None:
+            self._excess_stock = self.leftover_stock.to_frame()
+        return self._excess_stock
+
+    @excess_stock.setter
+    def excess_stock(self, excess_stock):
+        self._excess_stock = excess_stock
+        self.leftover_stock = None
+
+    def set_leftover_stock(self, leftover):
+        """Set the leftover stock as a StockLedger"""
         self.excess_stock = None
+        self.leftover_stock = leftover
 
     @staticmethod
     def load_json(file_path):
@@ -35,25 +151,89 @@ class RecipeAllocator:
                 f"Failed to load orders file at {file_path}. Error: {e}"
             )
 
-    def load_data(self, orders_dir="orders.json", recipes_dir="recipes.json"):
-        """Load order and recipe data from a json file"""
+    def load_data(
+        self,
+        orders_dir="orders.json",
+        recipes_dir="recipes.json",
+        stream=False,
+    ):
+        """Load order and recipe data from a json file. If stream is True, the recipes are read
+        one at a time straight into stock arrays for each box_type (see streaming.py), which
+        uses much less memory for large files but only works with the numpy engines. Files ending
+        in .csv or .npz are read as columns (see columnar.py), with the recipes going straight
+        into stock arrays as when streaming, so they also only work with the numpy engines.
+        """
         # Try to load the orders json
         assert os.path.exists(
             orders_dir
         ), "Cannot find the directory for the orders JSON, did you specify it correctly?"
-        self.orders = self.load_json(orders_dir)
         assert os.path.exists(
             recipes_dir
         ), "Cannot find the directory for the recipes JSON, did you specify it correctly?"
-        # Try to load the recipes json
-        self.recipes = self.load_json(recipes_dir)
+        with self.metrics.phase("load"):
+            if is_columnar(orders_dir):
+                orders = read_orders(orders_dir)
+            else:
+                orders = self.load_json(orders_dir)
+            # Try to load the recipes json
+            if is_columnar(recipes_dir):
+                recipes, recipe_arrays = None, read_recipe_arrays(recipes_dir)
+            elif stream:
+                recipes, recipe_arrays = None, load_recipe_arrays(recipes_dir)
+            else:
+                recipes, recipe_arrays = self.load_json(recipes_dir), None
+        self.set_data(
+            orders=orders, recipes=recipes, recipe_arrays=recipe_arrays
+        )
+
+    def load_snapshot(self, snapshot_dir, mmap=True):
+        """Load orders and recipes from a binary snapshot written by snapshot.write_snapshot.
+        The stock arrays are memory-mapped unless mmap is False, so this takes milliseconds
+        even for large menus. Like stream=True, this only works with the numpy engines.
+        """
+        assert os.path.exists(
+            snapshot_dir
+        ), "Cannot find the snapshot directory, did you specify it correctly?"
+        with self.metrics.phase("load"):
+            snapshot = load_snapshot(snapshot_dir, mmap=mmap)
+        self.set_data(
+            orders=snapshot["orders"],
+            recipe_arrays=snapshot["recipe_arrays"],
+            categories=snapshot["categories"],
+        )
+
+    def set_data(
+        self, *, orders, recipes=None, recipe_arrays=None, categories=None
+    ):
+        """Use order and recipe data that is already in memory, in the same format as the json files.
+        Recipes can be given as stock arrays for each box_type instead, see streaming.load_recipe_arrays.
+        Categories that have already been parsed, e.g. from a snapshot, can be passed in as a dict
+        of {"recipe_categories": {name: number}, "portion_categories": {name: number}}.
+        """
+        assert (recipes is None) != (
+            recipe_arrays is None
+        ), "Either recipes or recipe_arrays must be supplied"
+        self.orders = orders
+        self.recipes = recipes
+        self.recipe_groups = None
+        self.recipe_arrays = recipe_arrays
         # Scrape the distinct categories from the objects
-        self.get_categories_from_json()
-        # Check that vegetarian and gourmet exist as box_type categories
-        for box_type in ["vegetarian", "gourmet"]:
+        with self.metrics.phase("parse_categories"):
+            if categories is None:
+                self.get_categories_from_json()
+            else:
+                self.box_types = list(orders.keys())
+                self.set_category_schema(
+                    CategorySchema.from_numbers(
+                        categories["recipe_categories"],
+                        categories["portion_categories"],
+                    )
+                )
+        # Check that every box_type in the graph exists as a box_type category
+        for box_type in self.box_type_graph:
             assert box_type in self.box_types, (
                 f"Could not find {box_type} as a box_type category. The logic of this algorithm "
-                "requires that vegetarian and gourmet exist as box types."
+                f"requires that every box_type in the graph exists: {list(self.box_type_graph)}"
             )
 
     def get_orders(self):
@@ -64,6 +244,31 @@ class RecipeAllocator:
         """Return the recipes object"""
         return self.recipes
 
+    def get_stock_arrays(self, box_type):
+        """Return the recipe ids (as an object array) and stock (as an int64 array) of the
+        recipes for a box_type
+        """
+        if self.recipe_arrays is not None:
+            arrays = self.recipe_arrays.get(
+                box_type,
+                {"recipe_ids": np.array([], dtype=object), "stock": []},
+            )
+            return arrays["recipe_ids"], np.asarray(
+                arrays["stock"], dtype=np.int64
+            )
+        if self.recipe_groups is None:
+            # Group the recipes in one pass, rather than one pass for every box_type
+            self.recipe_groups = dict()
+            for key, value in self.recipes.items():
+                self.recipe_groups.setdefault(
+                    value.get("box_type"), []
+                ).append(key)
+        recipe_ids = self.recipe_groups.get(box_type, [])
+        stock = [self.recipes[key]["stock_count"] for key in recipe_ids]
+        return np.array(recipe_ids, dtype=object), np.asarray(
+            stock, dtype=np.int64
+        )
+
     def get_categories_from_json(self):
         """Get the distinct recipe categories and the distinct portion categories.
         Doing this ensures that if the number of recipes or portions a customer can specify
@@ -74,56 +279,54 @@ class RecipeAllocator:
         """
         if self.orders is not None and isinstance(self.orders, dict):
             self.box_types = list(self.orders.keys())
-            self.recipe_categories = list(self.orders["gourmet"].keys())
-            # Create a mapping between the recipe word and the recipe number
-            for recipe in self.recipe_categories:
-                try:
-                    self.recipe_categories_dict[recipe] = w2n.word_to_num(
-                        recipe.split("_")[0]
-                    )
-                except ValueError as e:
-                    raise Exception(
-                        f"Couldnt extract the number of recipes from the category. "
-                        f"The logic of this algorithm assumes that category names are "
-                        f"seperated by _ and the first word is the number. E.g. 'two_recipes. "
-                        f"original error message: {e}"
-                    )
-            self.portion_categories = list(
-                self.orders["gourmet"][self.recipe_categories[1]].keys()
-            )
-            # Create a mapping between the portion word and the portion number
-            for portion in self.portion_categories:
-                try:
-                    self.portion_categories_dict[portion] = w2n.word_to_num(
-                        portion.split("_")[0]
-                    )
-                except ValueError as e:
-                    raise Exception(
-                        f"Couldnt extract the number of portions from the category. "
-                        f"The logic of this algorithm assumes that category names are "
-                        f"seperated by _ and the first word is the number. E.g. 'two_portions. "
-                        f"original error message: {e}"
-                    )
+            # Parsing is cached, so this is free if we have seen these categories before
+            self.set_category_schema(get_orders_schema(self.orders))
         else:
             logger.error(
                 "There was a problem obtaining categories from the data, has the data been loaded correctly?"
             )
 
+    def set_category_schema(self, schema):
+        """Use a CategorySchema for the recipe and portion categories"""
+        self.category_schema = schema
+        self.recipe_categories_dict = schema.recipe_categories_dict
+        self.portion_categories_dict = schema.portion_categories_dict
+        self.recipe_categories = list(self.recipe_categories_dict)
+        self.portion_categories = list(self.portion_categories_dict)
+
     @staticmethod
-    @time_function(logger=logger)
     def assign_order_group(
-        *, df_stock, num_portions, num_recipes, num_orders, verbose=True
+        *,
+        df_stock,
+        num_portions,
+        num_recipes,
+        num_orders,
+        verbose=True,
+        metrics=None,
+        stats=None,
+        record=None,
+        stock_log="full",
     ):
         """Work out how many orders we can fullfill, given a list of recipes and their stock
-        numbers, along with the number of portions per order.
+        numbers, along with the number of portions per order. If metrics are supplied, the time
+        spent re-sorting is recorded as the "sort" phase. If a stats dict is supplied, the number
+        of iterations and the number of recipes touched are added to it. If record is supplied,
+        it is called with (orders, recipe_ids) for each fulfilment step. stock_log sets how the
+        stock table is logged when verbose, see utils.logging.StockTable.
         """
+        sort_phase = (
+            metrics.phase("sort") if metrics is not None else NULL_PHASE
+        )
+        stats = stats if stats is not None else dict()
+        stats.setdefault("iterations", 0)
+        stats.setdefault("recipes_touched", 0)
         if verbose:
             logger.info(
                 f"Fulfilling orders for a customer group. Number of portions: {num_portions}, "
                 f"Number of recipes: {num_recipes}, Orders to fulfill: {num_orders}"
             )
             logger.info(f"Stock table: ")
-            logger.info(df_stock)
+            logger.info(StockTable.from_frame(df_stock, mode=stock_log))
         while num_orders != 0:
             # Work out which recipes can fulfill the stock requirement
             df_stock["sufficient_stock"] = df_stock["stock_count"].apply(
@@ -162,117 +365,1005 @@ class RecipeAllocator:
                 df_stock.iloc[i, 0] - fulfillable_orders * num_portions
             )
             # Fulfill the same number of orders with the largest recipes
-            df_stock.iloc[-num_recipes + 1 :, 0] = (
-                df_stock.iloc[-num_recipes + 1 :, 0]
+            tail_start = len(df_stock) - num_recipes + 1
+            df_stock.iloc[tail_start:, 0] = (
+                df_stock.iloc[tail_start:, 0]
                 - fulfillable_orders * num_portions
             )
-            # Re-sort the dataframe
-            df_stock = df_stock.sort_values("stock_count")
+            if record is not None:
+                record(
+                    int(fulfillable_orders),
+                    [df_stock.index[i], *df_stock.index[tail_start:]],
+                )
+            # Re-sort the dataframe. The sort is stable so that recipes with the same
+            # stock always keep their order, which the numpy engine relies on
+            with sort_phase:
+                df_stock = df_stock.sort_values(
+                    "stock_count", kind="mergesort"
+                )
             # Subtract the number of fulfilled orders from the stock requirement
             num_orders = num_orders - fulfillable_orders
+            stats["iterations"] += 1
+            stats["recipes_touched"] += len(df_stock) - tail_start + 1
         # Return the updated stock values for the recipes
         return df_stock[["stock_count", "box_type"]]
 
-    @time_function(logger=logger)
-    def assign_orders(self, *, box_type, excess_stock=None, verbose=True):
+    def plan_recorder(
+        self, box_type, recipe_num, portion_num, recipe_ids=None
+    ):
+        """Return a function that adds fulfilment steps for an order group to the plan of its
+        box_type, or None if no plan is being recorded. If recipe_ids is given, the steps are given the rows
+        of recipe_ids to record, as the numpy engines do.
+        """
+        if not self.record_plan:
+            return None
+        plan = self.box_plans[box_type]
+        if recipe_ids is None:
+            return functools.partial(
+                plan.add, box_type, recipe_num, portion_num
+            )
+
+        def record(orders, rows):
+            plan.add(
+                box_type, recipe_num, portion_num, orders, recipe_ids[rows]
+            )
+
+        return record
+
+    def record_group(self, box_type, recipe_num, portion_num, stats, success):
+        """Keep track of the iterations and recipes touched while allocating an order group,
+        and whether it was fulfilled
+        """
+        self.iterations[(box_type, recipe_num, portion_num)] = stats[
+            "iterations"
+        ]
+        self.fulfilled[(box_type, recipe_num, portion_num)] = success
+        labels = dict(
+            box_type=box_type, recipes=recipe_num, portions=portion_num
+        )
+        self.metrics.increment("iterations", stats["iterations"], **labels)
+        self.metrics.increment(
+            "recipes_touched", stats["recipes_touched"], **labels
+        )
+
+    def get_group_order(self, engine=None):
+        """Return the (recipe_num, portion_num, recipe_category, portion_category) of each
+        customer group in the order they are allocated by an engine. The exact engine does the
+        groups with the most portions first, see allocation_kernel.allocate_group_exact.
+        """
+        if engine == "exact":
+            return self.category_schema.portion_order_groups
+        return self.category_schema.order_groups
+
+    def get_order_groups(self, box_type, engine=None):
+        """Yield (recipe_num, portion_num, orders_to_fulfill) for each customer group of a
+        box_type, in the order they should be allocated. We want to fulfil the largest
+        recipe/portion combinations first as it is the most efficient way to fulfill orders.
+        """
+        orders = self.orders[box_type]
+        # Loop through the recipe and portion categories, starting with the largest of each.
+        for (
+            recipe_num,
+            portion_num,
+            recipe_category,
+            portion_category,
+        ) in self.get_group_order(engine):
+            # Get the orders to fulfill for the recipe and portion combination
+            try:
+                orders_to_fulfill = orders[recipe_category][portion_category]
+            except KeyError as e:
+                raise Exception(
+                    f"recipe: {recipe_category}, portion: {portion_category} does not "
+                    f"exist for the {box_type} customer group. This code assumes that "
+                    f"all customer groups have the same categories. Please change the "
+                    f"way categories are scraped if this is no longer true. Error message: {e}"
+                )
+            yield recipe_num, portion_num, orders_to_fulfill
+
+    @timed_phase("assign_orders")
+    def assign_orders(
+        self,
+        *,
+        box_type,
+        excess_stock=None,
+        leftover=None,
+        verbose=True,
+        engine="pandas",
+    ):
         """Assign recipes to customers for a given box_type, such that no customer
         recieves the same recipe twice. Start by fulfilling the largest orders and portion sizes first.
+        The numpy engine gives the same leftover stock as the pandas engine, but is much faster
+        for large menus. The bulk engine also gives the same leftover stock, but applies many
+        fulfilment steps at once. The exact engine only fails a customer group when no allocation
+        exists for it, and leaves the leftover stock as even as possible (see
+        allocation_kernel.allocate_group_exact), so its leftover stock can differ from the others.
+        It is exact for a single pool of stock but not across box_types that share stock, so
+        allocate falls back on the greedy allocation when it fails.
+
+        Leftover stock from other box_types that these orders can use is added to the recipes,
+        either as an excess_stock DataFrame or as a list of StockLedgers (see ledger.py).
         """
         # Check that the correct inputs have been supplied
         assert (
             box_type in self.acceptable_box_types
         ), f"box_type can only be the following: {self.acceptable_box_types}"
+        assert (
+            engine in self.acceptable_engines
+        ), f"engine can only be the following: {self.acceptable_engines}"
+        assert self.recipes is not None or engine != "pandas", (
+            "The pandas engine needs the recipes as a dict, which streamed data and snapshots "
+            "do not have. Load the json files with stream=False or use one of the numpy engines"
+        )
+        if engine in KERNELS:
+            return self.assign_orders_numpy(
+                box_type=box_type,
+                excess_stock=excess_stock,
+                leftover=leftover,
+                verbose=verbose,
+                engine=engine,
+            )
+        if self.record_plan:
+            self.box_plans[box_type] = AssignmentPlan()
 
-        # Get the recipes for the chosen box_type
-        recipes = {
-            key: value
-            for (key, value) in self.recipes.items()
-            if value.get("box_type") == box_type
-        }
-        # Turn into a DataFrame so that its easier to work with
-        df = pd.DataFrame.from_dict(recipes).transpose()
-        # Add on the leftover stock, if any was supplied
-        if excess_stock is not None:
-            df = df.append(excess_stock[["stock_count", "box_type"]])
-        # Ensure data types are correct
-        df["stock_count"] = pd.to_numeric(df["stock_count"])
-        # Get vegetarian orders
-        orders = self.orders[box_type]
+        # Get the recipes for the chosen box_type, plus the leftover stock, if any was supplied,
+        # and turn them into a DataFrame so that its easier to work with
+        df = self.get_pool(
+            box_type, excess_stock=excess_stock, leftover=leftover
+        ).to_frame()
         # Start with 4 recipes, pair the recipe with the lowest stock with the recipes with the highest stock
-        df = df.sort_values("stock_count")
-
-        # Get the different portion and category options, and order them. We want to
-        # fulfil the largest recipe/portion combinations first as it is the most
-        # efficient way to fulfill orders.
-        recipe_dict = self.recipe_categories_dict
-        recipe_dict_values = list(recipe_dict.values())
-        recipe_dict_values.sort(reverse=True)
-        portion_dict = self.portion_categories_dict
-        portion_dict_values = list(portion_dict.values())
-        portion_dict_values.sort(reverse=True)
+        with self.metrics.phase("sort"):
+            df = df.sort_values("stock_count", kind="mergesort")
+
         # Loop through the recipe and portion categories and assign orders, starting with the largest of each.
-        for recipe_num in recipe_dict_values:
-            for portion_num in portion_dict_values:
-                # Get the recipe and portion categories corresponding to the indexes
-                recipe_category = list(recipe_dict.keys())[
-                    list(recipe_dict.values()).index(recipe_num)
-                ]
-                portion_category = list(portion_dict.keys())[
-                    list(portion_dict.values()).index(portion_num)
-                ]
-                # Get the orders to fulfill for the recipe and portion combination
-                try:
-                    orders_to_fulfill = orders[recipe_category][
-                        portion_category
-                    ]
-                except KeyError as e:
-                    raise Exception(
-                        f"recipe: {recipe_category}, portion: {portion_category} does not "
-                        f"exist for the {box_type} customer group. This code assumes that "
-                        f"all customer groups have the same categories. Please change the "
-                        f"way categories are scraped if this is no longer true. Error message: {e}"
-                    )
+        for (
+            recipe_num,
+            portion_num,
+            orders_to_fulfill,
+        ) in self.get_order_groups(box_type):
+            stats = dict()
+            with self.metrics.phase(
+                "allocate_group",
+                box_type=box_type,
+                recipes=recipe_num,
+                portions=portion_num,
+            ):
                 df = self.assign_order_group(
                     df_stock=df,
                     num_portions=portion_num,
                     num_recipes=recipe_num,
                     num_orders=orders_to_fulfill,
                     verbose=verbose,
+                    metrics=self.metrics,
+                    stats=stats,
+                    stock_log=self.stock_log,
+                    record=self.plan_recorder(
+                        box_type, recipe_num, portion_num
+                    ),
                 )
-                if df is False:
-                    return {"success": False, "excess_stock": None}
+            self.record_group(
+                box_type, recipe_num, portion_num, stats, df is not False
+            )
+            if df is False:
+                return {"success": False, "excess_stock": None}
         logger.info(
             f"{box_type} orders allocated successfully. Returning leftover stock"
         )
         if verbose:
-            logger.info(df)
-        return {"success": True, "excess_stock": df}
+            logger.info(StockTable.from_frame(df, mode=self.stock_log))
+        return {
+            "success": True,
+            "excess_stock": df,
+            "leftover": StockLedger.from_frame(df),
+        }
 
-    @time_function(logger=logger)
-    def run(self, *, orders_dir, recipes_dir):
+    def assign_orders_numpy(
+        self,
+        *,
+        box_type,
+        excess_stock=None,
+        leftover=None,
+        verbose=True,
+        engine="numpy",
+    ):
+        """Same as assign_orders, but the stock is kept in numpy arrays and each order
+        group is allocated with the engine's function in allocation_kernel.KERNELS.
+        """
+        result = self.allocate_pool(
+            box_type=box_type,
+            excess_stock=excess_stock,
+            leftover=leftover,
+            verbose=verbose,
+            engine=engine,
+        )
+        result["excess_stock"] = (
+            result["leftover"].to_frame() if result["success"] else None
+        )
+        return result
+
+    def get_pool(self, box_type, excess_stock=None, leftover=None):
+        """Return a StockLedger of the recipes of a box_type, followed by the leftover stock
+        in an excess_stock DataFrame and a list of StockLedgers
+        """
+        recipe_ids, stock = self.get_stock_arrays(box_type)
+        pool = [StockLedger.from_arrays(recipe_ids, stock, box_type)]
+        if excess_stock is not None:
+            pool.append(StockLedger.from_frame(excess_stock))
+        pool.extend(leftover or [])
+        return StockLedger.concatenate(pool)
+
+    def allocate_pool(
+        self,
+        *,
+        box_type,
+        excess_stock=None,
+        leftover=None,
+        verbose=True,
+        engine="numpy",
+    ):
+        """Allocate the orders of a box_type with a numpy engine, from its own recipes and a
+        list of StockLedgers of leftover stock. Unlike assign_orders_numpy, the result only has
+        the leftover stock as a StockLedger, so pandas is not needed.
+        """
+        # Get the recipes for the chosen box_type, plus any leftover stock
+        pool = self.get_pool(
+            box_type, excess_stock=excess_stock, leftover=leftover
+        )
+        with self.metrics.phase("sort"):
+            pool = pool.sorted()
+        stock, index = pool.stock, pool.index
+        self.pools[box_type] = pool
+        if self.record_plan:
+            self.box_plans[box_type] = AssignmentPlan()
+        self.plan_marks.pop(box_type, None)
+        return self.allocate_groups(
+            box_type=box_type,
+            stock=stock,
+            index=index,
+            verbose=verbose,
+            engine=engine,
+        )
+
+    def allocate_groups(
+        self, *, box_type, stock, index, start=0, verbose=True, engine="numpy"
+    ):
+        """Allocate the order groups of a box_type from the start-th group onwards, given the
+        sorted stock before that group. The stock before each group is kept as a checkpoint in
+        self.checkpoints, so that update can replay the allocation from any group.
+        """
+        allocate = KERNELS[engine]
+        checkpoints = self.checkpoints.setdefault(box_type, [])
+        del checkpoints[start:]
+        checkpoints.append((stock, index))
+        marks = self.plan_marks.setdefault(box_type, [])
+        if self.record_plan:
+            # Remove the steps recorded from this group onwards, which are replayed below
+            plan = self.box_plans[box_type]
+            if start < len(marks):
+                plan.truncate(marks[start])
+            del marks[start:]
+            marks.append(len(plan))
+        for (recipe_num, portion_num, orders_to_fulfill,) in itertools.islice(
+            self.get_order_groups(box_type, engine), start, None
+        ):
+            if verbose:
+                logger.info(
+                    f"Fulfilling orders for a customer group. Number of portions: {portion_num}, "
+                    f"Number of recipes: {recipe_num}, Orders to fulfill: {orders_to_fulfill}"
+                )
+            with self.metrics.phase(
+                "allocate_group",
+                box_type=box_type,
+                recipes=recipe_num,
+                portions=portion_num,
+            ):
+                result = allocate(
+                    stock,
+                    index,
+                    num_portions=portion_num,
+                    num_recipes=recipe_num,
+                    num_orders=orders_to_fulfill,
+                    metrics=self.metrics,
+                    record=self.plan_recorder(
+                        box_type,
+                        recipe_num,
+                        portion_num,
+                        recipe_ids=self.pools[box_type].recipe_ids,
+                    ),
+                )
+            self.record_group(
+                box_type, recipe_num, portion_num, result, result["success"]
+            )
+            if not result["success"]:
+                logger.error(
+                    "There are not enough recipes with sufficient stock to ensure that "
+                    "customers do not get the same recipe twice, aborting."
+                )
+                self.box_results[box_type] = {"success": False}
+                return self.box_results[box_type]
+            stock, index = result["stock"], result["index"]
+            checkpoints.append((stock, index))
+            if self.record_plan:
+                marks.append(len(plan))
+        leftover = self.pools[box_type].with_entries(stock, index)
+        logger.info(
+            f"{box_type} orders allocated successfully. Returning leftover stock"
+        )
+        if verbose:
+            logger.info(StockTable(*leftover.arrays(), mode=self.stock_log))
+        self.box_results[box_type] = {"success": True, "leftover": leftover}
+        return self.box_results[box_type]
+
+    @timed_phase("run")
+    def run(
+        self,
+        *,
+        orders_dir=None,
+        recipes_dir=None,
+        orders=None,
+        recipes=None,
+        recipe_arrays=None,
+        engine="pandas",
+        stream=False,
+        snapshot_dir=None,
+        leftover_dir=None,
+        summary_dir=None,
+    ):
         """Load json files containing recipes and orders and attempt to allocate them. Return True if
-        allocation within the constraints was successful, otherwise return False. Allocate the vegetarian
-        orders first as vegeratians have a smaller pool of options available to them.
+        allocation within the constraints was successful, otherwise return False. The box_types are
+        allocated in the order set by the box_type graph (see scheduler.py), which by default allocates the
+        vegetarian orders first as vegeratians have a smaller pool of options available to them. Use engine="numpy"
+        or engine="bulk" to run the allocation on numpy arrays instead of pandas DataFrames. Orders and
+        recipes that are already in memory can be passed in instead of the json file paths, with the recipes
+        either as a dict or as stock arrays for each box_type (see set_data). Use
+        stream=True with a numpy engine to stream large recipe files (see load_data), or
+        snapshot_dir to load a binary snapshot (see load_snapshot).
+
+        If the allocator was created with a cache, the result of a scenario with the same orders and
+        the same stock values as one seen before is taken from the cache instead. If it was created
+        with record_plan=True, the recipes given to each order are kept in self.plan (see
+        plan.AssignmentPlan). The cache only holds leftover stock and per-group results, so it is not used in that case.
+
+        Orders and recipes can also be read from .csv or .npz files. The leftover stock of a
+        successful run is written to leftover_dir, and a summary of every order group to
+        summary_dir, as .csv or .npz files (see columnar.py).
         """
-        self.load_data(orders_dir=orders_dir, recipes_dir=recipes_dir)
-        # Attempt to allocate all of the vegetarian orders such that no customer receives the same recipe twice
-        veg_result = self.assign_orders(box_type="vegetarian")
-        if veg_result["success"] is False:
-            return False
-        # Attempt to allocate all of the gourmet orders such that no customer receives the same recipe twice
-        gourmet_result = self.assign_orders(
-            box_type="gourmet", excess_stock=veg_result["excess_stock"]
+        with self.metrics.profiling():
+            if orders is not None and (
+                recipes is not None or recipe_arrays is not None
+            ):
+                self.set_data(
+                    orders=orders, recipes=recipes, recipe_arrays=recipe_arrays
+                )
+            elif snapshot_dir is not None:
+                self.load_snapshot(snapshot_dir)
+            else:
+                self.load_data(
+                    orders_dir=orders_dir,
+                    recipes_dir=recipes_dir,
+                    stream=stream,
+                )
+            self.reset_allocation(engine)
+            success = self.allocate_cached(engine)
+            with self.metrics.phase("write"):
+                if leftover_dir is not None and success:
+                    write_leftover(self, leftover_dir)
+                if summary_dir is not None:
+                    write_group_summary(self, summary_dir)
+            return success
+
+    def reset_allocation(self, engine):
+        """Clear the state kept from the last allocation, before allocating with an engine"""
+        self.iterations = dict()
+        self.fulfilled = dict()
+        self.engine = engine
+        self.pools = dict()
+        self.checkpoints = dict()
+        self.box_results = dict()
+        self.leftover = dict()
+        self.leftover_holders = dict()
+        self.plan = AssignmentPlan() if self.record_plan else None
+        self.box_plans = dict()
+        self.plan_marks = dict()
+
+    def allocate_cached(self, engine):
+        """Allocate the loaded orders, using the result in the cache for a scenario that has
+        been seen before, see run
+        """
+        if self.cache is None or self.record_plan:
+            return self.allocate(engine)
+        # Use the cached result if we have seen a scenario with the same stock and orders
+        stock = sorted_stock(self)
+        key = canonical_key(
+            self.orders, stock, self.box_type_graph, engine=engine
+        )
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.metrics.increment("cache_hits")
+            if cached["success"]:
+                self.set_leftover_stock(from_slots(cached["slots"], stock))
+            # Restore the per-group results, so the group summary matches the cached run
+            for *group, iterations, fulfilled in cached.get("groups", []):
+                self.iterations[tuple(group)] = iterations
+                self.fulfilled[tuple(group)] = fulfilled
+            return cached["success"]
+        self.metrics.increment("cache_misses")
+        success = self.allocate(engine)
+        self.cache.put(
+            key,
+            {
+                "success": success,
+                "slots": to_slots(self.leftover_stock, stock)
+                if success
+                else None,
+                "groups": [
+                    [*group, int(iterations), bool(self.fulfilled[group])]
+                    for (group, iterations) in self.iterations.items()
+                ],
+            },
         )
-        # Return the exit status of the gourmet recipe allocation, which is true if all contstraints have been met
-        if gourmet_result["success"]:
+        return success
+
+    def allocate(self, engine="pandas"):
+        """Allocate the loaded orders, see run. The exact engine falls back on the allocation
+        of the greedy bulk engine when it fails and the greedy one does not, see
+        check_against_greedy.
+        """
+        success = self.allocate_all(engine)
+        infeasible = self.precheck and not self.feasibility["feasible"]
+        if (
+            engine == "exact"
+            and not infeasible
+            and (self.cross_check or not success)
+        ):
+            greedy = self.check_against_greedy(success)
+            if not success and greedy.leftover_stock is not None:
+                self.use_allocation(greedy)
+                success = True
+        return success
+
+    def use_allocation(self, other):
+        """Take the allocation of another RecipeAllocator with the same data, and the engine it
+        was made with, so that the group summary and update follow it
+        """
+        for name in [
+            "engine",
+            "iterations",
+            "fulfilled",
+            "pools",
+            "checkpoints",
+            "box_results",
+            "leftover",
+            "leftover_holders",
+            "plan",
+            "box_plans",
+            "plan_marks",
+        ]:
+            setattr(self, name, getattr(other, name))
+        self.set_leftover_stock(other.leftover_stock)
+
+    def allocate_all(self, engine="pandas"):
+        """Allocate the loaded orders with an engine, see run"""
+        if self.precheck:
+            with self.metrics.phase("precheck"):
+                self.feasibility = check_feasibility(self)
+            if not self.feasibility["feasible"]:
+                logger.error(
+                    f"The orders cannot be fulfilled, stopped at the {self.feasibility['box_type']} "
+                    f"group with {self.feasibility['recipe_num']} recipes and "
+                    f"{self.feasibility['portion_num']} portions: {self.feasibility['reason']}"
+                )
+                return False
+        # Attempt to allocate the orders of every box_type such that no customer receives the same
+        # recipe twice, passing the leftover stock on to the box_types that can use it
+        results = run_schedule(
+            self.box_type_graph,
+            functools.partial(self.allocate_box_type, engine=engine),
+            workers=self.workers,
+        )
+        self.merge_plans()
+        # Return True if all constraints have been met for every box_type
+        if len(results) == len(self.box_type_graph) and all(
+            result["success"] for result in results.values()
+        ):
             logger.info(
                 "Allocation successful! Returning true, excess stock can be found in self.excess_stock"
             )
-            self.excess_stock = gourmet_result["excess_stock"]
+            self.set_leftover_stock(self.collect_leftover())
             return True
         else:
             return False
 
+    def check_against_greedy(self, success):
+        """Allocate the same data with the greedy bulk engine and compare it with the result of
+        the exact engine, returning the greedy RecipeAllocator. The exact engine only finds
+        every allocation that exists within a single pool of stock: across box_types that
+        share stock, water-filling one box_type can spread out stock that a later one needed.
+        A greedy success after an exact failure is logged as a warning and counted in the
+        metrics, and allocate then uses the greedy allocation.
+        """
+        greedy = RecipeAllocator(
+            verbose=False,
+            precheck=False,
+            record_plan=self.record_plan,
+            box_type_graph=self.box_type_graph,
+        )
+        greedy.set_data(
+            orders=self.orders,
+            recipes=self.recipes,
+            recipe_arrays=self.recipe_arrays,
+        )
+        greedy.reset_allocation("bulk")
+        with self.metrics.phase("cross_check"):
+            greedy_success = greedy.allocate_all("bulk")
+        self.cross_check_result = {
+            "exact": success,
+            "greedy": greedy_success,
+            "greedy_engine": "bulk",
+        }
+        if greedy_success and not success:
+            self.metrics.increment("cross_check_mismatches")
+            logger.warning(
+                "The exact engine failed to allocate orders that the greedy engine allocated, "
+                "using the greedy allocation"
+            )
+        elif success and not greedy_success:
+            self.metrics.increment("cross_check_rescues")
+            logger.info(
+                "The exact engine allocated orders that the greedy engine could not"
+            )
+        return greedy
+
+    def allocate_box_type(self, box_type, engine="pandas"):
+        """Allocate the orders of a box_type, using the leftover stock of the box_types it
+        depends on, and keep what is left over for the box_types that depend on it
+        """
+        leftover = [
+            self.leftover[dependency]
+            for dependency in self.box_type_graph[box_type]
+        ]
+        if engine in KERNELS:
+            with self.metrics.phase("assign_orders"):
+                result = self.allocate_pool(
+                    box_type=box_type,
+                    leftover=leftover,
+                    verbose=self.verbose,
+                    engine=engine,
+                )
+        else:
+            result = self.assign_orders(
+                box_type=box_type,
+                leftover=leftover,
+                verbose=self.verbose,
+                engine=engine,
+            )
+        self.box_results[box_type] = result
+        if result["success"]:
+            self.store_leftover(box_type, result["leftover"])
+        return result
+
+    def store_leftover(self, box_type, leftover):
+        """Split the leftover stock of a box_type by the box_type each recipe belongs to"""
+        for pool in get_pools(self.box_type_graph, box_type):
+            self.leftover[pool] = leftover.select(pool)
+            self.leftover_holders[pool] = box_type
+
+    def collect_leftover(self):
+        """Return the leftover stock of every recipe as a StockLedger, in the order it was left
+        in by the last box_type to use it
+        """
+        parts = list()
+        for box_type in self.allocation_order:
+            pools = [
+                pool
+                for (pool, holder) in self.leftover_holders.items()
+                if holder == box_type
+            ]
+            if pools:
+                parts.append(
+                    self.box_results[box_type]["leftover"].select(pools)
+                )
+        return StockLedger.concatenate(parts)
+
+    def merge_plans(self):
+        """Combine the plans of each box_type into self.plan, in allocation order"""
+        if self.record_plan:
+            self.plan = AssignmentPlan.concatenate(
+                self.box_plans[box_type]
+                for box_type in self.allocation_order
+                if box_type in self.box_plans
+            )
+
+    def apply_order_deltas(self, order_deltas):
+        """Add order_deltas, in the same format as the orders json, to the loaded orders. Returns
+        the position of the first order group that changed for each box_type.
+        """
+        group_positions = {
+            (recipe_category, portion_category): position
+            for position, (
+                _,
+                _,
+                recipe_category,
+                portion_category,
+            ) in enumerate(self.get_group_order(self.engine))
+        }
+        starts = dict()
+        new_orders = list()
+        # Check every change before applying any of them
+        for box_type, recipe_categories in order_deltas.items():
+            for recipe_category, portions in recipe_categories.items():
+                for portion_category, delta in portions.items():
+                    group = f"{box_type}/{recipe_category}/{portion_category}"
+                    assert (
+                        recipe_category,
+                        portion_category,
+                    ) in group_positions, f"{group} is not an order group"
+                    orders = self.orders[box_type][recipe_category]
+                    new_count = orders[portion_category] + delta
+                    assert (
+                        new_count >= 0
+                    ), f"{group} cannot have fewer than 0 orders"
+                    new_orders.append((orders, portion_category, new_count))
+                    position = group_positions[
+                        (recipe_category, portion_category)
+                    ]
+                    starts[box_type] = min(
+                        starts.get(box_type, position), position
+                    )
+        for orders, portion_category, new_count in new_orders:
+            orders[portion_category] = new_count
+        return starts
+
+    def apply_stock_deltas(self, stock_deltas):
+        """Add stock_deltas, a dict of {recipe_id: change in stock_count}, to the loaded recipes.
+        Returns a dict of {box_type: {recipe_id: change}} for the box_types that changed.
+        """
+        changes = dict()
+        if self.recipes is not None:
+            new_recipes = dict()
+            # Check every change before applying any of them
+            for recipe_id, delta in stock_deltas.items():
+                assert recipe_id in self.recipes, f"Unknown recipe {recipe_id}"
+                recipe = self.recipes[recipe_id]
+                new_stock = int(recipe["stock_count"]) + delta
+                assert (
+                    new_stock >= 0
+                ), f"Recipe {recipe_id} cannot have less than 0 stock"
+                new_recipes[recipe_id] = dict(recipe, stock_count=new_stock)
+                changes.setdefault(recipe["box_type"], dict())[
+                    recipe_id
+                ] = delta
+            self.recipes.update(new_recipes)
+            return changes
+        found = set()
+        new_arrays = dict()
+        for box_type, arrays in self.recipe_arrays.items():
+            rows = np.flatnonzero(
+                np.isin(arrays["recipe_ids"], list(stock_deltas))
+            )
+            if len(rows) == 0:
+                continue
+            recipe_ids = arrays["recipe_ids"][rows].tolist()
+            deltas = np.array([stock_deltas[key] for key in recipe_ids])
+            # The arrays may be read-only, e.g. memory-mapped from a snapshot
+            stock = np.array(arrays["stock"], dtype=np.int64)
+            stock[rows] += deltas
+            assert (
+                stock[rows] >= 0
+            ).all(), "Recipes cannot have less than 0 stock"
+            new_arrays[box_type] = dict(arrays, stock=stock)
+            changes[box_type] = dict(zip(recipe_ids, deltas.tolist()))
+            found.update(recipe_ids)
+        missing = set(stock_deltas) - found
+        assert not missing, f"Unknown recipes {sorted(missing)}"
+        self.recipe_arrays.update(new_arrays)
+        return changes
+
+    def update(self, *, stock_deltas=None, order_deltas=None, verbose=True):
+        """Update the last allocation after a change to the stock of some recipes or to the
+        number of orders in some order groups, without starting again from scratch. The result
+        is the same as calling run again with the changed data.
+
+        stock_deltas is a dict of {recipe_id: change in stock_count}, and order_deltas holds the
+        change in orders in the same format as the orders json. The loaded recipes and orders are
+        updated in place, unless a change is invalid, in which case an AssertionError is raised
+        and nothing is changed. The allocation is replayed from the first order group that changed,
+        starting from the stock checkpoint kept before it. A change to a box_type means the
+        box_types that use its leftover stock are allocated again too, e.g. a change to a
+        vegetarian recipe or order group means the gourmet orders are allocated again. Only works
+        after a run with one of the numpy engines.
+        """
+        assert (
+            self.engine in KERNELS
+        ), f"update needs a previous run with one of these engines: {list(KERNELS)}"
+        with self.metrics.phase("update"):
+            order_deltas = order_deltas or dict()
+            starts = self.apply_order_deltas(order_deltas)
+            try:
+                stock_changes = self.apply_stock_deltas(stock_deltas or dict())
+            except AssertionError:
+                # Undo the order changes, so that nothing changes if the update is invalid
+                self.apply_order_deltas(
+                    {
+                        box_type: {
+                            recipe_category: {
+                                portion_category: -delta
+                                for (
+                                    portion_category,
+                                    delta,
+                                ) in portions.items()
+                            }
+                            for (
+                                recipe_category,
+                                portions,
+                            ) in recipe_categories.items()
+                        }
+                        for (
+                            box_type,
+                            recipe_categories,
+                        ) in order_deltas.items()
+                    }
+                )
+                raise
+            # The box_types whose leftover stock has changed
+            changed_pools = set()
+            self.leftover = dict()
+            self.leftover_holders = dict()
+            for box_type in self.allocation_order:
+                checkpoints = self.checkpoints.get(box_type)
+                result = self.box_results.get(box_type)
+                dependencies = self.box_type_graph[box_type]
+                changed = True
+                if changed_pools.intersection(dependencies) or not checkpoints:
+                    # The leftover stock this box_type uses changed, or it never ran
+                    result = self.allocate_pool(
+                        box_type=box_type,
+                        leftover=[
+                            self.leftover[dependency]
+                            for dependency in dependencies
+                        ],
+                        verbose=verbose,
+                        engine=self.engine,
+                    )
+                else:
+                    start = starts.get(box_type)
+                    if box_type in stock_changes:
+                        # Move the changed recipes in the sorted stock we started with
+                        recipe_ids = self.pools[box_type].recipe_ids
+                        deltas = stock_changes[box_type]
+                        rows = np.flatnonzero(
+                            np.isin(recipe_ids, list(deltas))
+                        )
+                        with self.metrics.phase("sort"):
+                            checkpoints[0] = restock(
+                                *checkpoints[0],
+                                rows,
+                                [deltas[key] for key in recipe_ids[rows]],
+                            )
+                        start = 0
+                    if start is None and result["success"]:
+                        changed = False
+                    else:
+                        # Replay from the first changed group, or from the group that failed
+                        start = min(
+                            start if start is not None else len(checkpoints),
+                            len(checkpoints) - 1,
+                        )
+                        stock, index = checkpoints[start]
+                        result = self.allocate_groups(
+                            box_type=box_type,
+                            stock=stock,
+                            index=index,
+                            start=start,
+                            verbose=verbose,
+                            engine=self.engine,
+                        )
+                if not result["success"]:
+                    if self.engine == "exact":
+                        # Allocate from scratch, so the exact engine can fall back on the
+                        # greedy allocation as it does in run
+                        self.excess_stock = None
+                        self.reset_allocation(self.engine)
+                        return self.allocate(self.engine)
+                    self.merge_plans()
+                    self.excess_stock = None
+                    return False
+                self.store_leftover(box_type, result["leftover"])
+                # The box_types that use this leftover stock only need allocating again if it
+                # changed
+                if changed:
+                    changed_pools.update(
+                        get_pools(self.box_type_graph, box_type)
+                    )
+        self.merge_plans()
+        self.set_leftover_stock(self.collect_leftover())
+        return True
+
+    @staticmethod
+    def get_schema_key(orders, recipes):
+        """Return a hashable key describing the recipes and categories of a scenario. Scenarios
+        with the same key can be stacked together and allocated at the same time.
+        """
+        recipe_key = tuple(
+            (recipe_id, recipe["box_type"])
+            for (recipe_id, recipe) in recipes.items()
+        )
+        order_key = tuple(
+            (box_type, recipe_category, tuple(portions.keys()))
+            for (box_type, recipe_categories) in orders.items()
+            for (recipe_category, portions) in recipe_categories.items()
+        )
+        return recipe_key, order_key
+
+    @timed_phase("run_batch")
+    def run_batch(self, scenarios):
+        """Attempt to allocate many (orders, recipes) scenarios in one call.
+
+        `scenarios` is either a list of dicts with "orders" and "recipes" keys, holding data in
+        the same format as the json files, or a single dict of that form where every order count
+        and stock_count is an array with one value per scenario. Scenarios that share the same
+        recipes and categories are stacked together, so the categories are only parsed once and
+        every order group is allocated for all of them at the same time.
+
+        Returns a DataFrame with one row per scenario, containing a success flag and the leftover
+        stock of each recipe (NaN if the allocation failed).
+        """
+        if isinstance(scenarios, dict):
+            return self.run_stacked(
+                orders=scenarios["orders"], recipes=scenarios["recipes"]
+            )
+        # Group together the scenarios that share the same schema
+        schemas = dict()
+        for i, scenario in enumerate(scenarios):
+            key = self.get_schema_key(scenario["orders"], scenario["recipes"])
+            schemas.setdefault(key, []).append(i)
+        results = list()
+        for positions in schemas.values():
+            group = [scenarios[i] for i in positions]
+            orders = stack_orders([scenario["orders"] for scenario in group])
+            recipes = {
+                recipe_id: {
+                    "stock_count": np.array(
+                        [
+                            scenario["recipes"][recipe_id]["stock_count"]
+                            for scenario in group
+                        ]
+                    ),
+                    "box_type": recipe["box_type"],
+                }
+                for (recipe_id, recipe) in group[0]["recipes"].items()
+            }
+            result = self.run_stacked(orders=orders, recipes=recipes)
+            result.index = positions
+            results.append(result)
+        import pandas as pd
+
+        return pd.concat(results).sort_index()
+
+    def run_stacked(self, *, orders, recipes):
+        """Allocate scenarios where every order count and stock_count is an array with one value
+        per scenario (single values are used for every scenario). See run_batch.
+        """
+        import pandas as pd
+
+        self.set_data(orders=orders, recipes=recipes)
+        recipe_ids = list(recipes.keys())
+        box_types = np.array(
+            [recipe["box_type"] for recipe in recipes.values()], dtype=object
+        )
+        n_scenarios = max(
+            [np.size(recipe["stock_count"]) for recipe in recipes.values()]
+            + [
+                np.size(orders_to_fulfill)
+                for box_type in self.allocation_order
+                for (_, _, orders_to_fulfill) in self.get_order_groups(
+                    box_type
+                )
+            ]
+        )
+        stock = np.stack(
+            [
+                np.broadcast_to(
+                    np.asarray(recipe["stock_count"], dtype=np.int64),
+                    (n_scenarios,),
+                )
+                for recipe in recipes.values()
+            ],
+            axis=1,
+        )
+        result = self.allocate_stacked(stock, box_types)
+        df = pd.DataFrame(result["excess_stock"], columns=recipe_ids)
+        df.insert(0, "success", result["success"])
+        logger.info(
+            f"Allocated {n_scenarios} scenarios, {result['success'].sum()} were successful"
+        )
+        return df
+
+    def allocate_stacked(self, stock, box_types):
+        """Allocate the orders that have been loaded with many stock scenarios at once. stock is
+        a 2D array with one row per scenario and one column per recipe, and box_types holds the
+        box_type of each column. Returns {"success", "excess_stock"}, where excess_stock has the
+        same shape as stock and is NaN for the scenarios that failed.
+        """
+        stock = np.asarray(stock, dtype=np.int64)
+        box_types = np.asarray(box_types, dtype=object)
+        n_scenarios = len(stock)
+        success = np.ones(n_scenarios, dtype=bool)
+        # The leftover (stock, index) of the recipes of each box_type
+        leftover = dict()
+        for box_type in self.allocation_order:
+            # Get the recipes for the box_type, plus the leftover stock of its dependencies
+            columns = np.flatnonzero(box_types == box_type)
+            pools = [
+                (
+                    stock[:, columns],
+                    np.broadcast_to(columns, (n_scenarios, len(columns))),
+                )
+            ]
+            pools += [
+                leftover[dependency]
+                for dependency in self.box_type_graph[box_type]
+            ]
+            box_stock = np.hstack([pool_stock for (pool_stock, _) in pools])
+            box_index = np.hstack([pool_index for (_, pool_index) in pools])
+            order = np.argsort(box_stock, axis=1, kind="stable")
+            box_stock = np.take_along_axis(box_stock, order, axis=1)
+            box_index = np.take_along_axis(box_index, order, axis=1)
+            for (
+                recipe_num,
+                portion_num,
+                orders_to_fulfill,
+            ) in self.get_order_groups(box_type):
+                # Scenarios that have already failed have nothing left to fulfill
+                orders_to_fulfill = np.where(
+                    success,
+                    np.broadcast_to(orders_to_fulfill, (n_scenarios,)),
+                    0,
+                )
+                result = allocate_group_batch(
+                    box_stock,
+                    box_index,
+                    num_portions=portion_num,
+                    num_recipes=recipe_num,
+                    num_orders=orders_to_fulfill,
+                )
+                success &= result["success"]
+                box_stock, box_index = result["stock"], result["index"]
+            # Every row has the same number of recipes from each box_type, so the leftover
+            # stock can be split up by box_type without changing the order of each row
+            for pool in get_pools(self.box_type_graph, box_type):
+                mask = box_types[box_index] == pool
+                leftover[pool] = (
+                    box_stock[mask].reshape(n_scenarios, -1),
+                    box_index[mask].reshape(n_scenarios, -1),
+                )
+        # Put the leftover stock back in the same order as the recipes
+        excess_stock = np.full(stock.shape, np.nan)
+        for pool_stock, pool_index in leftover.values():
+            np.put_along_axis(excess_stock, pool_index, pool_stock, axis=1)
+        excess_stock[~success] = np.nan
+        return {"success": success, "excess_stock": excess_stock}
+
+
+def stack_orders(orders_list):
+    """Combine a list of orders objects with the same categories into a single orders
+    object, where each order count is an array with one value per scenario
+    """
+    return {
+        box_type: {
+            recipe_category: {
+                portion_category: np.array(
+                    [
+                        orders[box_type][recipe_category][portion_category]
+                        for orders in orders_list
+                    ]
+                )
+                for portion_category in portions.keys()
+            }
+            for (recipe_category, portions) in recipe_categories.items()
+        }
+        for (box_type, recipe_categories) in orders_list[0].items()
+    }
+
 
 if __name__ == "__main__":
     ra = RecipeAllocator()
@@ -0,0 +1,186 @@
+"""Run many allocation scenarios in parallel across worker processes.
+
+Scenarios are either generated by DataGenerator from a seed, or loaded from pairs of
+orders/recipes json files. Each worker process creates one RecipeAllocator when it starts
+and reuses it for every scenario it is given.
+
+Example:
+    python -m gousto_test.parallel --scenarios 1000 --seed 42 --workers 32 --output sweep.jsonl
+"""
+import argparse
+import json
+import logging
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from gousto_test.generate_data import DataGenerator
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.utils.logging import get_logger
+
+logger = get_logger()
+
+# The allocator used by this worker process, created by init_worker
+allocator = None
+engine = None
+
+
+def init_worker(worker_engine="bulk", quiet=True):
+    """Create the RecipeAllocator that this worker process will reuse for all of its scenarios"""
+    global allocator, engine
+    allocator = RecipeAllocator(verbose=False)
+    engine = worker_engine
+    if quiet:
+        logger.setLevel(logging.WARNING)
+
+
+def scenario_seed(seed, scenario):
+    """Derive the seed for a single scenario from the seed for the whole run, so that every
+    scenario gets the same data no matter which worker runs it
+    """
+    return int(
+        np.random.SeedSequence(seed, spawn_key=(scenario,)).generate_state(1)[
+            0
+        ]
+    )
+
+
+def make_tasks(
+    *, n_scenarios=None, seed=0, scenario_files=None, generator_kwargs=None
+):
+    """Create the list of scenarios to solve. Either generate n_scenarios with DataGenerator,
+    or use a list of (orders_dir, recipes_dir) tuples
+    """
+    if scenario_files is not None:
+        return [
+            {
+                "scenario": i,
+                "orders_dir": orders_dir,
+                "recipes_dir": recipes_dir,
+            }
+            for i, (orders_dir, recipes_dir) in enumerate(scenario_files)
+        ]
+    assert (
+        n_scenarios is not None
+    ), "Either n_scenarios or scenario_files must be supplied"
+    return [
+        {
+            "scenario": i,
+            "seed": scenario_seed(seed, i),
+            "generator_kwargs": generator_kwargs or dict(),
+        }
+        for i in range(n_scenarios)
+    ]
+
+
+def count_recipes(allocator):
+    """Count the recipes loaded into an allocator, whether as a dict or as stock arrays"""
+    if allocator.recipe_arrays is not None:
+        return sum(
+            len(arrays["stock"]) for arrays in allocator.recipe_arrays.values()
+        )
+    return len(allocator.recipes)
+
+
+def solve_scenario(task):
+    """Generate or load the data for a scenario and attempt to allocate it"""
+    if allocator is None:
+        init_worker()
+    if "seed" in task:
+        generator = DataGenerator(
+            rng=random.Random(task["seed"]), **task["generator_kwargs"]
+        )
+        recipes = generator.generate_recipes()
+        orders = generator.generate_orders()
+        success = allocator.run(orders=orders, recipes=recipes, engine=engine)
+    else:
+        success = allocator.run(
+            orders_dir=task["orders_dir"],
+            recipes_dir=task["recipes_dir"],
+            engine=engine,
+        )
+    result = {key: task[key] for key in ["scenario", "seed"] if key in task}
+    result["success"] = success
+    result["n_recipes"] = count_recipes(allocator)
+    result["leftover_stock"] = (
+        int(allocator.excess_stock["stock_count"].sum()) if success else None
+    )
+    return result
+
+
+def run_scenarios(
+    *,
+    n_scenarios=None,
+    seed=0,
+    scenario_files=None,
+    generator_kwargs=None,
+    workers=None,
+    chunksize=1,
+    engine="bulk",
+):
+    """Solve scenarios across a pool of worker processes, yielding the results in scenario
+    order. The results for a given seed are always the same, whatever the number of workers.
+    """
+    tasks = make_tasks(
+        n_scenarios=n_scenarios,
+        seed=seed,
+        scenario_files=scenario_files,
+        generator_kwargs=generator_kwargs,
+    )
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(engine,)
+    ) as executor:
+        yield from executor.map(solve_scenario, tasks, chunksize=chunksize)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Run allocation scenarios in parallel"
+    )
+    parser.add_argument(
+        "--scenarios",
+        type=int,
+        default=100,
+        help="Number of scenarios to generate",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--files",
+        nargs="+",
+        help="Scenarios to load instead of generating them, as orders.json:recipes.json pairs",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=1)
+    parser.add_argument(
+        "--engine",
+        default="bulk",
+        choices=RecipeAllocator().acceptable_engines,
+    )
+    parser.add_argument(
+        "--output", help="File to write json lines to, defaults to stdout"
+    )
+    args = parser.parse_args(args)
+    scenario_files = (
+        [tuple(pair.split(":")) for pair in args.files] if args.files else None
+    )
+    results = run_scenarios(
+        n_scenarios=args.scenarios,
+        seed=args.seed,
+        scenario_files=scenario_files,
+        workers=args.workers,
+        chunksize=args.chunksize,
+        engine=args.engine,
+    )
+    f_out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for result in results:
+            f_out.write(json.dumps(result) + "\n")
+    finally:
+        if args.output:
+            f_out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Record which recipes were given to which orders during an allocation.
+
+Every fulfilment step pairs a set of distinct recipes with a number of orders from one
+customer group, and is stored as one row of an AssignmentPlan. The rows are kept in
+append-only typed arrays, with box_types and recipe ids interned as integer codes, so a plan
+for millions of orders stays small. Plans can be saved as csv, npz or json lines, and expanded
+into one row per order with a generator.
+"""
+import csv
+import json
+from array import array
+
+import numpy as np
+
+
+class AssignmentPlan:
+    """The fulfilment steps of an allocation, stored as columns"""
+
+    def __init__(self):
+        self.box_types = list()
+        self.box_type_codes = dict()
+        self.recipe_ids = list()
+        self.recipe_codes = dict()
+        self.box_type = array("B")
+        self.recipe_num = array("q")
+        self.portion_num = array("q")
+        self.orders = array("q")
+        # Where each step's recipes start in step_recipes
+        self.recipe_start = array("q")
+        self.step_recipes = array("q")
+
+    def __len__(self):
+        return len(self.orders)
+
+    def intern(self, value, values, codes):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def add(self, box_type, recipe_num, portion_num, orders, recipe_ids):
+        """Record that `orders` orders of a customer group were each given the recipes in
+        recipe_ids
+        """
+        self.box_type.append(
+            self.intern(box_type, self.box_types, self.box_type_codes)
+        )
+        self.recipe_num.append(recipe_num)
+        self.portion_num.append(portion_num)
+        self.orders.append(int(orders))
+        self.recipe_start.append(len(self.step_recipes))
+        self.step_recipes.extend(
+            self.intern(str(recipe_id), self.recipe_ids, self.recipe_codes)
+            for recipe_id in recipe_ids
+        )
+
+    def extend(self, other):
+        """Add every step of another plan to the end of this one"""
+        box_type_codes = np.array(
+            [
+                self.intern(box_type, self.box_types, self.box_type_codes)
+                for box_type in other.box_types
+            ],
+            dtype=np.int64,
+        )
+        recipe_codes = np.array(
+            [
+                self.intern(recipe_id, self.recipe_ids, self.recipe_codes)
+                for recipe_id in other.recipe_ids
+            ],
+            dtype=np.int64,
+        )
+        columns = other.columns()
+        offset = len(self.step_recipes)
+        self.box_type.extend(box_type_codes[columns["box_type"]].tolist())
+        self.recipe_num.extend(other.recipe_num)
+        self.portion_num.extend(other.portion_num)
+        self.orders.extend(other.orders)
+        self.recipe_start.extend((columns["recipe_start"] + offset).tolist())
+        self.step_recipes.extend(
+            recipe_codes[columns["step_recipes"]].tolist()
+        )
+
+    @classmethod
+    def concatenate(cls, plans):
+        """Return a plan with the steps of each of the plans in turn"""
+        plan = cls()
+        for other in plans:
+            plan.extend(other)
+        return plan
+
+    def truncate(self, length):
+        """Remove every step after the first `length`"""
+        if length >= len(self):
+            return
+        del self.step_recipes[self.recipe_start[length] :]
+        for column in [
+            self.box_type,
+            self.recipe_num,
+            self.portion_num,
+            self.orders,
+            self.recipe_start,
+        ]:
+            del column[length:]
+
+    def columns(self):
+        """Return the plan as a dict of numpy arrays. The recipes of step i are
+        recipe_ids[step_recipes[recipe_start[i]:recipe_start[i] + recipe_num[i]]]
+        """
+        return {
+            "box_types": np.array(self.box_types, dtype=str),
+            "recipe_ids": np.array(self.recipe_ids, dtype=str),
+            "box_type": np.frombuffer(self.box_type, dtype=np.uint8),
+            "recipe_num": np.frombuffer(self.recipe_num, dtype=np.int64),
+            "portion_num": np.frombuffer(self.portion_num, dtype=np.int64),
+            "orders": np.frombuffer(self.orders, dtype=np.int64),
+            "recipe_start": np.frombuffer(self.recipe_start, dtype=np.int64),
+            "step_recipes": np.frombuffer(self.step_recipes, dtype=np.int64),
+        }
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Create a plan from the arrays returned by columns, e.g. loaded from an npz file"""
+        plan = cls()
+        plan.box_types = columns["box_types"].tolist()
+        plan.box_type_codes = {
+            value: code for code, value in enumerate(plan.box_types)
+        }
+        plan.recipe_ids = columns["recipe_ids"].tolist()
+        plan.recipe_codes = {
+            value: code for code, value in enumerate(plan.recipe_ids)
+        }
+        for name, typecode in [
+            ("box_type", "B"),
+            ("recipe_num", "q"),
+            ("portion_num", "q"),
+            ("orders", "q"),
+            ("recipe_start", "q"),
+            ("step_recipes", "q"),
+        ]:
+            setattr(plan, name, array(typecode, columns[name].tolist()))
+        return plan
+
+    def steps(self):
+        """Yield a dict for each step"""
+        for i in range(len(self)):
+            start = self.recipe_start[i]
+            yield {
+                "box_type": self.box_types[self.box_type[i]],
+                "recipe_num": self.recipe_num[i],
+                "portion_num": self.portion_num[i],
+                "orders": self.orders[i],
+                "recipe_ids": [
+                    self.recipe_ids[code]
+                    for code in self.step_recipes[
+                        start : start + self.recipe_num[i]
+                    ]
+                ],
+            }
+
+    def iter_orders(self):
+        """Yield a dict for every order, numbered from 0 within each customer group"""
+        numbers = dict()
+        for step in self.steps():
+            group = (step["box_type"], step["recipe_num"], step["portion_num"])
+            first = numbers.get(group, 0)
+            numbers[group] = first + step["orders"]
+            for order in range(first, first + step["orders"]):
+                yield {
+                    "box_type": step["box_type"],
+                    "recipe_num": step["recipe_num"],
+                    "portion_num": step["portion_num"],
+                    "order": order,
+                    "recipe_ids": step["recipe_ids"],
+                }
+
+    def save_npz(self, file_path):
+        np.savez(file_path, **self.columns())
+
+    @classmethod
+    def load_npz(cls, file_path):
+        with np.load(file_path) as columns:
+            return cls.from_columns(columns)
+
+    def save_csv(self, file_path):
+        """Save one row per step, with the recipe ids separated by semicolons"""
+        with open(file_path, "w", newline="") as f_out:
+            writer = csv.writer(f_out)
+            writer.writerow(
+                [
+                    "box_type",
+                    "recipe_num",
+                    "portion_num",
+                    "orders",
+                    "recipe_ids",
+                ]
+            )
+            for step in self.steps():
+                writer.writerow(
+                    [
+                        step["box_type"],
+                        step["recipe_num"],
+                        step["portion_num"],
+                        step["orders"],
+                        ";".join(step["recipe_ids"]),
+                    ]
+                )
+
+    def save_jsonl(self, file_path, per_order=False):
+        """Save one json object per step, or per order if per_order is True"""
+        rows = self.iter_orders() if per_order else self.steps()
+        with open(file_path, "w") as f_out:
+            for row in rows:
+                f_out.write(json.dumps(row) + "\n")
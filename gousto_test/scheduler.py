@@ -0,0 +1,109 @@
+"""Work out the order box_types are allocated in, and run them concurrently where possible.
+
+Which box_types can use each other's leftover stock is declared as a graph of
+{box_type: [box_types whose leftover stock it can use]}. The default is the original rule,
+where gourmet orders can use the vegetarian recipes that are left over once the vegetarian
+orders have been allocated.
+
+Each box_type draws from the pools of stock of its own recipes and of the box_types it
+depends on. A box_type is allocated after the box_types it depends on. Box_types that draw
+from the same pool are allocated one after the other, in the order they were declared, so
+the result is always the same. Box_types that do not share a pool are independent and can
+be allocated at the same time.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+DEFAULT_BOX_TYPE_GRAPH = {"vegetarian": [], "gourmet": ["vegetarian"]}
+
+
+def validate_graph(graph):
+    """Check that every dependency is a box_type in the graph, and there are no cycles"""
+    for box_type, dependencies in graph.items():
+        for dependency in dependencies:
+            assert dependency in graph, (
+                f"{box_type} depends on {dependency}, which is not a box_type in the "
+                f"graph: {list(graph)}"
+            )
+            assert (
+                dependency != box_type
+            ), f"{box_type} cannot depend on itself"
+    # Raises if there is a cycle
+    get_allocation_order(graph)
+
+
+def get_allocation_order(graph):
+    """Return the box_types in the order they are allocated: every box_type comes after the
+    box_types it depends on, and otherwise they are kept in the order they were declared
+    """
+    order = list()
+    remaining = list(graph)
+    while remaining:
+        ready = [
+            box_type
+            for box_type in remaining
+            if all(dependency in order for dependency in graph[box_type])
+        ]
+        assert ready, f"The box_type graph has a cycle between {remaining}"
+        order.append(ready[0])
+        remaining.remove(ready[0])
+    return order
+
+
+def get_pools(graph, box_type):
+    """Return the box_types whose stock a box_type can use, starting with its own"""
+    return [box_type] + [
+        dependency for dependency in graph[box_type] if dependency != box_type
+    ]
+
+
+def get_waits(graph):
+    """Return {box_type: [box_types that must be allocated before it]}, which are the earlier
+    box_types that use any of the same pools of stock
+    """
+    order = get_allocation_order(graph)
+    pools = {box_type: set(get_pools(graph, box_type)) for box_type in order}
+    return {
+        box_type: [
+            earlier
+            for earlier in order[:i]
+            if pools[earlier] & pools[box_type]
+        ]
+        for (i, box_type) in enumerate(order)
+    }
+
+
+def run_schedule(graph, allocate, workers=1):
+    """Call allocate(box_type) for every box_type in the graph, with each one starting once
+    the box_types it waits for have finished (see get_waits). allocate returns a result dict
+    with a "success" key, and once one fails no more box_types are started.
+
+    With workers > 1, independent box_types are allocated at the same time in a thread pool.
+    Returns {box_type: result} for the box_types that were allocated.
+    """
+    order = get_allocation_order(graph)
+    waits = get_waits(graph)
+    results = dict()
+    if workers <= 1:
+        for box_type in order:
+            results[box_type] = allocate(box_type)
+            if not results[box_type]["success"]:
+                break
+        return results
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = dict()
+        pending = list(order)
+        failed = False
+        while pending or running:
+            if not failed:
+                for box_type in list(pending):
+                    if all(earlier in results for earlier in waits[box_type]):
+                        pending.remove(box_type)
+                        running[executor.submit(allocate, box_type)] = box_type
+            if not running:
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                box_type = running.pop(future)
+                results[box_type] = future.result()
+                failed = failed or not results[box_type]["success"]
+    return results
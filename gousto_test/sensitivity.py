@@ -0,0 +1,173 @@
+"""Find the least extra stock that would let orders that cannot be allocated be allocated.
+
+For every recipe, or every box_type, the smallest amount of extra stock that makes the
+greedy allocation succeed is found by bisection, with the stock of everything else unchanged.
+Each step of the bisection tries one amount for every recipe that is still being searched at
+once, as one stock scenario per recipe in RecipeAllocator.allocate_stacked, so the orders
+and categories are only parsed once and a step costs a single batched allocation.
+
+The search starts from a lower bound given by the total stock check in feasibility.py: the
+recipes a box_type can use must hold at least the portions demanded from them, so a recipe
+must make up the shortfall of every box_type that can use it, and cannot help at all if some
+box_type that cannot use it is short. It ends at the most portions the recipe could supply,
+one to each order that can use it. The greedy allocation is not guaranteed to succeed more
+often with more stock, but the amount returned is always one that succeeds.
+"""
+import numpy as np
+
+from gousto_test.scheduler import get_pools
+from gousto_test.utils.logging import get_logger
+
+logger = get_logger()
+
+# The most values in the stock scenarios of a single bisection step
+MAX_CELLS = 2**22
+
+
+def get_shortfalls(allocator, stock, box_types):
+    """Return {box_type: (shortfall, usable)}, where shortfall is how many more portions the
+    recipes a box_type can use need to hold for the total stock check to pass, and usable is
+    the most portions a single recipe of the box_type could supply to the orders
+    """
+    graph = allocator.box_type_graph
+    pools = {
+        box_type: set(get_pools(graph, box_type))
+        for box_type in allocator.allocation_order
+    }
+    demanded, order_portions = dict(), dict()
+    for box_type in allocator.allocation_order:
+        demanded[box_type] = order_portions[box_type] = 0
+        for (
+            recipe_num,
+            portion_num,
+            orders_to_fulfill,
+        ) in allocator.get_order_groups(box_type):
+            demanded[box_type] += recipe_num * portion_num * orders_to_fulfill
+            order_portions[box_type] += portion_num * orders_to_fulfill
+    shortfalls = dict()
+    for box_type in allocator.allocation_order:
+        # Every box_type that can only use these recipes needs its portions from them
+        needed = sum(
+            demanded[other]
+            for other in pools
+            if pools[other] <= pools[box_type]
+        )
+        in_stock = int(stock[np.isin(box_types, list(pools[box_type]))].sum())
+        usable = sum(
+            order_portions[other]
+            for other in pools
+            if box_type in pools[other]
+        )
+        shortfalls[box_type] = (max(needed - in_stock, 0), usable)
+    return shortfalls
+
+
+def stock_sensitivity(allocator, *, by="recipe"):
+    """Find the least extra stock of each recipe (by="recipe") or of every recipe of each
+    box_type (by="box_type") that lets the orders loaded into a RecipeAllocator be allocated
+    by the greedy allocation.
+
+    Returns a DataFrame with a row for each recipe or box_type, ranked by the extra stock
+    needed. "extra_stock" is the extra stock of each recipe (NaN if it cannot help on its own)
+    and "lower_bound" is the least amount that could possibly help. With by="box_type" every
+    recipe of the box_type gets the extra stock, and "total_extra_stock" adds it up.
+    """
+    import pandas as pd
+
+    assert by in ["recipe", "box_type"], "by must be either recipe or box_type"
+    recipe_ids, stock, box_types = list(), list(), list()
+    for box_type in allocator.allocation_order:
+        box_recipe_ids, box_stock = allocator.get_stock_arrays(box_type)
+        recipe_ids.append(box_recipe_ids)
+        stock.append(box_stock)
+        box_types.append(np.full(len(box_stock), box_type, dtype=object))
+    recipe_ids = np.concatenate(recipe_ids)
+    stock = np.concatenate(stock)
+    box_types = np.concatenate(box_types)
+    shortfalls = get_shortfalls(allocator, stock, box_types)
+    graph = allocator.box_type_graph
+
+    # The recipes that get the extra stock for each candidate, and the bounds of its search
+    if by == "recipe":
+        names = recipe_ids
+        columns = [np.array([column]) for column in range(len(recipe_ids))]
+    else:
+        names = np.array(allocator.allocation_order, dtype=object)
+        columns = [np.flatnonzero(box_types == name) for name in names]
+    lower = np.zeros(len(names), dtype=np.int64)
+    upper = np.zeros(len(names), dtype=np.int64)
+    for i, candidate in enumerate(columns):
+        if len(candidate) == 0:
+            lower[i] = -1
+            continue
+        box_type = box_types[candidate[0]]
+        for other, (shortfall, _) in shortfalls.items():
+            if box_type in get_pools(graph, other):
+                lower[i] = max(lower[i], -(-shortfall // len(candidate)))
+            elif shortfall > 0:
+                lower[i] = -1
+                break
+        upper[i] = shortfalls[box_type][1]
+    searching = (lower >= 0) & (lower <= upper)
+
+    def allocates(candidates, amounts):
+        """Whether the allocation succeeds with amounts more stock for each candidate"""
+        if len(candidates) == 0:
+            return np.zeros(0, dtype=bool)
+        lengths = [len(columns[i]) for i in candidates]
+        scenarios = np.tile(stock, (len(candidates), 1))
+        scenarios[
+            np.repeat(np.arange(len(candidates)), lengths),
+            np.concatenate([columns[i] for i in candidates]),
+        ] += np.repeat(amounts, lengths)
+        return allocator.allocate_stacked(scenarios, box_types)["success"]
+
+    extra_stock = np.full(len(names), np.nan)
+    chunk_size = max(MAX_CELLS // max(len(stock), 1), 1)
+    for start in range(0, len(names), chunk_size):
+        candidates = np.flatnonzero(searching[start : start + chunk_size])
+        candidates += start
+        # The candidates that succeed with the least they could need are done
+        done = allocates(candidates, lower[candidates])
+        extra_stock[candidates[done]] = lower[candidates[done]]
+        candidates = candidates[~done]
+        # Only search for the candidates that succeed with the most they could need
+        candidates = candidates[allocates(candidates, upper[candidates])]
+        # Invariant: low does not succeed and high does
+        low, high = lower[candidates], upper[candidates].copy()
+        while True:
+            active = np.flatnonzero(high - low > 1)
+            if len(active) == 0:
+                break
+            middle = (low[active] + high[active]) // 2
+            success = allocates(candidates[active], middle)
+            high[active[success]] = middle[success]
+            low[active[~success]] = middle[~success]
+        extra_stock[candidates] = high
+    if by == "recipe":
+        df = pd.DataFrame(
+            {
+                "box_type": box_types,
+                "stock_count": stock,
+                "extra_stock": extra_stock,
+                "lower_bound": np.where(lower >= 0, lower, np.nan),
+            },
+            index=pd.Index(recipe_ids, name="recipe_id"),
+        )
+    else:
+        n_recipes = np.array([len(candidate) for candidate in columns])
+        df = pd.DataFrame(
+            {
+                "n_recipes": n_recipes,
+                "extra_stock": extra_stock,
+                "total_extra_stock": extra_stock * n_recipes,
+                "lower_bound": np.where(lower >= 0, lower, np.nan),
+            },
+            index=pd.Index(names, name="box_type"),
+        )
+    df = df.sort_values("extra_stock", kind="stable", na_position="last")
+    logger.info(
+        f"{int(df['extra_stock'].notna().sum())} of {len(df)} {by}s could make the orders "
+        f"fit with more stock"
+    )
+    return df
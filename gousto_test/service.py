@@ -0,0 +1,321 @@
+"""A long-running allocation service with a small HTTP/JSON API, built on asyncio.
+
+The orders and recipes are loaded once and allocated when the service starts, and kept warm
+in memory, so queries are answered without paying for Python startup, imports or json
+parsing. Stock and order changes are applied with RecipeAllocator.update.
+
+Allocation runs in a worker thread, so the event loop stays responsive while it works. There
+is a single worker, as the allocator keeps state between updates. Concurrent identical read
+requests are coalesced, so they share a single response.
+
+Endpoints:
+    GET  /health       {"status": "ok"}
+    GET  /feasibility  {"success": ..., "version": ...}
+    GET  /leftover     {"success": ..., "version": ..., "excess_stock": {recipe_id: stock}}
+    GET  /metrics      the allocator metrics in the Prometheus text format
+    POST /load         {"orders": ..., "recipes": ...} or {"orders_dir": ..., "recipes_dir": ...}
+    POST /update       {"stock_deltas": {recipe_id: change}, "order_deltas": {...}}
+
+Example:
+    python -m gousto_test.service --orders orders.json --recipes recipes.json --port 8080
+"""
+import argparse
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from gousto_test.allocation_kernel import KERNELS
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.utils.logging import get_logger
+
+logger = get_logger()
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    500: "Internal Server Error",
+}
+
+
+class HTTPError(Exception):
+    """Raised by a request handler to return an error response"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class AllocationService:
+    """Keeps a RecipeAllocator warm and answers requests about its allocation"""
+
+    def __init__(self, engine="bulk", collect_metrics=False):
+        allocator = RecipeAllocator(
+            verbose=False, collect_metrics=collect_metrics
+        )
+        assert (
+            engine in KERNELS
+        ), f"The service needs one of these engines, so that it can apply updates: {list(KERNELS)}"
+        self.allocator = allocator
+        self.engine = engine
+        # The version increases every time the allocation changes. Both are replaced together,
+        # as they are set in the worker thread.
+        self.state = (0, None)
+        # Only one allocation runs at a time, as the allocator keeps state between updates
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.in_flight = dict()
+        self.leftover_cache = (None, None)
+        self.routes = {
+            ("GET", "/health"): self.health,
+            ("GET", "/feasibility"): self.feasibility,
+            ("GET", "/leftover"): self.leftover,
+            ("GET", "/metrics"): self.metrics,
+            ("POST", "/load"): self.load,
+            ("POST", "/update"): self.update,
+        }
+
+    async def run_in_worker(self, func, *args, **kwargs):
+        """Run func in the worker thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, lambda: func(*args, **kwargs)
+        )
+
+    async def coalesce(self, key, func):
+        """Await func(), unless an identical request is already running, in which case wait
+        for that one to finish and share its result
+        """
+        if key in self.in_flight:
+            return await asyncio.shield(self.in_flight[key])
+        future = asyncio.ensure_future(func())
+        self.in_flight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self.in_flight.pop(key, None)
+
+    def check_loaded(self):
+        if self.state[1] is None:
+            raise HTTPError(409, "No orders and recipes have been loaded")
+
+    def allocate(self, func, **kwargs):
+        """Run an allocation in the worker thread and record its result"""
+        success = bool(func(**kwargs))
+        self.state = (self.state[0] + 1, success)
+        return {"success": success, "version": self.state[0]}
+
+    def get_leftover(self):
+        """Return the leftover stock as a dict, run in the worker thread"""
+        version, success = self.state
+        excess_stock = self.allocator.excess_stock
+        return {
+            "success": success,
+            "version": version,
+            "excess_stock": dict(
+                zip(
+                    map(str, excess_stock.index),
+                    excess_stock["stock_count"].tolist(),
+                )
+            )
+            if success
+            else None,
+        }
+
+    async def health(self, body):
+        return {"status": "ok"}
+
+    async def feasibility(self, body):
+        self.check_loaded()
+        version, success = self.state
+        return {"success": success, "version": version}
+
+    async def leftover(self, body):
+        self.check_loaded()
+        # The leftover stock only changes with the version, so keep the last response
+        if self.leftover_cache[0] != self.state[0]:
+            result = await self.run_in_worker(self.get_leftover)
+            self.leftover_cache = (result["version"], result)
+        return self.leftover_cache[1]
+
+    async def metrics(self, body):
+        return self.allocator.metrics.to_prometheus()
+
+    async def load(self, body):
+        """Load and allocate new orders and recipes"""
+        if "orders" in body and "recipes" in body:
+            kwargs = {"orders": body["orders"], "recipes": body["recipes"]}
+        elif "orders_dir" in body and "recipes_dir" in body:
+            kwargs = {
+                "orders_dir": body["orders_dir"],
+                "recipes_dir": body["recipes_dir"],
+            }
+        else:
+            raise HTTPError(
+                400,
+                "Supply either orders and recipes, or orders_dir and recipes_dir",
+            )
+        return await self.run_in_worker(
+            self.allocate, self.allocator.run, engine=self.engine, **kwargs
+        )
+
+    async def update(self, body):
+        """Apply stock and order changes to the current allocation"""
+        self.check_loaded()
+        unknown = set(body) - {"stock_deltas", "order_deltas"}
+        if unknown:
+            raise HTTPError(400, f"Unknown fields: {sorted(unknown)}")
+        return await self.run_in_worker(
+            self.allocate,
+            self.allocator.update,
+            stock_deltas=body.get("stock_deltas"),
+            order_deltas=body.get("order_deltas"),
+            verbose=False,
+        )
+
+    async def handle_request(self, method, path, body):
+        """Return the status and payload for a request"""
+        handler = self.routes.get((method, path))
+        if handler is None:
+            if any(route_path == path for (_, route_path) in self.routes):
+                return 405, {"error": f"{method} is not allowed for {path}"}
+            return 404, {"error": f"{path} not found"}
+        try:
+            data = json.loads(body) if body else dict()
+            if not isinstance(data, dict):
+                raise HTTPError(400, "The request body must be a json object")
+            if method == "GET":
+                # Identical reads that arrive at the same time share one response
+                result = await self.coalesce(
+                    (path, self.state[0]), lambda: handler(data)
+                )
+            else:
+                result = await handler(data)
+            return 200, result
+        except HTTPError as e:
+            return e.status, {"error": e.message}
+        except json.JSONDecodeError as e:
+            return 400, {"error": f"Invalid json: {e}"}
+        except (AssertionError, KeyError, ValueError) as e:
+            return 400, {"error": f"Invalid request: {e!r}"}
+        except Exception as e:
+            logger.exception(f"Request to {method} {path} failed")
+            return 500, {"error": str(e)}
+
+    async def handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on a connection until the client closes it"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, _ = request_line.decode().split()
+                except ValueError:
+                    await self.write_response(
+                        writer, 400, {"error": "Bad request line"}, False
+                    )
+                    break
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, payload = await self.handle_request(
+                    method.upper(), target.split("?")[0], body
+                )
+                await self.write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def write_response(writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            content, content_type = payload.encode(), "text/plain"
+        else:
+            content, content_type = (
+                json.dumps(payload).encode(),
+                "application/json",
+            )
+        writer.write(
+            (
+                f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(content)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                "\r\n"
+            ).encode()
+            + content
+        )
+        await writer.drain()
+
+    async def start(self, host="127.0.0.1", port=8080):
+        """Start listening for requests, returning the asyncio server"""
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+async def serve(
+    *,
+    orders_dir=None,
+    recipes_dir=None,
+    host="127.0.0.1",
+    port=8080,
+    engine="bulk",
+):
+    """Load the data, if given, and serve requests until cancelled"""
+    service = AllocationService(engine=engine)
+    if orders_dir is not None and recipes_dir is not None:
+        await service.load(
+            {"orders_dir": orders_dir, "recipes_dir": recipes_dir}
+        )
+    server = await service.start(host, port)
+    logger.warning(f"Serving on {host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Run the allocation service")
+    parser.add_argument("--orders", help="Orders json file to load on startup")
+    parser.add_argument(
+        "--recipes", help="Recipes json file to load on startup"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--engine", default="bulk", choices=list(KERNELS))
+    args = parser.parse_args(args)
+    logger.setLevel(logging.WARNING)
+    try:
+        asyncio.run(
+            serve(
+                orders_dir=args.orders,
+                recipes_dir=args.recipes,
+                host=args.host,
+                port=args.port,
+                engine=args.engine,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Binary snapshots of orders and recipes, which load much faster than json and can be
+memory-mapped so that worker processes share the same pages.
+
+A snapshot is a directory containing:
+    - stock.npy: the stock_count of every recipe, as int64
+    - box_type_codes.npy: the box_type of every recipe, as a uint8 code into box_types
+    - recipe_ids.npy: the recipe ids, as fixed-width unicode strings
+    - positions.npy: the position of every recipe in the original recipes json
+    - metadata.json: the format version, the box_types table, where each box_type's
+      recipes start and end, the recipe and portion categories, and the orders
+
+Recipes are grouped by box_type (keeping their original order within each box_type), so the
+recipes for a box_type are a contiguous slice of each array and can be used without copying.
+
+Example:
+    python -m gousto_test.snapshot orders.json recipes.json snapshot/
+"""
+import argparse
+import json
+import os
+from array import array
+
+import numpy as np
+
+from gousto_test.categories import get_orders_schema
+from gousto_test.streaming import iter_recipes_json, validate_recipe
+from gousto_test.utils.logging import get_logger
+
+logger = get_logger()
+
+SNAPSHOT_VERSION = 1
+ARRAYS = ["stock", "box_type_codes", "recipe_ids", "positions"]
+
+
+def write_snapshot(snapshot_dir, *, orders, recipes):
+    """Write orders and recipes to a snapshot directory. `recipes` is either a recipes dict, in
+    the same format as the json file, or an iterable of (recipe_id, recipe) pairs, so that a
+    large file can be streamed straight into the snapshot.
+    """
+    if isinstance(recipes, dict):
+        recipes = recipes.items()
+    recipe_ids, stock, codes = list(), array("q"), array("B")
+    box_types = dict()
+    for recipe_id, recipe in recipes:
+        stock_count, box_type = validate_recipe(recipe_id, recipe)
+        if box_type not in box_types:
+            assert (
+                len(box_types) < 256
+            ), "A snapshot can have up to 256 box_types"
+            box_types[box_type] = len(box_types)
+        recipe_ids.append(recipe_id)
+        stock.append(stock_count)
+        codes.append(box_types[box_type])
+    codes = np.frombuffer(codes, dtype=np.uint8)
+    schema = get_orders_schema(orders)
+    positions = np.argsort(codes, kind="stable")
+    counts = np.bincount(codes, minlength=len(box_types))
+    ends = np.cumsum(counts)
+    metadata = {
+        "version": SNAPSHOT_VERSION,
+        "n_recipes": len(recipe_ids),
+        "box_types": list(box_types.keys()),
+        "offsets": {
+            box_type: [int(ends[code] - counts[code]), int(ends[code])]
+            for (box_type, code) in box_types.items()
+        },
+        "categories": {
+            "recipe_categories": schema.recipe_categories_dict,
+            "portion_categories": schema.portion_categories_dict,
+        },
+        "orders": orders,
+    }
+    os.makedirs(snapshot_dir, exist_ok=True)
+    np.save(
+        os.path.join(snapshot_dir, "stock.npy"),
+        np.frombuffer(stock, dtype=np.int64)[positions],
+    )
+    np.save(os.path.join(snapshot_dir, "box_type_codes.npy"), codes[positions])
+    np.save(
+        os.path.join(snapshot_dir, "recipe_ids.npy"),
+        np.array(recipe_ids, dtype=str)[positions],
+    )
+    np.save(os.path.join(snapshot_dir, "positions.npy"), positions)
+    with open(os.path.join(snapshot_dir, "metadata.json"), "w") as f_out:
+        json.dump(metadata, f_out)
+
+
+def write_snapshot_from_json(orders_dir, recipes_dir, snapshot_dir):
+    """Write a snapshot from orders and recipes json files, streaming the recipes"""
+    with open(orders_dir, "r") as f_in:
+        orders = json.load(f_in)
+    write_snapshot(
+        snapshot_dir, orders=orders, recipes=iter_recipes_json(recipes_dir)
+    )
+
+
+def load_snapshot(snapshot_dir, mmap=True):
+    """Load a snapshot. The arrays are memory-mapped read-only if mmap is True, otherwise they
+    are read into memory. Returns a dict with the metadata, the arrays, and a recipe_arrays dict
+    of {box_type: {"recipe_ids", "stock"}} holding slices of the arrays for each box_type.
+    """
+    with open(os.path.join(snapshot_dir, "metadata.json"), "r") as f_in:
+        metadata = json.load(f_in)
+    assert metadata["version"] == SNAPSHOT_VERSION, (
+        f"Snapshot version {metadata['version']} is not supported, "
+        f"expected version {SNAPSHOT_VERSION}"
+    )
+    arrays = {
+        name: np.load(
+            os.path.join(snapshot_dir, f"{name}.npy"),
+            mmap_mode="r" if mmap else None,
+        )
+        for name in ARRAYS
+    }
+    snapshot = dict(metadata, **arrays)
+    snapshot["recipe_arrays"] = {
+        box_type: {
+            "recipe_ids": arrays["recipe_ids"][start:end],
+            "stock": arrays["stock"][start:end],
+        }
+        for (box_type, (start, end)) in metadata["offsets"].items()
+    }
+    return snapshot
+
+
+def snapshot_to_recipes(snapshot):
+    """Return the recipes in a loaded snapshot as a dict in the same format, and the same
+    order, as the original recipes json
+    """
+    order = np.argsort(snapshot["positions"])
+    box_types = np.array(snapshot["box_types"], dtype=object)
+    return {
+        recipe_id: {"stock_count": stock_count, "box_type": box_type}
+        for (recipe_id, stock_count, box_type) in zip(
+            snapshot["recipe_ids"][order].tolist(),
+            snapshot["stock"][order].tolist(),
+            box_types[snapshot["box_type_codes"][order]].tolist(),
+        )
+    }
+
+
+def write_json_from_snapshot(snapshot_dir, orders_dir, recipes_dir):
+    """Write a snapshot back out as orders and recipes json files"""
+    snapshot = load_snapshot(snapshot_dir)
+    with open(orders_dir, "w") as f_out:
+        json.dump(snapshot["orders"], f_out)
+    with open(recipes_dir, "w") as f_out:
+        json.dump(snapshot_to_recipes(snapshot), f_out)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Write a binary snapshot of orders and recipes json files"
+    )
+    parser.add_argument("orders_dir")
+    parser.add_argument("recipes_dir")
+    parser.add_argument("snapshot_dir")
+    args = parser.parse_args(args)
+    write_snapshot_from_json(
+        args.orders_dir, args.recipes_dir, args.snapshot_dir
+    )
+    logger.info(f"Snapshot written to {args.snapshot_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Read large recipe files without loading the whole file, or a dict for every recipe, into
+memory. Recipes are read one at a time, validated, and added straight to compact stock
+arrays for each box_type.
+
+Two formats are supported:
+    - the usual recipes json, {"recipe_1": {"stock_count": 4, "box_type": "vegetarian"}, ...}
+    - json lines, with one {"recipe_id": ..., "stock_count": ..., "box_type": ...} per line
+"""
+import json
+from array import array
+
+import numpy as np
+
+decoder = json.JSONDecoder()
+WHITESPACE = " \t\n\r"
+
+
+def iter_recipes_json(file_path, chunk_size=1 << 20):
+    """Yield (recipe_id, recipe) pairs from a recipes json file, reading it chunk_size
+    characters at a time
+    """
+    with open(file_path, "r") as f_in:
+        buffer = ""
+        position = 0
+        end_of_file = False
+
+        def read_more():
+            nonlocal buffer, position, end_of_file
+            chunk = f_in.read(chunk_size)
+            end_of_file = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+
+        def next_character():
+            # Skip whitespace, reading more of the file if needed
+            nonlocal position
+            while True:
+                while (
+                    position < len(buffer) and buffer[position] in WHITESPACE
+                ):
+                    position += 1
+                if position < len(buffer) or end_of_file:
+                    return buffer[position] if position < len(buffer) else ""
+                read_more()
+
+        def decode():
+            # Decode the next json value, reading more of the file until it is complete
+            nonlocal position
+            while True:
+                try:
+                    value, position = decoder.raw_decode(buffer, position)
+                    return value
+                except json.JSONDecodeError:
+                    if end_of_file:
+                        raise
+                    read_more()
+
+        read_more()
+        if next_character() != "{":
+            raise ValueError(
+                f"{file_path} is not a recipes json file, it should contain a single object"
+            )
+        position += 1
+        while True:
+            character = next_character()
+            if character == "}":
+                return
+            if character == ",":
+                position += 1
+                continue
+            if character != '"':
+                raise ValueError(
+                    f"Unexpected character {character!r} in {file_path}"
+                )
+            recipe_id = decode()
+            if next_character() != ":":
+                raise ValueError(
+                    f"Expected ':' after recipe {recipe_id} in {file_path}"
+                )
+            position += 1
+            next_character()
+            yield recipe_id, decode()
+
+
+def iter_recipes_jsonl(file_path):
+    """Yield (recipe_id, recipe) pairs from a json lines file"""
+    with open(file_path, "r") as f_in:
+        for line in f_in:
+            if line.strip():
+                recipe = json.loads(line)
+                yield recipe.pop("recipe_id", None), recipe
+
+
+def validate_recipe(recipe_id, recipe):
+    """Check that a recipe has a recipe_id, a whole number stock_count of at least zero and
+    a box_type. Returns the stock_count and box_type.
+    """
+    if not isinstance(recipe_id, str) or not isinstance(recipe, dict):
+        raise ValueError(
+            f"Recipe {recipe_id} is not in the expected format, each recipe needs a "
+            "recipe_id, stock_count and box_type"
+        )
+    stock_count, box_type = recipe.get("stock_count"), recipe.get("box_type")
+    if isinstance(stock_count, str) and stock_count.isdigit():
+        stock_count = int(stock_count)
+    if (
+        isinstance(stock_count, bool)
+        or not isinstance(stock_count, int)
+        or stock_count < 0
+    ):
+        raise ValueError(
+            f"Recipe {recipe_id} has an invalid stock_count: {stock_count}"
+        )
+    if not isinstance(box_type, str):
+        raise ValueError(
+            f"Recipe {recipe_id} has an invalid box_type: {box_type}"
+        )
+    return stock_count, box_type
+
+
+def load_recipe_arrays(file_path, chunk_size=1 << 20):
+    """Stream a recipes file into a dict of {box_type: {"recipe_ids", "stock"}}, where
+    recipe_ids is an object array and stock is an int64 array, in file order. Files ending
+    in .jsonl are read as json lines.
+    """
+    if str(file_path).endswith(".jsonl"):
+        recipes = iter_recipes_jsonl(file_path)
+    else:
+        recipes = iter_recipes_json(file_path, chunk_size=chunk_size)
+    return group_recipe_arrays(recipes)
+
+
+def group_recipe_arrays(recipes):
+    """Turn (recipe_id, recipe) pairs into a dict of {box_type: {"recipe_ids", "stock"}}, as
+    load_recipe_arrays returns them
+    """
+    recipe_ids, stock = dict(), dict()
+    for recipe_id, recipe in recipes:
+        stock_count, box_type = validate_recipe(recipe_id, recipe)
+        if box_type not in stock:
+            recipe_ids[box_type] = list()
+            stock[box_type] = array("q")
+        recipe_ids[box_type].append(recipe_id)
+        stock[box_type].append(stock_count)
+    return {
+        box_type: {
+            "recipe_ids": np.array(recipe_ids[box_type], dtype=object),
+            "stock": np.frombuffer(stock[box_type], dtype=np.int64),
+        }
+        for box_type in stock
+    }
@@ -1,5 +1,7 @@
 import os
 import errno
+import functools
+import logging
 import time
 
 from gousto_test.utils.logging import get_logger
@@ -8,15 +10,22 @@ logger = get_logger()
 
 
 def time_function(logger):
-    """A decorator function to time how long a function takes to run"""
+    """A decorator function to time how long a function takes to run. For timings that can be
+    collected and exported, use utils.metrics.Metrics instead.
+    """
 
     def decorator(func):
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            start_time = time.time()
+            if not logger.isEnabledFor(logging.DEBUG):
+                return func(*args, **kwargs)
+            start_time = time.perf_counter()
             result = func(*args, **kwargs)
             logger.debug(
-                "Function {} completed in {} seconds".format(
-                    func.__name__, round(time.time() - start_time, 4)
+                "Function {} called with arguments {} completed in {} seconds".format(
+                    func.__name__,
+                    sorted(kwargs.keys()),
+                    round(time.perf_counter() - start_time, 4),
                 )
             )
             return result
@@ -1,7 +1,17 @@
+import atexit
 import logging
+import os
+import queue
 import sys
 
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import (
+    MemoryHandler,
+    QueueHandler,
+    QueueListener,
+    TimedRotatingFileHandler,
+)
+
+import numpy as np
 
 from gousto_test.settings import PROJECTSPATH
 
@@ -10,7 +20,13 @@ FORMATTER = logging.Formatter(
     "%(asctime)s - %(name)s - %(levelname)s - "
     "%(funcName)s:%(lineno)d - %(message)s"
 )
-LOG_FILE = f"{PROJECTSPATH}/logs/model.log"
+# The GOUSTO_LOG_FILE environment variable moves the log file, or turns it off when empty,
+# e.g. so that the tests do not write to the package's logs directory
+LOG_FILE = os.environ.get("GOUSTO_LOG_FILE", f"{PROJECTSPATH}/logs/model.log")
+# Number of records each handler holds before writing them out, when logging asynchronously
+BATCH_SIZE = 100
+# The (listener, handlers) of each logger that is logging asynchronously, by logger name
+LISTENERS = dict()
 
 
 def get_console_handler():
@@ -21,9 +37,12 @@ def get_console_handler():
 
 def get_file_handler():
     """Create a logging file handler that creates a new log file every day,
-    to make searching through logs easier
+    to make searching through logs easier. The file is only opened when the first
+    record is written to it, so importing a module that logs does not touch the disk.
     """
-    file_handler = TimedRotatingFileHandler(LOG_FILE, when="midnight")
+    file_handler = TimedRotatingFileHandler(
+        LOG_FILE, when="midnight", delay=True
+    )
     file_handler.setFormatter(FORMATTER)
     file_handler.setLevel(logging.INFO)
     return file_handler
@@ -34,6 +53,144 @@ def get_logger(logger_name=__name__):
     logger.setLevel(logging.DEBUG)
     if not logger.hasHandlers():
         logger.addHandler(get_console_handler())
-        logger.addHandler(get_file_handler())
+        if LOG_FILE:
+            logger.addHandler(get_file_handler())
     logger.propagate = False
     return logger
+
+
+class DeferredQueueHandler(QueueHandler):
+    """A QueueHandler that leaves formatting to the listener's thread. The records never leave
+    the process, so they do not need to be made picklable first, and lazy messages such as
+    StockTable are only rendered in the background, if a handler emits them.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class BatchQueueListener(QueueListener):
+    """A QueueListener whose handlers buffer records and write them in batches. The buffers are
+    written when they are full, when an error is logged, or when the queue is empty.
+    """
+
+    def handle(self, record):
+        super().handle(record)
+        if self.queue.empty():
+            self.flush()
+
+    def flush(self):
+        for handler in self.handlers:
+            handler.flush()
+
+    def stop(self):
+        super().stop()
+        self.flush()
+
+
+def enable_async_logging(logger_name=__name__, batch_size=BATCH_SIZE):
+    """Write the records of a logger on a background thread, so logging does not block the
+    allocation. The logger's handlers are moved behind a queue and write batch_size records
+    at a time. Returns the BatchQueueListener doing the writing.
+    """
+    if logger_name in LISTENERS:
+        return LISTENERS[logger_name][0]
+    logger = get_logger(logger_name)
+    handlers = list(logger.handlers)
+    buffered_handlers = list()
+    for handler in handlers:
+        buffered_handler = MemoryHandler(
+            batch_size, flushLevel=logging.ERROR, target=handler
+        )
+        # The listener checks the level of the buffer, not of the handler it writes to
+        buffered_handler.setLevel(handler.level)
+        buffered_handlers.append(buffered_handler)
+    log_queue = queue.SimpleQueue()
+    listener = BatchQueueListener(
+        log_queue, *buffered_handlers, respect_handler_level=True
+    )
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    LISTENERS[logger_name] = (listener, handlers)
+    listener.start()
+    # Write out anything still buffered when the process exits
+    atexit.register(disable_async_logging, logger_name)
+    return listener
+
+
+def disable_async_logging(logger_name=__name__):
+    """Write out every record that is still queued or buffered, stop the background thread and
+    give the logger its handlers back
+    """
+    if logger_name not in LISTENERS:
+        return
+    listener, handlers = LISTENERS.pop(logger_name)
+    listener.stop()
+    logger = logging.getLogger(logger_name)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    for handler in handlers:
+        logger.addHandler(handler)
+
+
+class StockTable:
+    """The stock of some recipes, for logging. It is only rendered as a text table when a
+    handler emits it, so logging it costs almost nothing when nothing is written. In "full"
+    mode every recipe is listed, and in "summary" mode only the totals and the top_n recipes
+    with the most stock. The arrays must not be changed after the table is logged.
+    """
+
+    __slots__ = ("recipe_ids", "stock", "box_types", "mode", "top_n")
+    modes = ["full", "summary"]
+
+    def __init__(self, recipe_ids, stock, box_types, mode="full", top_n=10):
+        assert (
+            mode in self.modes
+        ), f"mode can only be the following: {self.modes}"
+        self.recipe_ids = recipe_ids
+        self.stock = stock
+        self.box_types = box_types
+        self.mode = mode
+        self.top_n = top_n
+
+    @classmethod
+    def from_frame(cls, df, **kwargs):
+        """Copy the stock_count and box_type of each recipe out of a stock DataFrame"""
+        return cls(
+            df.index.to_numpy(dtype=object),
+            df["stock_count"].to_numpy(copy=True),
+            df["box_type"].to_numpy(dtype=object, copy=True),
+            **kwargs,
+        )
+
+    def rows(self):
+        """Return (recipe_id, stock_count, box_type) for the recipes to be listed"""
+        if self.mode == "full":
+            return zip(self.recipe_ids, self.stock, self.box_types)
+        top = np.argsort(-np.asarray(self.stock), kind="stable")[: self.top_n]
+        return zip(
+            np.asarray(self.recipe_ids)[top],
+            np.asarray(self.stock)[top],
+            np.asarray(self.box_types)[top],
+        )
+
+    def __str__(self):
+        rows = [("", "stock_count", "box_type")] + [
+            (str(recipe_id), str(stock_count), str(box_type))
+            for (recipe_id, stock_count, box_type) in self.rows()
+        ]
+        widths = [max(len(row[i]) for row in rows) for i in range(3)]
+        lines = [
+            f"{recipe_id:<{widths[0]}}  {stock_count:>{widths[1]}}  {box_type:>{widths[2]}}"
+            for (recipe_id, stock_count, box_type) in rows
+        ]
+        if self.mode == "summary":
+            stock = np.asarray(self.stock)
+            total, out_of_stock = stock.sum(), (stock <= 0).sum()
+            lines.insert(
+                0,
+                f"{len(self.stock)} recipes, {total} portions in stock, "
+                f"{out_of_stock} out of stock. Top {len(rows) - 1} by stock:",
+            )
+        return "\n".join(lines)
@@ -0,0 +1,212 @@
+import cProfile
+import functools
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+# Returned by Metrics.phase when metrics are disabled, so timing a phase costs almost nothing
+NULL_PHASE = nullcontext()
+
+
+class Phase:
+    """Context manager that adds the time spent inside it to a Metrics object.
+    It can be entered any number of times, so hot loops can create it once and reuse it.
+    """
+
+    __slots__ = ("metrics", "key", "start_time")
+
+    def __init__(self, metrics, key):
+        self.metrics = metrics
+        self.key = key
+        self.start_time = None
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start_time
+        with self.metrics.lock:
+            self.metrics.timings[self.key] += elapsed
+            self.metrics.calls[self.key] += 1
+        return False
+
+
+class Metrics:
+    """Collects timings for each phase of an allocation, and counters such as the number of
+    loop iterations, so you can see where the time goes in a slow run. Timings and counters
+    can have labels, e.g. the box_type, recipe_num and portion_num of an order group.
+
+    When enabled is False nothing is recorded. Setting profile to "cprofile" or "tracemalloc"
+    captures a profile of everything run inside Metrics.profiling().
+    """
+
+    profile_options = [None, "cprofile", "tracemalloc"]
+
+    def __init__(self, enabled=False, profile=None):
+        assert (
+            profile in self.profile_options
+        ), f"profile can only be the following: {self.profile_options}"
+        self.enabled = enabled
+        self.profile = profile
+        self.timings = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.profile_stats = None
+        self.peak_memory = None
+        # Box_types can be allocated in several threads at once, see scheduler.run_schedule
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def phase(self, name, **labels):
+        """Time the code run inside this context manager. Each call returns a new Phase, so
+        the same phase can be timed in several threads at once.
+        """
+        if not self.enabled:
+            return NULL_PHASE
+        return Phase(self, self.make_key(name, labels))
+
+    def increment(self, name, value=1, **labels):
+        """Add value to a counter"""
+        if self.enabled:
+            with self.lock:
+                self.counters[self.make_key(name, labels)] += value
+
+    def reset(self):
+        """Remove everything that has been recorded so far"""
+        with self.lock:
+            self.timings.clear()
+            self.calls.clear()
+            self.counters.clear()
+        self.profile_stats = None
+        self.peak_memory = None
+
+    @contextmanager
+    def profiling(self):
+        """Profile the code run inside this context manager, if profile was set"""
+        if self.profile == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                self.profile_stats = pstats.Stats(profiler)
+        elif self.profile == "tracemalloc":
+            already_tracing = tracemalloc.is_tracing()
+            if not already_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            try:
+                yield
+            finally:
+                self.profile_stats = tracemalloc.take_snapshot()
+                self.peak_memory = tracemalloc.get_traced_memory()[1]
+                if not already_tracing:
+                    tracemalloc.stop()
+        else:
+            yield
+
+    def profile_report(self, limit=20):
+        """Return the top entries of the captured profile as text"""
+        if self.profile_stats is None:
+            return ""
+        if self.profile == "cprofile":
+            stream = io.StringIO()
+            self.profile_stats.stream = stream
+            self.profile_stats.sort_stats("cumulative").print_stats(limit)
+            return stream.getvalue()
+        lines = [f"Peak traced memory: {self.peak_memory} bytes"]
+        lines += [
+            str(stat)
+            for stat in self.profile_stats.statistics("lineno")[:limit]
+        ]
+        return "\n".join(lines)
+
+    def snapshot(self):
+        """Return copies of the timings, calls and counters, taken under the lock so they
+        can be read while another thread is still recording, e.g. in the service
+        """
+        with self.lock:
+            return dict(self.timings), dict(self.calls), dict(self.counters)
+
+    def to_dict(self):
+        """Return the timings and counters as a dict"""
+        timings, calls, counters = self.snapshot()
+        return {
+            "timings": [
+                {
+                    "phase": name,
+                    "labels": dict(labels),
+                    "seconds": seconds,
+                    "calls": calls[(name, labels)],
+                }
+                for ((name, labels), seconds) in timings.items()
+            ],
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for ((name, labels), value) in counters.items()
+            ],
+        }
+
+    def to_json(self):
+        """Return the timings and counters as a json string"""
+        return json.dumps(self.to_dict())
+
+    def to_prometheus(self, prefix="gousto_allocator"):
+        """Return the timings and counters in the Prometheus text format"""
+
+        def format_labels(labels):
+            if not labels:
+                return ""
+            return (
+                "{"
+                + ",".join(f'{key}="{value}"' for (key, value) in labels)
+                + "}"
+            )
+
+        timings, calls, counters = self.snapshot()
+        lines = [
+            f"# TYPE {prefix}_phase_seconds_total counter",
+            f"# TYPE {prefix}_phase_calls_total counter",
+        ]
+        for (name, labels), seconds in timings.items():
+            phase_labels = format_labels((("phase", name),) + labels)
+            lines.append(
+                f"{prefix}_phase_seconds_total{phase_labels} {seconds}"
+            )
+            lines.append(
+                f"{prefix}_phase_calls_total{phase_labels} {calls[(name, labels)]}"
+            )
+        for name in sorted({name for (name, _) in counters}):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            for (counter_name, labels), value in counters.items():
+                if counter_name == name:
+                    lines.append(
+                        f"{prefix}_{name}_total{format_labels(labels)} {value}"
+                    )
+        return "\n".join(lines) + "\n"
+
+
+def timed_phase(name):
+    """A decorator for methods of classes with a metrics attribute, which records how long
+    the method takes as a phase
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.phase(name):
+                return func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -43,7 +43,7 @@ setup(
     author_email=EMAIL,
     python_requires=REQUIRES_PYTHON,
     url=URL,
-    packages=find_packages(exclude=("tests",)),
+    packages=find_packages(exclude=("tests", "benchmarks")),
     package_data={"gousto_test": ["VERSION"]},
     install_requires=list_reqs(),
     extras_require={},
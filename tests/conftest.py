@@ -1,6 +1,12 @@
 import json
+import os
+
 import pytest
 
+# Log to the console only, rather than to the package's logs directory. This is set before
+# any test imports the package, and is passed on to the processes the tests start.
+os.environ["GOUSTO_LOG_FILE"] = ""
+
 
 @pytest.fixture
 def orders_json():
@@ -0,0 +1,95 @@
+import asyncio
+import copy
+
+from benchmarks.allocator import (
+    ENGINES,
+    TARGETS,
+    compare_to_baseline,
+    run_benchmarks,
+)
+from benchmarks.horizon import make_horizon_case, run_horizon_benchmark
+from benchmarks.scheduler import run_scheduler_benchmark
+from benchmarks.service import run_service_benchmark
+from gousto_test.horizon import run_horizon
+from gousto_test.order_allocation import RecipeAllocator
+
+
+def test_run_benchmarks():
+    """Test that every target and engine can be benchmarked"""
+    results = run_benchmarks(recipes=[10], orders=[50], repeats=1)
+    assert len(results["results"]) == len(TARGETS) * len(ENGINES)
+    for result in results["results"]:
+        assert result["success"]
+        assert result["wall_time"] > 0 and result["peak_memory"] > 0
+        assert result["iterations"] > 0
+
+
+def test_compare_to_baseline():
+    """Test that slower cases and changed iteration counts are reported as regressions"""
+    baseline = run_benchmarks(
+        targets=["assign_orders"],
+        engines=["numpy"],
+        recipes=[10],
+        orders=[50],
+        repeats=1,
+    )
+    assert compare_to_baseline(baseline, baseline) == []
+    results = copy.deepcopy(baseline)
+    results["results"][0]["wall_time"] *= 2
+    results["results"][0]["iterations"] += 1
+    assert len(compare_to_baseline(results, baseline, threshold=1.5)) == 2
+
+
+def test_run_service_benchmark():
+    """Test that the latency of every service endpoint is measured"""
+    results = asyncio.run(
+        run_service_benchmark(n_recipes=20, n_orders=10, n_requests=10)
+    )
+    assert len(results) == 3
+    for result in results.values():
+        assert 0 < result["p50_ms"] <= result["p99_ms"]
+
+
+def test_run_scheduler_benchmark():
+    """Test that many box_types can be allocated with any number of workers"""
+    results = run_scheduler_benchmark(
+        n_box_types=6, n_recipes=10, n_orders=5, workers=[1, 2], repeats=1
+    )
+    assert list(results) == [1, 2]
+    assert all(wall_time > 0 for wall_time in results.values())
+
+
+def test_run_horizon_benchmark():
+    """Test that a horizon carries the leftover stock of each day on to the next, leaving the
+    same stock as a chain of RecipeAllocator.run calls, one for each day
+    """
+    timings = run_horizon_benchmark(
+        n_sites=2, n_days=3, n_recipes=10, n_orders=5
+    )
+    assert list(timings) == ["horizon", "separate_runs"]
+    steps, stock = make_horizon_case(
+        n_sites=2, n_days=3, n_recipes=10, n_orders=5
+    )
+    results = run_horizon(steps, stock, engine="bulk")
+    for site, result in results.items():
+        recipes = copy.deepcopy(stock[site])
+        for step in steps:
+            if step["site"] != site:
+                continue
+            allocator = RecipeAllocator(verbose=False)
+            assert allocator.run(
+                orders=step["orders"], recipes=recipes, engine="bulk"
+            )
+            for recipe_id, stock_count in allocator.excess_stock[
+                "stock_count"
+            ].items():
+                recipes[recipe_id]["stock_count"] = int(stock_count)
+            leftover = [
+                recipes[recipe_id]["stock_count"]
+                for recipe_id in result["recipe_ids"]
+            ]
+            assert result["leftover"][step["day"]].tolist() == leftover
+        # Every day uses up more of the stock the site started with
+        totals = [int(day_stock.sum()) for day_stock in result["leftover"]]
+        assert totals == sorted(totals, reverse=True)
+        assert len(set(totals)) == len(totals)
@@ -0,0 +1,74 @@
+import copy
+
+from gousto_test.cache import ResultCache
+from gousto_test.order_allocation import RecipeAllocator
+
+
+def rename_recipes(recipes):
+    """Reverse the order of the recipes and give them new ids"""
+    return {
+        f"renamed_{recipe_id}": dict(recipe)
+        for (recipe_id, recipe) in reversed(list(recipes.items()))
+    }
+
+
+def test_cache_hit_maps_to_recipe_ids(orders_json, recipes_json):
+    """Test that a permuted scenario hits the cache and gets results for its own recipe ids"""
+    cache = ResultCache()
+    allocator = RecipeAllocator(verbose=False, cache=cache)
+    assert allocator.run(orders=orders_json, recipes=recipes_json)
+    renamed = rename_recipes(recipes_json)
+    assert allocator.run(orders=copy.deepcopy(orders_json), recipes=renamed)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    expected = RecipeAllocator(verbose=False)
+    expected.run(orders=orders_json, recipes=renamed, engine="numpy")
+    assert list(allocator.excess_stock.index) == list(
+        expected.excess_stock.index
+    )
+    assert allocator.excess_stock["stock_count"].tolist() == (
+        expected.excess_stock["stock_count"].tolist()
+    )
+    assert allocator.excess_stock["box_type"].tolist() == (
+        expected.excess_stock["box_type"].tolist()
+    )
+
+
+def test_cache_eviction():
+    """Test that the least recently used results are evicted, and expired ones are ignored"""
+    cache = ResultCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    cache = ResultCache(ttl=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+
+
+def test_cache_sqlite(tmp_path, orders_json, recipes_json):
+    """Test that results stored in sqlite can be used by another cache"""
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResultCache(path=path)
+    allocator = RecipeAllocator(verbose=False, cache=cache)
+    assert allocator.run(orders=orders_json, recipes=recipes_json)
+    cache.close()
+    cache = ResultCache(path=path)
+    allocator = RecipeAllocator(verbose=False, cache=cache)
+    assert allocator.run(orders=orders_json, recipes=recipes_json)
+    assert cache.stats()["disk_hits"] == 1
+    cache.close()
+
+
+def test_cache_is_per_engine(orders_json, recipes_json):
+    """Test that the same scenario run with two engines is two misses, not one hit"""
+    cache = ResultCache()
+    allocator = RecipeAllocator(verbose=False, cache=cache)
+    for engine in ["numpy", "exact", "numpy"]:
+        assert allocator.run(
+            orders=copy.deepcopy(orders_json),
+            recipes=recipes_json,
+            engine=engine,
+        )
+    assert cache.stats()["misses"] == 2 and cache.stats()["hits"] == 1
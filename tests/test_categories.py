@@ -0,0 +1,66 @@
+import subprocess
+import sys
+
+import pytest
+
+from gousto_test.categories import (
+    CategorySchema,
+    get_category_schema,
+    get_orders_schema,
+)
+from gousto_test.order_allocation import RecipeAllocator
+
+
+def test_get_orders_schema(orders_json):
+    """Test that categories are parsed into numbers and ordered from largest to smallest"""
+    schema = get_orders_schema(orders_json)
+    assert schema.recipe_categories_dict == {
+        "two_recipes": 2,
+        "three_recipes": 3,
+        "four_recipes": 4,
+    }
+    assert [group[:2] for group in schema.order_groups] == [
+        (4, 4),
+        (4, 2),
+        (3, 4),
+        (3, 2),
+        (2, 4),
+        (2, 2),
+    ]
+    assert schema == CategorySchema.from_numbers(
+        schema.recipe_categories, schema.portion_categories
+    )
+    hash(schema)
+
+
+def test_category_schema_is_cached(orders_json):
+    """Test that loading the same categories again reuses the parsed schema"""
+    first = RecipeAllocator(verbose=False)
+    first.set_data(orders=orders_json, recipes=dict())
+    hits = get_category_schema.cache_info().hits
+    second = RecipeAllocator(verbose=False)
+    second.set_data(orders=orders_json, recipes=dict())
+    assert second.category_schema is first.category_schema
+    assert get_category_schema.cache_info().hits == hits + 1
+
+
+def test_invalid_category():
+    """Test that category names that do not start with a number are rejected"""
+    with pytest.raises(Exception, match="number of recipes"):
+        get_category_schema(("many_recipes",), ("two_portions",))
+
+
+def test_word2number_imported_lazily():
+    """Test that importing the allocator does not import word2number"""
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, gousto_test.order_allocation; "
+            "print('word2number' in sys.modules)",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    assert output.strip().splitlines()[-1] == "False"
@@ -0,0 +1,156 @@
+import json
+
+import numpy as np
+import pytest
+
+from gousto_test.cache import ResultCache
+from gousto_test.columnar import (
+    SUMMARY_COLUMNS,
+    read_orders,
+    read_recipe_arrays,
+    write_columns,
+)
+from gousto_test.generate_data import DataGenerator
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.streaming import load_recipe_arrays
+
+
+def save_recipes(recipes, file_path):
+    """Save a recipes dict as recipe columns"""
+    write_columns(
+        {
+            "recipe_id": np.array(list(recipes), dtype=object),
+            "stock_count": np.array(
+                [recipe["stock_count"] for recipe in recipes.values()]
+            ),
+            "box_type": np.array(
+                [recipe["box_type"] for recipe in recipes.values()],
+                dtype=object,
+            ),
+        },
+        file_path,
+    )
+
+
+@pytest.mark.parametrize("file_format", ["csv", "npz"])
+def test_read_recipe_arrays(tmp_path, file_format):
+    """Test that columnar recipes give the same stock arrays as the json file"""
+    generator = DataGenerator(seed=0)
+    columns = generator.generate_recipes_bulk(n_recipes=1000)
+    generator.save(columns, tmp_path / "recipes.json")
+    file_path = tmp_path / f"recipes.{file_format}"
+    generator.save(columns, file_path, file_format=file_format)
+    expected = load_recipe_arrays(tmp_path / "recipes.json")
+    recipe_arrays = read_recipe_arrays(file_path, chunk_size=64)
+    assert list(recipe_arrays) == list(expected)
+    for box_type, arrays in expected.items():
+        assert recipe_arrays[box_type]["recipe_ids"].dtype == object
+        assert np.array_equal(
+            recipe_arrays[box_type]["recipe_ids"], arrays["recipe_ids"]
+        )
+        assert np.array_equal(
+            recipe_arrays[box_type]["stock"], arrays["stock"]
+        )
+
+
+@pytest.mark.parametrize("file_format", ["csv", "npz"])
+def test_read_orders(tmp_path, orders_json, file_format):
+    """Test that columnar orders give the same orders object as the json file"""
+    file_path = tmp_path / f"orders.{file_format}"
+    DataGenerator().save(orders_json, file_path, file_format=file_format)
+    assert read_orders(file_path) == orders_json
+
+
+def test_read_invalid_stock(tmp_path):
+    """Test that stock counts that are not whole numbers of at least zero are rejected"""
+    file_path = tmp_path / "recipes.csv"
+    with open(file_path, "w") as f_out:
+        f_out.write("recipe_id,stock_count,box_type\nrecipe_1,-2,gourmet\n")
+    with pytest.raises(ValueError):
+        read_recipe_arrays(file_path)
+
+
+@pytest.mark.parametrize(
+    "engine,columnar", [("bulk", True), ("pandas", False)]
+)
+def test_run_with_columnar_files(
+    tmp_path, orders_json, recipes_json, engine, columnar
+):
+    """Test that run reads columnar inputs and writes the leftover stock, which can be read
+    back in as recipes, and a summary of every order group. The pandas engine needs the
+    recipes as a dict, so it reads the json files.
+    """
+    if columnar:
+        orders_dir, recipes_dir = (
+            tmp_path / "orders.csv",
+            tmp_path / "recipes.npz",
+        )
+        DataGenerator().save(orders_json, orders_dir, "csv")
+        save_recipes(recipes_json, recipes_dir)
+    else:
+        orders_dir, recipes_dir = "tests/orders.json", "tests/recipes.json"
+    allocator = RecipeAllocator(verbose=False)
+    assert allocator.run(
+        orders_dir=orders_dir,
+        recipes_dir=recipes_dir,
+        engine=engine,
+        leftover_dir=tmp_path / "leftover.csv",
+        summary_dir=tmp_path / "summary.npz",
+    )
+    expected = RecipeAllocator(verbose=False)
+    assert expected.run(
+        orders=orders_json, recipes=recipes_json, engine=engine
+    )
+    leftover = read_recipe_arrays(tmp_path / "leftover.csv")
+    assert {
+        recipe_id: stock
+        for arrays in leftover.values()
+        for (recipe_id, stock) in zip(arrays["recipe_ids"], arrays["stock"])
+    } == expected.excess_stock["stock_count"].to_dict()
+    with np.load(tmp_path / "summary.npz") as summary:
+        assert list(summary) == SUMMARY_COLUMNS
+        assert summary["fulfilled"].all()
+        assert summary["portions"].sum() == 2 * 2 * 2 + 2 * 2 * 1 + 3 * 2 * 1
+
+
+def test_failed_run_summary(tmp_path):
+    """Test that the summary of a failed run shows which group could not be fulfilled, and
+    that no leftover stock is written
+    """
+    allocator = RecipeAllocator(verbose=False, precheck=False)
+    assert not allocator.run(
+        orders_dir="tests/orders_break_veg.json",
+        recipes_dir="tests/recipes.json",
+        engine="numpy",
+        leftover_dir=tmp_path / "leftover.csv",
+        summary_dir=tmp_path / "summary.csv",
+    )
+    assert not (tmp_path / "leftover.csv").exists()
+    with open(tmp_path / "summary.csv", "r") as f_in:
+        header, *rows = [line.split(",") for line in f_in.read().splitlines()]
+    assert header == SUMMARY_COLUMNS
+    fulfilled = [row[-1] for row in rows if row[0] == "vegetarian"]
+    assert fulfilled[0] == "True" and "False" in fulfilled
+    assert all(row[-1] == "False" for row in rows if row[0] == "gourmet")
+    with open("tests/orders_break_veg.json", "r") as f_in:
+        assert len(rows) == sum(
+            len(portions)
+            for recipe_categories in json.load(f_in).values()
+            for portions in recipe_categories.values()
+        )
+
+
+def test_cached_run_summary(tmp_path):
+    """Test that a run taken from the cache writes the same summary as the run it cached"""
+    allocator = RecipeAllocator(verbose=False, cache=ResultCache())
+    for name in ["first.csv", "cached.csv"]:
+        assert allocator.run(
+            orders_dir="tests/orders.json",
+            recipes_dir="tests/recipes.json",
+            engine="numpy",
+            summary_dir=tmp_path / name,
+        )
+    assert allocator.cache.stats()["hits"] == 1
+    with open(tmp_path / "first.csv", "r") as first:
+        with open(tmp_path / "cached.csv", "r") as cached:
+            assert cached.read() == first.read()
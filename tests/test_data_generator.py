@@ -1,6 +1,107 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+from gousto_test.generate_data import DataGenerator
+from gousto_test.order_allocation import RecipeAllocator
+
+
 def test_generate_orders():
     pass
 
 
 def test_generate_recipes():
     pass
+
+
+def test_seeded_generator_is_deterministic():
+    """Test that generators with the same seed produce the same data"""
+    first = DataGenerator(seed=5)
+    second = DataGenerator(rng=random.Random(5))
+    assert first.generate_recipes() == second.generate_recipes()
+    assert first.generate_orders() == second.generate_orders()
+
+
+def test_bulk_generator_is_deterministic():
+    """Test that the bulk methods give the same data for the same seed"""
+    first = DataGenerator(seed=11)
+    second = DataGenerator(seed=11)
+    recipes = first.generate_recipes_bulk(1000)
+    for key, column in second.generate_recipes_bulk(1000).items():
+        assert np.array_equal(recipes[key], column)
+    assert len(recipes["recipe_id"]) == 1000
+    orders = first.generate_orders_bulk(n_scenarios=5)
+    other_orders = second.generate_orders_bulk(n_scenarios=5)
+    assert np.array_equal(
+        orders["gourmet"]["four_recipes"]["two_portions"],
+        other_orders["gourmet"]["four_recipes"]["two_portions"],
+    )
+
+
+@pytest.mark.parametrize(
+    "distribution", ["uniform", "normal", "lognormal", "exponential"]
+)
+def test_generate_random_numbers(distribution):
+    """Test that random numbers from each distribution are within the limits"""
+    numbers = DataGenerator.generate_random_numbers(
+        10, 20, 1000, distribution=distribution
+    )
+    number = DataGenerator.generate_random_number(
+        10, 20, distribution=distribution
+    )
+    assert numbers.min() >= 10 and numbers.max() <= 20
+    assert 10 <= number <= 20
+
+
+def test_save_bulk_recipes_json(tmp_path):
+    """Test that bulk recipes are saved in the same json format as generate_recipes"""
+    generator = DataGenerator(seed=2)
+    generator.generate_recipes_bulk(50, save_dir=tmp_path / "recipes.json")
+    with open(tmp_path / "recipes.json", "r") as f_in:
+        recipes = json.load(f_in)
+    columns = DataGenerator(seed=2).generate_recipes_bulk(50)
+    assert list(recipes.keys()) == list(columns["recipe_id"])
+    assert [recipe["stock_count"] for recipe in recipes.values()] == list(
+        columns["stock_count"]
+    )
+
+
+@pytest.mark.parametrize("box_type", ["vegetarian", "gourmet"])
+def test_generate_infeasible_orders(box_type):
+    """Test that generated infeasible orders cannot be allocated"""
+    generator = DataGenerator(seed=3, min_orders=0, max_orders=10)
+    recipes = generator.generate_recipes()
+    orders = generator.generate_infeasible_orders(recipes, box_type=box_type)
+    allocator = RecipeAllocator(verbose=False)
+    assert not allocator.run(orders=orders, recipes=recipes, engine="numpy")
+
+
+@pytest.mark.parametrize(
+    "distribution", ["poisson", "negative_binomial", "normal", "lognormal"]
+)
+def test_generate_orders_around(orders_json, distribution):
+    """Test that sampled orders are seeded, non-negative and centred on the forecast"""
+    forecast = DataGenerator(seed=4).generate_orders()
+    orders = DataGenerator(seed=6).generate_orders_around(
+        forecast, 2000, distribution=distribution, spread=0.05
+    )
+    other_orders = DataGenerator(seed=6).generate_orders_around(
+        forecast, 2000, distribution=distribution, spread=0.05
+    )
+    counts = orders["gourmet"]["two_recipes"]["four_portions"]
+    assert np.array_equal(
+        counts, other_orders["gourmet"]["two_recipes"]["four_portions"]
+    )
+    assert counts.min() >= 0
+    expected = forecast["gourmet"]["two_recipes"]["four_portions"]
+    assert abs(counts.mean() - expected) < 0.01 * expected
+    # Options can be given per box_type, and zero forecasts stay at zero
+    orders = DataGenerator(seed=6).generate_orders_around(
+        orders_json,
+        10,
+        distribution={"vegetarian": "fixed", "gourmet": distribution},
+    )
+    assert (orders["vegetarian"]["two_recipes"]["two_portions"] == 2).all()
+    assert (orders["gourmet"]["four_recipes"]["two_portions"] == 0).all()
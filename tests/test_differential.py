@@ -0,0 +1,91 @@
+from benchmarks.differential import (
+    ENGINES,
+    check_case,
+    make_case,
+    run_differential,
+)
+from gousto_test import allocation_kernel
+from gousto_test.order_allocation import RecipeAllocator
+
+
+def test_run_differential():
+    """Test that every engine matches the pandas engine on every kind of case, and is timed"""
+    results = run_differential(n_cases=40, seed=1)
+    assert results["mismatches"] == []
+    assert set(results["timings"]) == {"pandas"} | set(ENGINES)
+    assert all(wall_time > 0 for wall_time in results["timings"].values())
+
+
+def test_threshold_case():
+    """Test that threshold cases have exactly the stock the pandas engine used"""
+    orders, recipes = make_case(4, "threshold")
+    assert check_case(orders, recipes, list(ENGINES)) == dict()
+
+
+def test_run_differential_shrinks_mismatches(monkeypatch):
+    """Test that a broken engine is caught and its case is shrunk to a smaller reproduction"""
+    bulk = allocation_kernel.KERNELS["bulk"]
+
+    def broken(stock, index, **kwargs):
+        result = bulk(stock, index, **kwargs)
+        if result["success"] and kwargs["num_orders"] >= 3:
+            result["stock"] = result["stock"] - 1
+        return result
+
+    monkeypatch.setitem(allocation_kernel.KERNELS, "bulk", broken)
+    results = run_differential(n_cases=1, seed=1, engines=["bulk"])
+    assert len(results["mismatches"]) == 1
+    mismatch = results["mismatches"][0]
+    assert mismatch["engine"] == "bulk"
+    orders, recipes = make_case(mismatch["seed"], mismatch["kind"])
+    assert len(mismatch["recipes"]) < len(recipes)
+    assert check_case(mismatch["orders"], mismatch["recipes"], ["bulk"])
+    assert (
+        sum(
+            count
+            for recipe_categories in mismatch["orders"].values()
+            for portions in recipe_categories.values()
+            for count in portions.values()
+        )
+        == 3
+    )
+
+
+def test_run_differential_shrinks_each_engine(monkeypatch):
+    """Test that two engines broken in different ways are each shrunk from the original case"""
+    kernels = dict(allocation_kernel.KERNELS)
+
+    def break_kernel(engine, is_broken):
+        def broken(stock, index, **kwargs):
+            result = kernels[engine](stock, index, **kwargs)
+            if result["success"] and is_broken(stock, kwargs):
+                result["stock"] = result["stock"] - 1
+            return result
+
+        monkeypatch.setitem(allocation_kernel.KERNELS, engine, broken)
+
+    break_kernel("bulk", lambda stock, kwargs: kwargs["num_orders"] >= 3)
+    break_kernel("numpy", lambda stock, kwargs: len(stock) >= 8)
+    results = run_differential(n_cases=3, seed=1, engines=["bulk", "numpy"])
+    engines = {mismatch["engine"] for mismatch in results["mismatches"]}
+    assert engines == {"bulk", "numpy"}
+    for mismatch in results["mismatches"]:
+        assert check_case(
+            mismatch["orders"], mismatch["recipes"], [mismatch["engine"]]
+        )
+
+
+def test_check_case_catches_exact_without_fallback(monkeypatch):
+    """Test that the harness catches the exact engine failing where the greedy engines do
+    not, as it did before it fell back on the greedy allocation
+    """
+    orders, recipes = make_case(87, "threshold")
+    assert check_case(orders, recipes, ["exact"]) == dict()
+    monkeypatch.setattr(
+        RecipeAllocator,
+        "allocate",
+        lambda allocator, engine="pandas": allocator.allocate_all(engine),
+    )
+    assert check_case(orders, recipes, ["exact"]) == {
+        "exact": "failed when the reference succeeded"
+    }
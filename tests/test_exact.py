@@ -0,0 +1,204 @@
+import copy
+import functools
+import itertools
+import random
+
+import numpy as np
+
+from gousto_test.allocation_kernel import allocate_group_exact
+from gousto_test.order_allocation import RecipeAllocator
+
+GRAPH = {"vegetarian": []}
+
+
+def make_data(stock, counts):
+    """Return vegetarian orders with counts of (two_recipes, two_portions), (two_recipes,
+    four_portions), (three_recipes, two_portions) and (three_recipes, four_portions) orders
+    """
+    orders = {
+        "vegetarian": {
+            "two_recipes": {
+                "two_portions": counts[0],
+                "four_portions": counts[1],
+            },
+            "three_recipes": {
+                "two_portions": counts[2],
+                "four_portions": counts[3],
+            },
+        }
+    }
+    recipes = {
+        f"recipe_{i}": {"stock_count": stock_count, "box_type": "vegetarian"}
+        for (i, stock_count) in enumerate(stock)
+    }
+    return orders, recipes
+
+
+def brute_force(stock, counts):
+    """Return whether the orders can be fulfilled, by trying every allocation"""
+    orders = [
+        (recipe_num, portion_num)
+        for ((recipe_num, portion_num), count) in zip(
+            [(2, 2), (2, 4), (3, 2), (3, 4)], counts
+        )
+        for _ in range(count)
+    ]
+
+    @functools.lru_cache(maxsize=None)
+    def search(i, stock):
+        if i == len(orders):
+            return True
+        recipe_num, portion_num = orders[i]
+        for recipes in itertools.combinations(range(len(stock)), recipe_num):
+            if all(stock[j] >= portion_num for j in recipes):
+                remaining = list(stock)
+                for j in recipes:
+                    remaining[j] -= portion_num
+                if search(i + 1, tuple(remaining)):
+                    return True
+        return False
+
+    return search(0, tuple(stock))
+
+
+def test_allocate_group_exact():
+    """Test that the exact kernel water-fills the recipes with the most stock"""
+    stock = np.array([2, 4, 6, 8], dtype=np.int64)
+    index = np.arange(4)
+    result = allocate_group_exact(
+        stock, index, num_portions=2, num_recipes=2, num_orders=3
+    )
+    assert result["success"]
+    assert sorted(result["stock"].tolist()) == [2, 2, 2, 2]
+    assert not allocate_group_exact(
+        stock, index, num_portions=4, num_recipes=2, num_orders=3
+    )["success"]
+
+
+def test_exact_succeeds_where_greedy_fails():
+    """Test that the exact engine allocates orders the greedy engines cannot, and gives every
+    order different recipes within the stock
+    """
+    stock, counts = [11, 10, 4, 10, 3], [0, 0, 2, 2]
+    orders, recipes = make_data(stock, counts)
+    greedy = RecipeAllocator(verbose=False, box_type_graph=GRAPH)
+    assert not greedy.run(orders=orders, recipes=recipes, engine="bulk")
+    allocator = RecipeAllocator(
+        verbose=False, box_type_graph=GRAPH, record_plan=True
+    )
+    assert allocator.run(orders=orders, recipes=recipes, engine="exact")
+    used = dict.fromkeys(recipes, 0)
+    for step in allocator.plan.steps():
+        assert len(set(step["recipe_ids"])) == step["recipe_num"]
+        for recipe_id in step["recipe_ids"]:
+            used[recipe_id] += step["portion_num"] * step["orders"]
+    for recipe_id, stock_count in allocator.excess_stock[
+        "stock_count"
+    ].items():
+        assert (
+            stock_count == recipes[recipe_id]["stock_count"] - used[recipe_id]
+        )
+        assert stock_count >= 0
+
+
+def test_exact_matches_brute_force():
+    """Test that the exact engine succeeds exactly when an allocation exists"""
+    rng = random.Random(0)
+    for _ in range(100):
+        stock = [rng.randint(0, 12) for _ in range(rng.randint(3, 5))]
+        counts = [rng.randint(0, 2) for _ in range(4)]
+        orders, recipes = make_data(stock, counts)
+        allocator = RecipeAllocator(
+            verbose=False, precheck=False, box_type_graph=GRAPH
+        )
+        assert allocator.run(
+            orders=orders, recipes=recipes, engine="exact"
+        ) == brute_force(stock, counts)
+
+
+def test_exact_update(orders_json, recipes_json):
+    """Test that update gives the same result as run with the exact engine"""
+    allocator = RecipeAllocator(verbose=False)
+    assert allocator.run(
+        orders=copy.deepcopy(orders_json),
+        recipes=copy.deepcopy(recipes_json),
+        engine="exact",
+    )
+    recipe_id = next(iter(recipes_json))
+    assert allocator.update(
+        stock_deltas={recipe_id: 10},
+        order_deltas={"gourmet": {"two_recipes": {"four_portions": 1}}},
+        verbose=False,
+    )
+    expected = RecipeAllocator(verbose=False)
+    assert expected.run(
+        orders=allocator.orders, recipes=allocator.recipes, engine="exact"
+    )
+    assert allocator.excess_stock.equals(expected.excess_stock)
+
+
+def test_cross_check():
+    """Test that the cross check reports when the exact engine allocates orders the greedy
+    engine cannot
+    """
+    orders, recipes = make_data([11, 10, 4, 10, 3], [0, 0, 2, 2])
+    allocator = RecipeAllocator(
+        verbose=False,
+        box_type_graph=GRAPH,
+        cross_check=True,
+        collect_metrics=True,
+    )
+    assert allocator.run(orders=orders, recipes=recipes, engine="exact")
+    assert allocator.cross_check_result == {
+        "exact": True,
+        "greedy": False,
+        "greedy_engine": "bulk",
+    }
+    assert allocator.metrics.counters[("cross_check_rescues", ())] == 1
+
+
+def test_exact_falls_back_on_greedy():
+    """Test that the exact engine uses the greedy allocation when water-filling the shared
+    vegetarian stock leaves too little for the gourmet orders. This is case 87 of the
+    differential harness's threshold cases, shrunk.
+    """
+    orders = {
+        "vegetarian": {
+            "two_recipes": {"two_portions": 0, "four_portions": 1},
+            "three_recipes": {"two_portions": 1, "four_portions": 2},
+            "four_recipes": {"two_portions": 1, "four_portions": 2},
+        },
+        "gourmet": {
+            "two_recipes": {"two_portions": 0, "four_portions": 0},
+            "three_recipes": {"two_portions": 0, "four_portions": 0},
+            "four_recipes": {"two_portions": 0, "four_portions": 1},
+        },
+    }
+    stock = [16, 10, 8, 22, 28, 8]
+    recipes = {
+        f"recipe_{i}": {"stock_count": stock_count, "box_type": "vegetarian"}
+        for (i, stock_count) in enumerate(stock)
+    }
+    recipes["recipe_gourmet"] = {"stock_count": 4, "box_type": "gourmet"}
+    greedy = RecipeAllocator(verbose=False, precheck=False)
+    assert greedy.run(orders=orders, recipes=recipes, engine="bulk")
+    allocator = RecipeAllocator(
+        verbose=False, precheck=False, cross_check=True
+    )
+    assert allocator.run(
+        orders=orders, recipes=copy.deepcopy(recipes), engine="exact"
+    )
+    assert allocator.cross_check_result["exact"] is False
+    assert allocator.engine == "bulk"
+    assert allocator.excess_stock.equals(greedy.excess_stock)
+    assert allocator.update(stock_deltas={"recipe_0": 1}, verbose=False)
+    # An update that the exact engine cannot replay falls back in the same way
+    recipes["recipe_0"]["stock_count"] += 4
+    allocator = RecipeAllocator(verbose=False, precheck=False)
+    assert allocator.run(
+        orders=orders, recipes=copy.deepcopy(recipes), engine="exact"
+    )
+    assert allocator.engine == "exact"
+    assert allocator.update(stock_deltas={"recipe_0": -4}, verbose=False)
+    assert allocator.engine == "bulk"
+    assert allocator.excess_stock.equals(greedy.excess_stock)
@@ -0,0 +1,69 @@
+import random
+
+from gousto_test.feasibility import check_feasibility
+from gousto_test.generate_data import DataGenerator
+from gousto_test.order_allocation import RecipeAllocator
+
+
+def test_check_feasibility_reports_group():
+    """Test that an impossible input is rejected along with the group that breaks it"""
+    allocator = RecipeAllocator(verbose=False)
+    allocator.load_data(
+        orders_dir="tests/orders_break_veg.json",
+        recipes_dir="tests/recipes.json",
+    )
+    result = check_feasibility(allocator)
+    assert not result["feasible"]
+    assert (
+        result["box_type"],
+        result["recipe_num"],
+        result["portion_num"],
+    ) == ("vegetarian", 2, 2)
+
+
+def test_check_feasibility_counting_bound():
+    """Test that orders needing more distinct recipes than have stock are rejected"""
+    allocator = RecipeAllocator(verbose=False)
+    allocator.set_data(
+        orders={
+            box_type: {
+                "two_recipes": {"two_portions": 0, "four_portions": 0},
+                "four_recipes": {"two_portions": 1, "four_portions": 0},
+            }
+            for box_type in ["vegetarian", "gourmet"]
+        },
+        recipes={
+            f"recipe_{i}": {"stock_count": 100, "box_type": "vegetarian"}
+            for i in range(3)
+        },
+    )
+    result = check_feasibility(allocator)
+    assert not result["feasible"] and result["recipe_num"] == 4
+    assert not allocator.run(
+        orders=allocator.orders, recipes=allocator.recipes, engine="numpy"
+    )
+    # The allocation loop never ran
+    assert allocator.iterations == dict()
+
+
+def test_check_feasibility_never_rejects_feasible_inputs():
+    """Test that inputs the allocator can fulfil always pass the check"""
+    for seed in range(200):
+        rng = random.Random(seed)
+        generator = DataGenerator(
+            max_recipes=rng.randint(3, 20),
+            min_recipes=3,
+            max_stock=rng.randint(1, 40),
+            min_stock=0,
+            max_orders=rng.randint(1, 5),
+            min_orders=0,
+            rng=rng,
+        )
+        allocator = RecipeAllocator(verbose=False, precheck=False)
+        success = allocator.run(
+            orders=generator.generate_orders(),
+            recipes=generator.generate_recipes(),
+            engine="numpy",
+        )
+        if success:
+            assert check_feasibility(allocator)["feasible"]
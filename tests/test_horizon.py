@@ -0,0 +1,100 @@
+import copy
+
+import numpy as np
+
+from benchmarks.horizon import make_horizon_case
+from gousto_test.horizon import load_history, run_horizon, save_history
+from gousto_test.order_allocation import RecipeAllocator
+
+
+def run_sequentially(steps, recipes):
+    """Return the leftover stock after each step, calling RecipeAllocator.run for every step"""
+    recipes = copy.deepcopy(recipes)
+    history = list()
+    for step in steps:
+        allocator = RecipeAllocator(verbose=False)
+        if allocator.run(orders=step["orders"], recipes=recipes):
+            for recipe_id, row in allocator.excess_stock.iterrows():
+                recipes[recipe_id]["stock_count"] = int(row["stock_count"])
+        history.append(
+            {
+                recipe_id: recipe["stock_count"]
+                for (recipe_id, recipe) in recipes.items()
+            }
+        )
+    return history
+
+
+def test_run_horizon_matches_sequential_runs():
+    """Test that every day of a horizon leaves the same stock as running the days one by one,
+    with any number of workers
+    """
+    steps, stock = make_horizon_case(
+        n_sites=3, n_days=4, n_recipes=10, n_orders=5
+    )
+    results = run_horizon(steps, stock)
+    assert list(results) == ["site_0", "site_1", "site_2"]
+    for site, result in results.items():
+        assert result["success"].all()
+        assert result["leftover"].dtype.kind == "u"
+        expected = run_sequentially(
+            [step for step in steps if step["site"] == site], stock[site]
+        )
+        for leftover, day in zip(result["leftover"], expected):
+            assert leftover.tolist() == [
+                day[recipe_id] for recipe_id in result["recipe_ids"]
+            ]
+    parallel = run_horizon(steps, stock, workers=2)
+    for site, result in results.items():
+        assert np.array_equal(result["leftover"], parallel[site]["leftover"])
+
+
+def test_run_horizon_restock_and_failure(orders_json, recipes_json):
+    """Test that a failing day uses no stock, and a restock lets the next day succeed"""
+    recipes = copy.deepcopy(recipes_json)
+    gourmet = [
+        recipe_id
+        for (recipe_id, recipe) in recipes.items()
+        if recipe["box_type"] == "gourmet"
+    ]
+    for recipe_id in gourmet:
+        recipes[recipe_id]["stock_count"] = 0
+    steps = [
+        {"site": "site", "day": day, "orders": orders_json} for day in range(3)
+    ]
+    steps[2]["restock"] = {recipe_id: 10 for recipe_id in gourmet}
+    result = run_horizon(list(reversed(steps)), {"site": recipes})["site"]
+    assert result["days"] == [0, 1, 2]
+    assert result["success"].tolist() == [False, False, True]
+    initial = [
+        recipes[recipe_id]["stock_count"] for recipe_id in result["recipe_ids"]
+    ]
+    assert result["leftover"][0].tolist() == initial
+    assert result["leftover"][1].tolist() == initial
+    expected = run_sequentially(
+        [{"orders": orders_json}],
+        {
+            recipe_id: {**recipe, "stock_count": 10}
+            if recipe_id in gourmet
+            else recipe
+            for (recipe_id, recipe) in recipes.items()
+        },
+    )[0]
+    assert result["leftover"][2].tolist() == [
+        expected[recipe_id] for recipe_id in result["recipe_ids"]
+    ]
+
+
+def test_save_and_load_history(tmp_path):
+    """Test that a horizon's history can be saved to an npz file and loaded back"""
+    steps, stock = make_horizon_case(
+        n_sites=2, n_days=2, n_recipes=10, n_orders=5
+    )
+    results = run_horizon(steps, stock)
+    file_path = tmp_path / "history.npz"
+    save_history(results, file_path)
+    loaded = load_history(file_path)
+    assert list(loaded) == list(results)
+    for site, result in results.items():
+        for key, values in result.items():
+            assert np.array_equal(loaded[site][key], values)
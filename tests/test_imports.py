@@ -0,0 +1,75 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+# The most time importing the allocator may take, in milliseconds. Import times are wall
+# clock times, so the default leaves plenty of room for a busy machine, and the
+# IMPORT_TIME_BUDGET_MS environment variable can change it, or turn the check off with 0.
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", 1000))
+HEAVY_MODULES = ["pandas", "word2number"]
+
+
+def run_python(*args):
+    """Run python in a new process from the root of the repo and return its stderr"""
+    return subprocess.run(
+        [sys.executable, *args],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(TESTS_DIR),
+    ).stderr
+
+
+def get_import_time_ms():
+    """Return the cumulative time in milliseconds taken to import the allocator, as reported
+    by -X importtime in microseconds
+    """
+    stderr = run_python(
+        "-X", "importtime", "-c", "import gousto_test.order_allocation"
+    )
+    for line in stderr.splitlines():
+        if line.startswith("import time:"):
+            _, cumulative_us, module = line.split("|")
+            if module.strip() == "gousto_test.order_allocation":
+                return int(cumulative_us) / 1000
+    raise AssertionError("gousto_test.order_allocation was not imported")
+
+
+def test_import_does_not_import_heavy_modules():
+    """Test that importing the allocator in a fresh interpreter does not import pandas or
+    word2number
+    """
+    stderr = run_python(
+        "-c",
+        "import sys\n"
+        "import gousto_test.order_allocation\n"
+        f"sys.stderr.write(repr([module for module in {HEAVY_MODULES!r} "
+        "if module in sys.modules]))\n",
+    )
+    assert stderr.endswith("[]")
+
+
+def test_import_time_budget():
+    """Test that importing the allocator is quick"""
+    if IMPORT_TIME_BUDGET_MS <= 0:
+        pytest.skip("IMPORT_TIME_BUDGET_MS is 0")
+    assert get_import_time_ms() < IMPORT_TIME_BUDGET_MS
+
+
+def test_numpy_run_does_not_import_pandas():
+    """Test that a run with a numpy engine only imports pandas once excess_stock is used"""
+    stderr = run_python(
+        "-c",
+        "import sys\n"
+        "from gousto_test.order_allocation import RecipeAllocator\n"
+        "allocator = RecipeAllocator(verbose=False)\n"
+        f"assert allocator.run(orders_dir={os.path.join(TESTS_DIR, 'orders.json')!r}, "
+        f"recipes_dir={os.path.join(TESTS_DIR, 'recipes.json')!r}, engine='numpy')\n"
+        "sys.stderr.write(str('pandas' in sys.modules))\n"
+        "allocator.excess_stock\n"
+        "sys.stderr.write(str('pandas' in sys.modules))\n",
+    )
+    assert stderr.endswith("FalseTrue")
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from gousto_test.allocation_kernel import sort_stock
+from gousto_test.ledger import StockLedger
+
+
+def make_ledger():
+    return StockLedger.from_arrays(
+        ["recipe_1", "recipe_2", "recipe_3", "recipe_4"],
+        [5, 2, 5, 0],
+        ["vegetarian", "gourmet", "vegetarian", "gourmet"],
+    )
+
+
+def test_ledger_sorted_and_select():
+    """Test that a sorted ledger keeps the order of ties, and that selecting a box_type shares
+    the rows of the ledger
+    """
+    ledger = make_ledger().sorted()
+    assert ledger.codes.dtype == np.uint8
+    assert ledger.entry_recipe_ids().tolist() == [
+        "recipe_4",
+        "recipe_2",
+        "recipe_1",
+        "recipe_3",
+    ]
+    vegetarian = ledger.select("vegetarian")
+    assert vegetarian.recipe_ids is ledger.recipe_ids
+    assert vegetarian.entry_recipe_ids().tolist() == ["recipe_1", "recipe_3"]
+    assert vegetarian.entry_box_types().tolist() == ["vegetarian"] * 2
+    assert len(ledger.select(["vegetarian", "gourmet"])) == 4
+
+
+def test_ledger_concatenate_and_restock():
+    """Test that ledgers with different box_types can be joined, and restocked in place of a
+    full sort
+    """
+    own = StockLedger.from_arrays(["recipe_5"], [3], "gourmet")
+    pool = StockLedger.concatenate(
+        [own, make_ledger().sorted().select("vegetarian")]
+    )
+    assert pool.box_types == ("gourmet", "vegetarian")
+    assert pool.entry_box_types().tolist() == [
+        "gourmet",
+        "vegetarian",
+        "vegetarian",
+    ]
+    pool = pool.sorted()
+    restocked = pool.restock([0, 2], [4, -1])
+    stock, index = sort_stock(np.array([7, 5, 4]))
+    assert restocked.stock.tolist() == stock.tolist()
+    assert restocked.index.tolist() == index.tolist()
+    # The ledger it was made from is unchanged
+    assert pool.stock.tolist() == [3, 5, 5]
+
+
+def test_ledger_to_frame():
+    """Test that a ledger can be turned into a leftover stock DataFrame and back"""
+    df = make_ledger().to_frame()
+    assert df.index.tolist() == [
+        "recipe_1",
+        "recipe_2",
+        "recipe_3",
+        "recipe_4",
+    ]
+    assert df["stock_count"].tolist() == [5, 2, 5, 0]
+    ledger = StockLedger.from_frame(df)
+    assert ledger.to_frame().equals(df)
+
+
+def test_ledger_box_type_limit():
+    """Test that a ledger rejects more box_types than its uint8 codes can hold"""
+    box_types = [f"box_type_{i}" for i in range(257)]
+    with pytest.raises(AssertionError):
+        StockLedger.from_arrays(box_types, np.ones(257), box_types)
+    ledger = StockLedger.from_arrays(
+        box_types[:256], np.ones(256), box_types[:256]
+    )
+    assert ledger.entry_box_types()[-1] == "box_type_255"
@@ -0,0 +1,99 @@
+import io
+import logging
+
+import numpy as np
+import pytest
+
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.utils.logging import (
+    LISTENERS,
+    StockTable,
+    disable_async_logging,
+    enable_async_logging,
+)
+
+
+def make_table(**kwargs):
+    return StockTable(
+        np.array(["recipe_1", "recipe_2", "recipe_3"], dtype=object),
+        np.array([4, 0, 10]),
+        np.array(["vegetarian", "vegetarian", "gourmet"], dtype=object),
+        **kwargs,
+    )
+
+
+def test_stock_table():
+    """Test that stock tables list every recipe, or the totals and the recipes with the most
+    stock in summary mode
+    """
+    lines = str(make_table()).splitlines()
+    assert len(lines) == 4
+    assert lines[1].split() == ["recipe_1", "4", "vegetarian"]
+    lines = str(make_table(mode="summary", top_n=1)).splitlines()
+    assert lines[0].startswith(
+        "3 recipes, 14 portions in stock, 1 out of stock"
+    )
+    assert len(lines) == 3
+    assert lines[2].split() == ["recipe_3", "10", "gourmet"]
+
+
+def test_stock_table_is_lazy(monkeypatch):
+    """Test that a stock table is not rendered when nothing is written"""
+    rendered = list()
+    monkeypatch.setattr(
+        StockTable, "__str__", lambda table: rendered.append(table) or ""
+    )
+    logger = logging.getLogger("test_stock_table_is_lazy")
+    logger.setLevel(logging.WARNING)
+    logger.info(make_table())
+    assert rendered == []
+    logger.warning(make_table())
+    assert rendered
+
+
+@pytest.mark.parametrize("engine", ["pandas", "numpy", "bulk"])
+def test_quiet_allocator_makes_no_stock_tables(monkeypatch, engine):
+    """Test that a RecipeAllocator with verbose=False does not build any stock tables"""
+    tables = list()
+    init = StockTable.__init__
+
+    def record(table, *args, **kwargs):
+        tables.append(table)
+        init(table, *args, **kwargs)
+
+    monkeypatch.setattr(StockTable, "__init__", record)
+    allocator = RecipeAllocator(verbose=False)
+    assert allocator.run(
+        orders_dir="tests/orders.json",
+        recipes_dir="tests/recipes.json",
+        engine=engine,
+    )
+    assert tables == []
+    assert RecipeAllocator().run(
+        orders_dir="tests/orders.json",
+        recipes_dir="tests/recipes.json",
+        engine=engine,
+    )
+    assert tables
+
+
+def test_async_logging():
+    """Test that async logging writes every record in order, respecting handler levels"""
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setLevel(logging.INFO)
+    logger = logging.getLogger("test_async_logging")
+    logger.addHandler(handler)
+    enable_async_logging("test_async_logging", batch_size=7)
+    assert handler not in logger.handlers
+    for i in range(50):
+        logger.info(f"record {i}")
+    logger.debug("not written")
+    logger.info(make_table(mode="summary"))
+    disable_async_logging("test_async_logging")
+    assert "test_async_logging" not in LISTENERS
+    assert logger.handlers == [handler]
+    lines = stream.getvalue().splitlines()
+    assert lines[:50] == [f"record {i}" for i in range(50)]
+    assert lines[50].startswith("3 recipes")
+    assert "not written" not in lines
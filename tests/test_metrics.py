@@ -0,0 +1,95 @@
+import json
+import threading
+
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.utils.metrics import NULL_PHASE, Metrics
+
+
+def test_disabled_metrics_record_nothing():
+    """Test that nothing is recorded when metrics are disabled"""
+    allocator = RecipeAllocator(verbose=False)
+    allocator.run(
+        orders_dir="tests/orders.json", recipes_dir="tests/recipes.json"
+    )
+    assert allocator.metrics.phase("load") is NULL_PHASE
+    assert allocator.metrics.to_dict() == {"timings": [], "counters": []}
+
+
+def test_metrics_collect_phases_and_counters():
+    """Test that each phase is timed and iterations are counted for every engine"""
+    counters = dict()
+    for engine in ["pandas", "numpy"]:
+        allocator = RecipeAllocator(verbose=False, collect_metrics=True)
+        allocator.run(
+            orders_dir="tests/orders.json",
+            recipes_dir="tests/recipes.json",
+            engine=engine,
+        )
+        metrics = allocator.metrics.to_dict()
+        phases = {timing["phase"] for timing in metrics["timings"]}
+        assert {
+            "run",
+            "load",
+            "parse_categories",
+            "assign_orders",
+            "allocate_group",
+            "sort",
+        } <= phases
+        counters[engine] = {
+            (counter["name"], counter["labels"]["box_type"]): counter["value"]
+            for counter in metrics["counters"]
+            if counter["labels"]["recipes"] == 2
+            and counter["labels"]["portions"] == 2
+        }
+    assert counters["pandas"] == counters["numpy"]
+    assert counters["numpy"][("iterations", "vegetarian")] == 1
+
+
+def test_metrics_export():
+    """Test that metrics can be exported as json and in the Prometheus text format"""
+    metrics = Metrics(enabled=True)
+    with metrics.phase("allocate_group", box_type="gourmet"):
+        metrics.increment("iterations", 3, box_type="gourmet")
+    assert json.loads(metrics.to_json())["counters"] == [
+        {"name": "iterations", "labels": {"box_type": "gourmet"}, "value": 3}
+    ]
+    prometheus = metrics.to_prometheus()
+    assert 'gousto_allocator_iterations_total{box_type="gourmet"} 3' in (
+        prometheus
+    )
+    assert (
+        'gousto_allocator_phase_calls_total{phase="allocate_group",box_type="gourmet"} 1'
+        in prometheus
+    )
+
+
+def test_profile_capture():
+    """Test that a cProfile or tracemalloc profile of a run can be captured"""
+    for profile in ["cprofile", "tracemalloc"]:
+        allocator = RecipeAllocator(verbose=False, profile=profile)
+        allocator.run(
+            orders_dir="tests/orders.json",
+            recipes_dir="tests/recipes.json",
+            engine="numpy",
+        )
+        assert allocator.metrics.profile_report(limit=5)
+
+
+def test_metrics_export_while_recording():
+    """Test that metrics can be exported while another thread adds new labelled keys"""
+    metrics = Metrics(enabled=True)
+    done = threading.Event()
+
+    def record():
+        for i in range(20000):
+            with metrics.phase("allocate_group", recipes=i):
+                metrics.increment("iterations", recipes=i)
+        done.set()
+
+    thread = threading.Thread(target=record)
+    thread.start()
+    while not done.is_set():
+        metrics.to_prometheus()
+        metrics.to_dict()
+    thread.join()
+    assert len(metrics.to_dict()["counters"]) == 20000
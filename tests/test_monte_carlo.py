@@ -0,0 +1,113 @@
+import json
+
+import numpy as np
+
+from benchmarks.allocator import make_case
+from gousto_test.generate_data import DataGenerator
+from gousto_test.monte_carlo import main, run_monte_carlo
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.parallel import scenario_seed
+
+
+def make_tight_case():
+    """A case that can only be fulfilled for some of the samples around its orders"""
+    orders, recipes = make_case(n_recipes=10, n_orders=20, n_categories=3)
+    for recipe in recipes.values():
+        recipe["stock_count"] = int(recipe["stock_count"] * 0.35)
+    return orders, recipes
+
+
+def test_run_monte_carlo_matches_run():
+    """Test that the feasibility and leftover stock quantiles match calling run on every
+    sample, and do not depend on the number of workers
+    """
+    orders, recipes = make_tight_case()
+    results = run_monte_carlo(
+        orders, recipes, n_samples=30, batch_size=8, seed=3, spread=0.2
+    )
+    leftover, n_feasible = list(), 0
+    for batch, start in enumerate(range(0, 30, 8)):
+        n_samples = min(8, 30 - start)
+        samples = DataGenerator(
+            seed=scenario_seed(3, batch)
+        ).generate_orders_around(orders, n_samples, spread=0.2)
+        for i in range(n_samples):
+            sample = {
+                box_type: {
+                    recipe: {
+                        portion: int(counts[i])
+                        for (portion, counts) in portions.items()
+                    }
+                    for (recipe, portions) in box_orders.items()
+                }
+                for (box_type, box_orders) in samples.items()
+            }
+            allocator = RecipeAllocator(verbose=False)
+            if allocator.run(orders=sample, recipes=recipes, engine="numpy"):
+                n_feasible += 1
+                leftover.append(allocator.excess_stock["stock_count"])
+    assert 0 < n_feasible < 30
+    assert results["n_feasible"] == n_feasible
+    assert results["p_feasible"] == n_feasible / 30
+    df = results["leftover"]
+    assert list(df.columns) == ["box_type", "stock_count", "p5", "p50", "p95"]
+    expected = np.quantile(
+        np.array([series[df.index].to_numpy() for series in leftover]),
+        [0.05, 0.5, 0.95],
+        axis=0,
+    ).T
+    assert np.allclose(df[["p5", "p50", "p95"]].to_numpy(), expected)
+    parallel = run_monte_carlo(
+        orders,
+        recipes,
+        n_samples=30,
+        batch_size=8,
+        seed=3,
+        spread=0.2,
+        workers=2,
+    )
+    assert parallel["leftover"].equals(df)
+
+
+def test_run_monte_carlo_parses_recipes_once(monkeypatch):
+    """Test that the recipes are only loaded into the allocator once, not for every batch"""
+    calls = list()
+    set_data = RecipeAllocator.set_data
+
+    def record(allocator, **kwargs):
+        calls.append(kwargs)
+        set_data(allocator, **kwargs)
+
+    monkeypatch.setattr(RecipeAllocator, "set_data", record)
+    orders, recipes = make_tight_case()
+    run_monte_carlo(orders, recipes, n_samples=30, batch_size=8)
+    assert len(calls) == 1
+
+
+def test_monte_carlo_cli_fixed(tmp_path):
+    """Test that the CLI accepts fixed orders, which are feasible exactly when run is"""
+    orders, recipes = make_tight_case()
+    for name, data in [("orders.json", orders), ("recipes.json", recipes)]:
+        with open(tmp_path / name, "w") as f_out:
+            json.dump(data, f_out)
+    main(
+        [
+            "--orders",
+            str(tmp_path / "orders.json"),
+            "--recipes",
+            str(tmp_path / "recipes.json"),
+            "--samples",
+            "5",
+            "--distribution",
+            "fixed",
+            "--output",
+            str(tmp_path / "leftover.csv"),
+        ]
+    )
+    with open(tmp_path / "leftover.csv", "r") as f_in:
+        rows = f_in.read().splitlines()
+    assert len(rows) == len(recipes) + 1
+    feasible = RecipeAllocator(verbose=False).run(
+        orders=orders, recipes=recipes, engine="numpy"
+    )
+    assert (rows[1].split(",")[-1] != "") == feasible
@@ -1,3 +1,11 @@
+import copy
+import random
+
+import numpy as np
+import pytest
+
+from gousto_test.allocation_kernel import restock, sort_stock
+from gousto_test.generate_data import DataGenerator
 from gousto_test.order_allocation import RecipeAllocator
 
 
@@ -60,3 +68,223 @@ def test_assign_orders():
     )
     result = allocator.assign_orders(box_type="vegetarian")
     assert result["excess_stock"].loc["recipe_2", "stock_count"] == 6
+
+
+@pytest.mark.parametrize("engine", ["numpy", "bulk"])
+def test_fullfill_orders_numpy_engine(engine):
+    """Test that the numpy engines pass and fail on the same examples as the pandas engine"""
+    allocator = RecipeAllocator()
+    assert allocator.run(
+        orders_dir="tests/orders.json",
+        recipes_dir="tests/recipes.json",
+        engine=engine,
+    )
+    assert not allocator.run(
+        orders_dir="tests/orders_break_veg.json",
+        recipes_dir="tests/recipes.json",
+        engine=engine,
+    )
+
+
+def test_assign_orders_numpy_matches_pandas():
+    """Test that the numpy engine returns exactly the same leftover stock as the pandas engine"""
+    random.seed(3)
+    generator = DataGenerator(
+        max_recipes=30,
+        min_recipes=30,
+        max_stock=400,
+        min_stock=0,
+        max_orders=12,
+        min_orders=0,
+    )
+    allocator = RecipeAllocator(verbose=False)
+    allocator.recipes = generator.generate_recipes()
+    allocator.orders = generator.generate_orders()
+    allocator.get_categories_from_json()
+    results = dict()
+    for engine in ["pandas", "numpy", "bulk"]:
+        veg_result = allocator.assign_orders(
+            box_type="vegetarian", engine=engine
+        )
+        results[engine] = allocator.assign_orders(
+            box_type="gourmet",
+            excess_stock=veg_result["excess_stock"],
+            engine=engine,
+        )
+    pandas_stock = results["pandas"]["excess_stock"]
+    for engine in ["numpy", "bulk"]:
+        assert results[engine]["success"]
+        numpy_stock = results[engine]["excess_stock"]
+        assert list(pandas_stock.index) == list(numpy_stock.index)
+        assert list(pandas_stock["stock_count"]) == list(
+            numpy_stock["stock_count"]
+        )
+
+
+def test_bulk_engine_takes_fewer_iterations():
+    """Test that the bulk engine drains many low stock recipes in a single iteration"""
+    allocator = RecipeAllocator(verbose=False)
+    allocator.recipes = {
+        f"recipe_{i}": {"stock_count": 2, "box_type": "vegetarian"}
+        for i in range(50)
+    }
+    allocator.recipes["recipe_50"] = {
+        "stock_count": 1000,
+        "box_type": "vegetarian",
+    }
+    allocator.orders = {
+        box_type: {
+            "two_recipes": {"two_portions": 40, "four_portions": 0},
+            "three_recipes": {"two_portions": 0, "four_portions": 0},
+        }
+        for box_type in ["vegetarian", "gourmet"]
+    }
+    allocator.get_categories_from_json()
+    allocator.assign_orders(box_type="vegetarian", engine="numpy")
+    numpy_iterations = allocator.iterations[("vegetarian", 2, 2)]
+    allocator.assign_orders(box_type="vegetarian", engine="bulk")
+    bulk_iterations = allocator.iterations[("vegetarian", 2, 2)]
+    assert numpy_iterations == 40 and bulk_iterations == 1
+
+
+def test_run_batch_matches_run(orders_json, recipes_json):
+    """Test that run_batch gives the same answer as calling run on each scenario"""
+    random.seed(7)
+    generator = DataGenerator(max_orders=3, min_orders=0)
+    scenarios = [{"orders": orders_json, "recipes": recipes_json}]
+    scenarios += [
+        {
+            "orders": generator.generate_orders(),
+            "recipes": {
+                key: {
+                    "stock_count": random.randint(0, 20),
+                    "box_type": value["box_type"],
+                }
+                for (key, value) in recipes_json.items()
+            },
+        }
+        for _ in range(20)
+    ]
+    allocator = RecipeAllocator(verbose=False)
+    result = allocator.run_batch(scenarios)
+    assert len(result) == len(scenarios)
+    for i, scenario in enumerate(scenarios):
+        success = allocator.run(
+            orders=scenario["orders"], recipes=scenario["recipes"]
+        )
+        assert result.loc[i, "success"] == success
+        if success:
+            excess_stock = allocator.excess_stock["stock_count"]
+            for recipe_id in excess_stock.index:
+                assert result.loc[i, recipe_id] == excess_stock[recipe_id]
+
+
+def test_run_batch_stacked_arrays(orders_json, recipes_json):
+    """Test that run_batch accepts stock counts stacked into arrays"""
+    recipes = {
+        key: {
+            "stock_count": np.array([value["stock_count"], 0]),
+            "box_type": value["box_type"],
+        }
+        for (key, value) in recipes_json.items()
+    }
+    allocator = RecipeAllocator(verbose=False)
+    result = allocator.run_batch({"orders": orders_json, "recipes": recipes})
+    assert list(result["success"]) == [True, False]
+    assert result.loc[0, "recipe_2"] == 2
+
+
+def test_restock_matches_sort_stock():
+    """Test that restock gives the same arrays as sorting the changed stock"""
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        stock = rng.integers(0, 5, 30)
+        rows = rng.choice(30, 4, replace=False)
+        change = rng.integers(-3, 4, 4)
+        new_stock = stock.copy()
+        new_stock[rows] += change
+        result = restock(*sort_stock(stock), rows, change)
+        expected = sort_stock(new_stock)
+        assert np.array_equal(result[0], expected[0])
+        assert np.array_equal(result[1], expected[1])
+
+
+@pytest.mark.parametrize("engine", ["numpy", "bulk"])
+def test_update_matches_run(engine):
+    """Test that updating an allocation gives the same answer as running it again"""
+    generator = DataGenerator(
+        max_recipes=30,
+        min_recipes=30,
+        max_stock=60,
+        min_stock=0,
+        max_orders=4,
+        min_orders=0,
+        seed=3,
+    )
+    recipes = generator.generate_recipes()
+    orders = generator.generate_orders()
+    allocator = RecipeAllocator(verbose=False)
+    allocator.run(
+        orders=copy.deepcopy(orders),
+        recipes=copy.deepcopy(recipes),
+        engine=engine,
+    )
+    changes = [
+        {"order_deltas": {"gourmet": {"two_recipes": {"two_portions": 2}}}},
+        {"stock_deltas": {"recipe_3": 5, "recipe_7": -1}},
+        {
+            "order_deltas": {
+                "vegetarian": {"three_recipes": {"four_portions": 1}}
+            }
+        },
+    ]
+    for change in changes:
+        for key, deltas in change.get("stock_deltas", dict()).items():
+            recipes[key]["stock_count"] += deltas
+        for box_type, recipe_categories in change.get(
+            "order_deltas", dict()
+        ).items():
+            for recipe_category, portions in recipe_categories.items():
+                for portion_category, delta in portions.items():
+                    orders[box_type][recipe_category][
+                        portion_category
+                    ] += delta
+        success = allocator.update(**change, verbose=False)
+        expected = RecipeAllocator(verbose=False)
+        assert success == expected.run(
+            orders=copy.deepcopy(orders),
+            recipes=copy.deepcopy(recipes),
+            engine=engine,
+        )
+        if success:
+            assert allocator.excess_stock.equals(expected.excess_stock)
+
+
+def test_update_replays_from_changed_group(orders_json, recipes_json):
+    """Test that only the order groups from the first changed group onwards are replayed"""
+    allocator = RecipeAllocator(verbose=False)
+    assert allocator.run(
+        orders=orders_json, recipes=recipes_json, engine="numpy"
+    )
+    veg_checkpoints = list(allocator.checkpoints["vegetarian"])
+    gourmet_checkpoints = list(allocator.checkpoints["gourmet"])
+    # two_recipes/two_portions is the last gourmet group to be allocated
+    allocator.update(
+        order_deltas={"gourmet": {"two_recipes": {"two_portions": -1}}}
+    )
+    assert all(
+        new[0] is old[0]
+        for (new, old) in zip(
+            allocator.checkpoints["vegetarian"], veg_checkpoints
+        )
+    )
+    assert all(
+        new[0] is old[0]
+        for (new, old) in zip(
+            allocator.checkpoints["gourmet"][:-1], gourmet_checkpoints[:-1]
+        )
+    )
+    assert (
+        allocator.checkpoints["gourmet"][-1][0]
+        is not gourmet_checkpoints[-1][0]
+    )
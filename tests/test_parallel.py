@@ -0,0 +1,87 @@
+import random
+
+import numpy as np
+
+from gousto_test.columnar import write_columns
+from gousto_test.generate_data import DataGenerator
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.parallel import run_scenarios, scenario_seed
+
+GENERATOR_KWARGS = dict(max_recipes=10, min_recipes=5, max_orders=30)
+
+
+def test_run_scenarios_is_deterministic():
+    """Test that the same seed gives the same results, whatever the number of workers"""
+    first = list(
+        run_scenarios(
+            n_scenarios=6,
+            seed=1,
+            workers=2,
+            chunksize=2,
+            generator_kwargs=GENERATOR_KWARGS,
+        )
+    )
+    second = list(
+        run_scenarios(
+            n_scenarios=6,
+            seed=1,
+            workers=3,
+            generator_kwargs=GENERATOR_KWARGS,
+        )
+    )
+    assert first == second
+    assert [result["scenario"] for result in first] == list(range(6))
+
+
+def test_run_scenarios_matches_run():
+    """Test that the parallel results are the same as running each scenario in this process"""
+    results = run_scenarios(
+        n_scenarios=4, seed=2, workers=2, generator_kwargs=GENERATOR_KWARGS
+    )
+    allocator = RecipeAllocator(verbose=False)
+    for i, result in enumerate(results):
+        generator = DataGenerator(
+            rng=random.Random(scenario_seed(2, i)), **GENERATOR_KWARGS
+        )
+        recipes = generator.generate_recipes()
+        orders = generator.generate_orders()
+        assert result["success"] == allocator.run(
+            orders=orders, recipes=recipes
+        )
+
+
+def test_run_scenarios_from_files():
+    """Test that scenarios can be loaded from json files"""
+    results = run_scenarios(
+        scenario_files=[
+            ("tests/orders.json", "tests/recipes.json"),
+            ("tests/orders_break_veg.json", "tests/recipes.json"),
+        ],
+        workers=2,
+    )
+    assert [result["success"] for result in results] == [True, False]
+
+
+def test_run_scenarios_from_columnar_files(tmp_path, recipes_json):
+    """Test that scenarios loaded as stock arrays count their recipes"""
+    write_columns(
+        {
+            "recipe_id": np.array(list(recipes_json), dtype=object),
+            "stock_count": np.array(
+                [recipe["stock_count"] for recipe in recipes_json.values()]
+            ),
+            "box_type": np.array(
+                [recipe["box_type"] for recipe in recipes_json.values()],
+                dtype=object,
+            ),
+        },
+        tmp_path / "recipes.csv",
+    )
+    results = list(
+        run_scenarios(
+            scenario_files=[("tests/orders.json", tmp_path / "recipes.csv")],
+            workers=1,
+        )
+    )
+    assert results[0]["success"]
+    assert results[0]["n_recipes"] == len(recipes_json)
@@ -0,0 +1,88 @@
+import copy
+import json
+
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.plan import AssignmentPlan
+
+
+def test_plan_matches_orders_and_stock(orders_json, recipes_json):
+    """Test that the plan covers every order, with distinct recipes, using up the stock removed"""
+    allocator = RecipeAllocator(verbose=False, record_plan=True)
+    assert allocator.run(
+        orders=orders_json, recipes=copy.deepcopy(recipes_json), engine="bulk"
+    )
+    orders = dict()
+    used = dict()
+    for step in allocator.plan.steps():
+        assert len(set(step["recipe_ids"])) == step["recipe_num"]
+        group = (step["box_type"], step["recipe_num"], step["portion_num"])
+        orders[group] = orders.get(group, 0) + step["orders"]
+        for recipe_id in step["recipe_ids"]:
+            used[recipe_id] = (
+                used.get(recipe_id, 0) + step["orders"] * step["portion_num"]
+            )
+    for box_type in ["vegetarian", "gourmet"]:
+        for (
+            recipe_num,
+            portion_num,
+            orders_to_fulfill,
+        ) in allocator.get_order_groups(box_type):
+            assert (
+                orders.get((box_type, recipe_num, portion_num), 0)
+                == orders_to_fulfill
+            )
+    for recipe_id, recipe in recipes_json.items():
+        assert recipe["stock_count"] - used.get(recipe_id, 0) == (
+            allocator.excess_stock.loc[recipe_id, "stock_count"]
+        )
+    assert len(list(allocator.plan.iter_orders())) == sum(orders.values())
+
+
+def test_plan_same_for_every_engine(orders_json, recipes_json):
+    """Test that each engine records the same plan"""
+    plans = list()
+    for engine in ["pandas", "numpy", "bulk"]:
+        allocator = RecipeAllocator(verbose=False, record_plan=True)
+        assert allocator.run(
+            orders=orders_json,
+            recipes=copy.deepcopy(recipes_json),
+            engine=engine,
+        )
+        plans.append(list(allocator.plan.steps()))
+    assert plans[0] == plans[1] == plans[2]
+
+
+def test_plan_after_update(orders_json, recipes_json):
+    """Test that an update gives the same plan as running again with the changed data"""
+    allocator = RecipeAllocator(verbose=False, record_plan=True)
+    assert allocator.run(
+        orders=orders_json, recipes=copy.deepcopy(recipes_json), engine="bulk"
+    )
+    deltas = {"vegetarian": {"two_recipes": {"two_portions": -1}}}
+    assert allocator.update(
+        order_deltas=deltas, stock_deltas={"recipe_4": 2}, verbose=False
+    )
+    expected = RecipeAllocator(verbose=False, record_plan=True)
+    assert expected.run(
+        orders=allocator.orders, recipes=allocator.recipes, engine="bulk"
+    )
+    assert list(allocator.plan.steps()) == list(expected.plan.steps())
+
+
+def test_plan_exports(tmp_path, orders_json, recipes_json):
+    """Test that plans can be saved as npz, csv and json lines"""
+    allocator = RecipeAllocator(verbose=False, record_plan=True)
+    assert allocator.run(
+        orders=orders_json, recipes=copy.deepcopy(recipes_json), engine="numpy"
+    )
+    plan = allocator.plan
+    plan.save_npz(str(tmp_path / "plan.npz"))
+    loaded = AssignmentPlan.load_npz(str(tmp_path / "plan.npz"))
+    assert list(loaded.steps()) == list(plan.steps())
+    plan.save_csv(str(tmp_path / "plan.csv"))
+    with open(tmp_path / "plan.csv") as f_in:
+        assert len(f_in.readlines()) == len(plan) + 1
+    plan.save_jsonl(str(tmp_path / "plan.jsonl"), per_order=True)
+    with open(tmp_path / "plan.jsonl") as f_in:
+        rows = [json.loads(line) for line in f_in]
+    assert rows == list(plan.iter_orders())
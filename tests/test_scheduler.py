@@ -0,0 +1,149 @@
+import copy
+
+import pytest
+
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.scheduler import (
+    get_allocation_order,
+    get_waits,
+    run_schedule,
+    validate_graph,
+)
+
+GRAPH = {
+    "vegan": [],
+    "vegetarian": ["vegan"],
+    "gourmet": ["vegetarian"],
+    "fish": [],
+    "family": ["fish", "vegan"],
+}
+
+
+def make_data(graph, orders=2, stock=20, recipes_per_box_type=5):
+    """Return orders and recipes with the same orders and stock for every box_type"""
+    orders = {
+        box_type: {
+            recipe_category: {
+                "two_portions": orders,
+                "four_portions": orders,
+            }
+            for recipe_category in ["two_recipes", "three_recipes"]
+        }
+        for box_type in graph
+    }
+    recipes = {
+        f"{box_type}_{i}": {"stock_count": stock, "box_type": box_type}
+        for box_type in graph
+        for i in range(recipes_per_box_type)
+    }
+    return orders, recipes
+
+
+def test_allocation_order_and_waits():
+    """Test that box_types wait for their dependencies and for box_types sharing their stock"""
+    assert get_allocation_order(GRAPH) == [
+        "vegan",
+        "vegetarian",
+        "gourmet",
+        "fish",
+        "family",
+    ]
+    waits = get_waits(GRAPH)
+    assert waits["vegetarian"] == ["vegan"]
+    assert waits["gourmet"] == ["vegetarian"]
+    assert waits["fish"] == []
+    # Family shares the vegan stock with vegetarian, so has to wait for it
+    assert waits["family"] == ["vegan", "vegetarian", "fish"]
+    with pytest.raises(AssertionError):
+        validate_graph({"a": ["b"], "b": ["a"]})
+    with pytest.raises(AssertionError):
+        validate_graph({"a": ["c"]})
+
+
+def test_run_schedule_stops_after_failure():
+    """Test that no more box_types are started once one has failed"""
+    for workers in [1, 4]:
+        results = run_schedule(
+            {"a": [], "b": ["a"]},
+            lambda box_type: {"success": box_type != "a"},
+            workers=workers,
+        )
+        assert list(results) == ["a"]
+
+
+def test_default_graph_matches_chain(orders_json, recipes_json):
+    """Test that the default graph allocates vegetarian orders and then gourmet orders"""
+    allocator = RecipeAllocator(verbose=False)
+    assert allocator.run(
+        orders=orders_json, recipes=copy.deepcopy(recipes_json), engine="numpy"
+    )
+    veg_result = allocator.assign_orders(
+        box_type="vegetarian", engine="numpy", verbose=False
+    )
+    gourmet_result = allocator.assign_orders(
+        box_type="gourmet",
+        excess_stock=veg_result["excess_stock"],
+        engine="numpy",
+        verbose=False,
+    )
+    assert allocator.excess_stock.equals(gourmet_result["excess_stock"])
+
+
+def test_graph_with_workers():
+    """Test that independent box_types give the same result in a thread pool, and only
+    use the stock of the box_types they can depend on
+    """
+    orders, recipes = make_data(GRAPH)
+    results = list()
+    for workers in [1, 4]:
+        allocator = RecipeAllocator(
+            verbose=False,
+            box_type_graph=GRAPH,
+            workers=workers,
+            record_plan=True,
+        )
+        assert allocator.run(
+            orders=orders, recipes=copy.deepcopy(recipes), engine="bulk"
+        )
+        results.append(allocator.excess_stock)
+        for step in allocator.plan.steps():
+            for recipe_id in step["recipe_ids"]:
+                assert recipes[recipe_id]["box_type"] in (
+                    [step["box_type"]] + GRAPH[step["box_type"]]
+                )
+    assert results[0].equals(results[1])
+    assert sorted(results[0].index) == sorted(recipes)
+
+
+def test_graph_update_and_batch():
+    """Test that update and run_batch give the same result as run with any graph"""
+    orders, recipes = make_data(GRAPH)
+    allocator = RecipeAllocator(verbose=False, box_type_graph=GRAPH)
+    assert allocator.run(
+        orders=copy.deepcopy(orders),
+        recipes=copy.deepcopy(recipes),
+        engine="numpy",
+    )
+    assert allocator.update(
+        stock_deltas={"vegan_0": -5},
+        order_deltas={"fish": {"two_recipes": {"two_portions": 1}}},
+        verbose=False,
+    )
+    expected = RecipeAllocator(verbose=False, box_type_graph=GRAPH)
+    assert expected.run(
+        orders=allocator.orders, recipes=allocator.recipes, engine="numpy"
+    )
+    assert allocator.excess_stock.equals(expected.excess_stock)
+    batch = expected.run_batch(
+        [{"orders": allocator.orders, "recipes": allocator.recipes}]
+    )
+    assert bool(batch.loc[0, "success"])
+    for recipe_id, stock_count in expected.excess_stock["stock_count"].items():
+        assert batch.loc[0, recipe_id] == stock_count
+
+
+def test_graph_missing_box_type(orders_json, recipes_json):
+    """Test that every box_type in the graph must have orders"""
+    allocator = RecipeAllocator(verbose=False, box_type_graph=GRAPH)
+    with pytest.raises(AssertionError):
+        allocator.set_data(orders=orders_json, recipes=recipes_json)
@@ -0,0 +1,72 @@
+import copy
+
+import numpy as np
+
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.sensitivity import stock_sensitivity
+
+
+def make_short_orders(orders_json):
+    """Orders that need more vegetarian stock than tests/recipes.json holds"""
+    orders = copy.deepcopy(orders_json)
+    orders["vegetarian"]["two_recipes"]["two_portions"] = 4
+    orders["gourmet"]["three_recipes"]["two_portions"] = 3
+    return orders
+
+
+def runs_with_extra(orders, recipes, recipe_ids, extra_stock):
+    """Whether RecipeAllocator.run succeeds with extra_stock more of each recipe"""
+    recipes = copy.deepcopy(recipes)
+    for recipe_id in recipe_ids:
+        recipes[recipe_id]["stock_count"] += extra_stock
+    return RecipeAllocator(verbose=False).run(
+        orders=orders, recipes=recipes, engine="numpy"
+    )
+
+
+def test_stock_sensitivity_by_recipe(orders_json, recipes_json):
+    """Test that each recipe's extra stock is the least that lets run succeed, and recipes
+    that cannot help on their own are ranked last
+    """
+    orders = make_short_orders(orders_json)
+    allocator = RecipeAllocator(verbose=False)
+    assert not allocator.run(orders=orders, recipes=recipes_json)
+    df = stock_sensitivity(allocator)
+    assert df.index.tolist()[0] == "recipe_1"
+    for recipe_id, row in df.iterrows():
+        results = [
+            runs_with_extra(orders, recipes_json, [recipe_id], extra_stock)
+            for extra_stock in range(15)
+        ]
+        if np.isnan(row["extra_stock"]):
+            assert not any(results)
+        else:
+            assert results.index(True) == row["extra_stock"]
+            assert row["lower_bound"] <= row["extra_stock"]
+
+
+def test_stock_sensitivity_by_box_type(orders_json, recipes_json):
+    """Test that topping up every recipe of a box_type is ranked, and gourmet stock cannot
+    make up for missing vegetarian stock
+    """
+    orders = make_short_orders(orders_json)
+    allocator = RecipeAllocator(verbose=False)
+    allocator.set_data(orders=orders, recipes=recipes_json)
+    df = stock_sensitivity(allocator, by="box_type")
+    assert df.index.tolist() == ["vegetarian", "gourmet"]
+    assert np.isnan(df.loc["gourmet", "extra_stock"])
+    extra_stock = int(df.loc["vegetarian", "extra_stock"])
+    assert df.loc["vegetarian", "total_extra_stock"] == 2 * extra_stock
+    vegetarian = ["recipe_1", "recipe_2"]
+    assert runs_with_extra(orders, recipes_json, vegetarian, extra_stock)
+    assert not runs_with_extra(
+        orders, recipes_json, vegetarian, extra_stock - 1
+    )
+
+
+def test_stock_sensitivity_feasible(orders_json, recipes_json):
+    """Test that no extra stock is needed when the orders can already be allocated"""
+    allocator = RecipeAllocator(verbose=False)
+    allocator.set_data(orders=orders_json, recipes=recipes_json)
+    df = stock_sensitivity(allocator)
+    assert (df["extra_stock"] == 0).all()
@@ -0,0 +1,100 @@
+import asyncio
+import json
+
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.service import AllocationService
+
+
+async def request(port, method, path, body=None):
+    """Send a single request to the service and return the status and json payload"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    content = json.dumps(body).encode() if body is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n"
+        f"Content-Length: {len(content)}\r\n\r\n".encode() + content
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload)
+
+
+def run_with_service(test):
+    """Start a service on a free loopback port and run test(service, port) against it"""
+
+    async def main():
+        service = AllocationService(engine="bulk")
+        server = await service.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await test(service, port)
+        finally:
+            server.close()
+            await server.wait_closed()
+            service.close()
+
+    return asyncio.run(main())
+
+
+def test_service_feasibility_and_update(orders_json, recipes_json):
+    """Test that the service answers queries and applies updates like the allocator does"""
+
+    async def test(service, port):
+        status, result = await request(port, "GET", "/feasibility")
+        assert status == 409
+        status, result = await request(
+            port,
+            "POST",
+            "/load",
+            {
+                "orders_dir": "tests/orders.json",
+                "recipes_dir": "tests/recipes.json",
+            },
+        )
+        assert status == 200 and result == {"success": True, "version": 1}
+        status, result = await request(port, "GET", "/leftover")
+        allocator = RecipeAllocator(verbose=False)
+        allocator.run(orders=orders_json, recipes=recipes_json, engine="bulk")
+        assert result["excess_stock"] == dict(
+            allocator.excess_stock["stock_count"]
+        )
+        status, result = await request(
+            port,
+            "POST",
+            "/update",
+            {"stock_deltas": {"recipe_4": -5, "recipe_5": -10}},
+        )
+        assert status == 200 and result == {"success": False, "version": 2}
+        status, result = await request(port, "GET", "/feasibility")
+        assert result == {"success": False, "version": 2}
+        status, result = await request(
+            port, "POST", "/update", {"stock_deltas": {"recipe_5": -100}}
+        )
+        assert status == 400
+        status, result = await request(port, "GET", "/unknown")
+        assert status == 404
+
+    run_with_service(test)
+
+
+def test_service_coalesces_identical_requests(orders_json, recipes_json):
+    """Test that identical reads arriving together are only computed once"""
+
+    async def test(service, port):
+        await service.load({"orders": orders_json, "recipes": recipes_json})
+        calls = list()
+        get_leftover = service.get_leftover
+
+        def counted_get_leftover():
+            calls.append(1)
+            return get_leftover()
+
+        service.get_leftover = counted_get_leftover
+        results = await asyncio.gather(
+            *[request(port, "GET", "/leftover") for _ in range(20)]
+        )
+        assert all(result == results[0] for result in results)
+        assert len(calls) == 1
+
+    run_with_service(test)
@@ -0,0 +1,80 @@
+import json
+
+import numpy as np
+import pytest
+
+from gousto_test.generate_data import DataGenerator
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.snapshot import (
+    load_snapshot,
+    snapshot_to_recipes,
+    write_json_from_snapshot,
+    write_snapshot,
+    write_snapshot_from_json,
+)
+
+
+def test_snapshot_round_trip(tmp_path, orders_json, recipes_json):
+    """Test that json files written from a snapshot match the originals exactly"""
+    write_snapshot_from_json(
+        "tests/orders.json", "tests/recipes.json", tmp_path / "snapshot"
+    )
+    write_json_from_snapshot(
+        tmp_path / "snapshot",
+        tmp_path / "orders.json",
+        tmp_path / "recipes.json",
+    )
+    with open(tmp_path / "orders.json", "r") as f_in:
+        assert json.load(f_in) == orders_json
+    with open(tmp_path / "recipes.json", "r") as f_in:
+        recipes = json.load(f_in)
+    assert recipes == recipes_json
+    assert list(recipes) == list(recipes_json)
+
+
+def test_load_snapshot(tmp_path, orders_json):
+    """Test that snapshots are memory-mapped and grouped by box_type"""
+    columns = DataGenerator(seed=0).generate_recipes_bulk(n_recipes=1000)
+    recipes = {
+        recipe_id: {"stock_count": stock_count, "box_type": box_type}
+        for (recipe_id, stock_count, box_type) in zip(
+            columns["recipe_id"].tolist(),
+            columns["stock_count"].tolist(),
+            columns["box_type"].tolist(),
+        )
+    }
+    write_snapshot(tmp_path, orders=orders_json, recipes=recipes)
+    snapshot = load_snapshot(tmp_path)
+    assert isinstance(snapshot["stock"], np.memmap)
+    assert snapshot["categories"]["portion_categories"] == {
+        "two_portions": 2,
+        "four_portions": 4,
+    }
+    for box_type in ["vegetarian", "gourmet"]:
+        in_box = columns["box_type"] == box_type
+        arrays = snapshot["recipe_arrays"][box_type]
+        assert list(arrays["recipe_ids"]) == list(columns["recipe_id"][in_box])
+        assert np.array_equal(arrays["stock"], columns["stock_count"][in_box])
+    assert snapshot_to_recipes(load_snapshot(tmp_path, mmap=False)) == recipes
+
+
+@pytest.mark.parametrize("engine", ["numpy", "bulk"])
+def test_run_snapshot(tmp_path, engine):
+    """Test that running from a snapshot gives the same result as running from json"""
+    allocator = RecipeAllocator(verbose=False)
+    assert allocator.run(
+        orders_dir="tests/orders.json",
+        recipes_dir="tests/recipes.json",
+        engine=engine,
+    )
+    write_snapshot_from_json(
+        "tests/orders.json", "tests/recipes.json", tmp_path
+    )
+    from_snapshot = RecipeAllocator(verbose=False)
+    assert from_snapshot.run(snapshot_dir=tmp_path, engine=engine)
+    assert from_snapshot.recipe_categories_dict == {
+        "two_recipes": 2,
+        "three_recipes": 3,
+        "four_recipes": 4,
+    }
+    assert from_snapshot.excess_stock.equals(allocator.excess_stock)
@@ -0,0 +1,94 @@
+import json
+
+import numpy as np
+import pytest
+
+from gousto_test.generate_data import DataGenerator
+from gousto_test.order_allocation import RecipeAllocator
+from gousto_test.streaming import (
+    iter_recipes_json,
+    iter_recipes_jsonl,
+    load_recipe_arrays,
+)
+
+
+def test_iter_recipes_json(recipes_json):
+    """Test that streaming a recipes json file gives the same recipes as json.load"""
+    assert dict(iter_recipes_json("tests/recipes.json")) == recipes_json
+    # Chunks smaller than a single recipe still work
+    assert (
+        dict(iter_recipes_json("tests/recipes.json", chunk_size=3))
+        == recipes_json
+    )
+
+
+def test_iter_recipes_jsonl(tmp_path, recipes_json):
+    """Test that recipes can be streamed from a json lines file"""
+    file_path = tmp_path / "recipes.jsonl"
+    with open(file_path, "w") as f_out:
+        for recipe_id, recipe in recipes_json.items():
+            f_out.write(json.dumps({"recipe_id": recipe_id, **recipe}) + "\n")
+    assert dict(iter_recipes_jsonl(file_path)) == recipes_json
+    assert load_recipe_arrays(file_path).keys() == {"vegetarian", "gourmet"}
+
+
+def test_load_recipe_arrays(tmp_path):
+    """Test that the stock arrays match the generated recipes"""
+    file_path = tmp_path / "recipes.json"
+    columns = DataGenerator(seed=0).generate_recipes_bulk(n_recipes=1000)
+    DataGenerator.save_recipe_columns_json(columns, file_path)
+    recipe_arrays = load_recipe_arrays(file_path, chunk_size=256)
+    for box_type in ["vegetarian", "gourmet"]:
+        in_box = columns["box_type"] == box_type
+        assert recipe_arrays[box_type]["stock"].dtype == np.int64
+        assert list(recipe_arrays[box_type]["recipe_ids"]) == list(
+            columns["recipe_id"][in_box]
+        )
+        assert np.array_equal(
+            recipe_arrays[box_type]["stock"], columns["stock_count"][in_box]
+        )
+
+
+@pytest.mark.parametrize(
+    "recipe",
+    [
+        {"stock_count": -1, "box_type": "gourmet"},
+        {"stock_count": 1.5, "box_type": "gourmet"},
+        {"stock_count": 1},
+        "not a recipe",
+    ],
+)
+def test_load_recipe_arrays_invalid(tmp_path, recipe):
+    """Test that invalid recipes are rejected while streaming"""
+    file_path = tmp_path / "recipes.json"
+    with open(file_path, "w") as f_out:
+        json.dump(
+            {
+                "recipe_1": {"stock_count": 1, "box_type": "vegetarian"},
+                "recipe_2": recipe,
+            },
+            f_out,
+        )
+    with pytest.raises(ValueError):
+        load_recipe_arrays(file_path)
+
+
+@pytest.mark.parametrize("engine", ["numpy", "bulk"])
+def test_run_stream(engine):
+    """Test that streaming the recipes gives the same result as loading them with json"""
+    allocator = RecipeAllocator(verbose=False)
+    assert allocator.run(
+        orders_dir="tests/orders.json",
+        recipes_dir="tests/recipes.json",
+        engine=engine,
+    )
+    expected = allocator.excess_stock
+    streamed = RecipeAllocator(verbose=False)
+    assert streamed.run(
+        orders_dir="tests/orders.json",
+        recipes_dir="tests/recipes.json",
+        engine=engine,
+        stream=True,
+    )
+    assert streamed.recipes is None
+    assert streamed.excess_stock.equals(expected)